@@ -1,72 +1,40 @@
-import os
+import io
+import sys
+import time
 from pathlib import Path
 import streamlit as st
 import pandas as pd
-from google.cloud import vision
-from google.oauth2 import service_account
 from PIL import Image
-import imagehash
-
-
-# OCR com Google Vision
-def extract_text(client, image_path: str) -> str:
-    """Extrai texto de uma imagem usando a API do Google Vision."""
-    with open(image_path, "rb") as f:
-        content = f.read()
-    image = vision.Image(content=content)
-    response = client.text_detection(image=image)
-    texts = response.text_annotations
-    return texts[0].description if texts else ""
-
-
-# Extração de rosto usando Google Vision
-def extract_face_and_save(client, image_path: str, output_file: str):
-    """Extrai o rosto de uma imagem e salva em arquivo."""
-    with open(image_path, "rb") as f:
-        content = f.read()
-    image = vision.Image(content=content)
-    response = client.face_detection(image=image)
-    faces = response.face_annotations
-    if not faces:
-        return None
-    face = faces[0]
-    x_min = min(v.x for v in face.bounding_poly.vertices)
-    y_min = min(v.y for v in face.bounding_poly.vertices)
-    x_max = max(v.x for v in face.bounding_poly.vertices)
-    y_max = max(v.y for v in face.bounding_poly.vertices)
-
-    with Image.open(image_path) as pil_img:
-        face_crop = pil_img.crop((x_min, y_min, x_max, y_max))
-        face_crop.save(output_file)
-        return output_file
-
-
-# Comparação facial via ImageHash (wavelet hash)
-def compare_faces(img1_path: str, img2_path: str, threshold: float = 0.7):
-    """Compara duas imagens faciais usando wavelet hash."""
-    try:
-        img1 = Image.open(img1_path).convert("L").resize((256, 256))
-        img2 = Image.open(img2_path).convert("L").resize((256, 256))
-        hash1 = imagehash.whash(img1)
-        hash2 = imagehash.whash(img2)
-        diff = hash1 - hash2
-        similarity = 1 - (diff / len(hash1.hash) ** 2)
-        match = similarity >= threshold
-        return match, similarity
-    except Exception as e:
-        print(f"Erro na comparação: {e}")
-        return False, 0.0
-
-
-# Configuração Google Vision
+
+# Importa funções do utils.py (raiz do projeto)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+import telemetry
+from documents import first_page, is_pdf
+from job_queue import DEFAULT_DB, DONE, FAILED, PENDING, JobQueue
+from quality_gate import QualityGateError, prescreen
+
+
+# Decodificação única de cada upload (mantido em memória)
+def decode_image(content: bytes) -> Image.Image:
+    """Decodifica os bytes de um upload uma única vez."""
+    img = Image.open(io.BytesIO(content))
+    img.load()
+    return img
+
+
 ROOT_DIR = Path(__file__).resolve().parent.parent
-SERVICE_ACCOUNT_FILE = ROOT_DIR / "cred" / "dts-10-ds-32748754226a.json"
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = str(SERVICE_ACCOUNT_FILE)
 
-creds = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE
-)
-client = vision.ImageAnnotatorClient(credentials=creds)
+# fila de verificações processada por `python job_queue.py --workers N`
+# (mesmo banco padrão dos trabalhadores, ou $JOBS_DB)
+JOBS_DB = DEFAULT_DB
+POLL_SECONDS = 0.5
+
+
+@st.cache_resource
+def get_queue() -> JobQueue:
+    """Abre a fila de jobs uma única vez por processo."""
+    return JobQueue(JOBS_DB)
+
 
 # Interface Streamlit
 st.set_page_config(page_title="Validação de Documentos", layout="wide")
@@ -76,51 +44,76 @@ uploaded_doc = st.file_uploader(
     "Upload da CNH (imagem)", type=["jpg", "jpeg", "png"]
 )
 uploaded_comp = st.file_uploader(
-    "Upload do Comprovante de Endereço", type=["jpg", "jpeg", "png"]
+    "Upload do Comprovante de Endereço", type=["jpg", "jpeg", "png", "pdf"]
 )
 uploaded_selfie = st.file_uploader(
     "Upload da Selfie", type=["jpg", "jpeg", "png"]
 )
+archive = st.checkbox("Arquivar imagens enviadas em outputs/arquivo")
+
+queue = get_queue()
 
 if st.button("Processar") and uploaded_doc and uploaded_comp and uploaded_selfie:
-    out_dir = ROOT_DIR / "outputs"
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    doc_path = out_dir / "doc.jpg"
-    comp_path = out_dir / "comp.jpg"
-    selfie_path = out_dir / "selfie.jpg"
-
-    with open(doc_path, "wb") as f:
-        f.write(uploaded_doc.read())
-    with open(comp_path, "wb") as f:
-        f.write(uploaded_comp.read())
-    with open(selfie_path, "wb") as f:
-        f.write(uploaded_selfie.read())
-
-    # OCR
-    st.info("Executando OCR...")
-    doc_text = extract_text(client, str(doc_path))
-    comp_text = extract_text(client, str(comp_path))
-
-    # Rosto
-    st.info("Extraindo rosto da CNH...")
-    face_from_doc = extract_face_and_save(
-        client, str(doc_path), str(out_dir / "face_doc.jpg")
-    )
-
-    # Comparação
-    st.info("Comparando selfie com CNH...")
-    match, score = compare_faces(
-        str(selfie_path), str(face_from_doc), threshold=0.7
-    )
-
-    resultado = {
-        "face_match": bool(match),
-        "similaridade": float(round(score, 3)),
-        "documento_extraido": str(doc_text),
-        "comprovante_extraido": str(comp_text),
-        "nome_valido": bool("LUIZ ANTONIO DE OLIVEIRA" in comp_text),
-    }
+    # triagem local: fotos ruins voltam na hora, sem ir para a fila
+    comp_bytes = uploaded_comp.getvalue()
+    try:
+        uploads = (
+            prescreen(uploaded_doc.getvalue(), "documento"),
+            comp_bytes if is_pdf(comp_bytes)
+            else prescreen(comp_bytes, "comprovante"),
+            prescreen(uploaded_selfie.getvalue(), "selfie"),
+        )
+    except QualityGateError as e:
+        st.session_state.pop("job_id", None)
+        st.error(
+            f"{e.kind.capitalize()} reprovado na triagem: "
+            + "; ".join(e.reasons) + ". Envie outra imagem."
+        )
+    else:
+        # uploads (já na orientação correta) enfileirados como BLOBs; o
+        # processamento roda nos trabalhadores. Reenvios dos mesmos arquivos
+        # devolvem o job já existente (pendente ou concluído)
+        st.session_state["uploads"] = uploads
+        st.session_state["job_id"] = queue.enqueue(*uploads, threshold=0.7)
+
+# o id fica na sessão: re-renderizações continuam acompanhando o mesmo job
+job_id = st.session_state.get("job_id")
+job = queue.get(job_id) if job_id else None
+
+if job is not None and job["status"] not in (DONE, FAILED):
+    if not queue.active_workers():
+        st.warning(
+            "Nenhum trabalhador ativo. Inicie com: "
+            "python job_queue.py --workers 2"
+        )
+    status = st.empty()
+    while job is not None and job["status"] not in (DONE, FAILED):
+        if job["status"] == PENDING:
+            status.info(f"Na fila ({job['posicao']} verificações à frente)...")
+        else:
+            status.info("Executando OCR e comparação facial...")
+        time.sleep(POLL_SECONDS)
+        job = queue.get(job_id)
+    status.empty()
+
+if job is not None and job["status"] == FAILED:
+    st.error(f"Falha no processamento: {job['erro']}")
+
+if (job is not None and job["status"] == DONE
+        and "uploads" in st.session_state):
+    # as mesmas imagens enviadas à fila (a caixa do rosto vale para elas)
+    doc_bytes, comp_bytes, selfie_bytes = st.session_state["uploads"]
+
+    resultado = dict(job["resultado"])
+    box = resultado.pop("face_box")
+    match, score = resultado["face_match"], resultado["similaridade"]
+
+    with telemetry.timed("app_decode"):
+        doc_img = decode_image(doc_bytes)
+        selfie_img = decode_image(selfie_bytes)
+
+    # Rosto (recortado da imagem já decodificada, na caixa vinda do job)
+    face_from_doc = doc_img.crop(tuple(box)) if box else None
 
     df = pd.DataFrame([resultado])
 
@@ -133,16 +126,30 @@ if st.button("Processar") and uploaded_doc and uploaded_comp and uploaded_selfie
     st.subheader("Imagens enviadas")
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.image(str(doc_path), caption="CNH", width=250)
+        st.image(doc_img, caption="CNH", width=250)
     with col2:
-        st.image(str(comp_path), caption="Comprovante", width=250)
+        # PDFs são exibidos pela primeira página
+        st.image(first_page(comp_bytes), caption="Comprovante", width=250)
     with col3:
-        st.image(str(selfie_path), caption="Selfie", width=250)
+        st.image(selfie_img, caption="Selfie", width=250)
 
     # Mostra rosto detectado
-    if face_from_doc:
+    if face_from_doc is not None:
         st.subheader("Rosto Detectado na CNH")
-        st.image(str(face_from_doc), caption="Rosto extraído", width=250)
+        st.image(face_from_doc, caption="Rosto extraído", width=250)
+
+    # Arquivamento opcional (pasta própria por job: re-renderizações não
+    # arquivam de novo)
+    archive_dir = ROOT_DIR / "outputs" / "arquivo" / job_id
+    if archive and not archive_dir.exists():
+        archive_dir.mkdir(parents=True)
+        (archive_dir / "doc.jpg").write_bytes(doc_bytes)
+        comp_name = "comp.pdf" if is_pdf(comp_bytes) else "comp.jpg"
+        (archive_dir / comp_name).write_bytes(comp_bytes)
+        (archive_dir / "selfie.jpg").write_bytes(selfie_bytes)
+        if face_from_doc is not None:
+            face_from_doc.convert("RGB").save(archive_dir / "face_doc.jpg")
+        st.info(f"Imagens arquivadas em {archive_dir}")
 
     # Resultado final - Face
     if match:
@@ -159,3 +166,8 @@ if st.button("Processar") and uploaded_doc and uploaded_comp and uploaded_selfie
         st.success("Nome da CNH e comprovante são iguais")
     else:
         st.error("Nome da CNH e comprovante são diferentes")
+
+# Métricas do processo (ative com PIPELINE_METRICS=1)
+if telemetry.REGISTRY.enabled:
+    with st.sidebar.expander("Métricas do pipeline"):
+        st.json(telemetry.snapshot())
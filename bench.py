@@ -0,0 +1,313 @@
+"""
+Benchmark por etapa do pipeline, sem rede.
+
+Usa as imagens de exemplo de input/, data/ e outputs/ e as respostas de
+bench/fixtures (ReplayVisionClient). As fixtures versionadas são
+sintéticas (texto de outputs/results_LUIZ.json, rostos do Haar com
+confiança 0.9): os números medem o código local, não o Vision. Cada
+etapa é medida separadamente (decodificação, serialização do upload,
+leitura da resposta, extração de campos, recorte, hash, comparação e o
+pipeline completo), com vazão e latências p50/p95/p99. O resultado é
+salvo em bench/results/<commit>.json para comparação entre commits.
+
+Exemplos:
+
+    python bench.py
+    python bench.py --repeat 50 --compare bench/results/<commit>.json
+
+Para gravar novas respostas reais (requer credenciais):
+
+    python bench.py --record --credentials cred/<chave>.json
+"""
+import argparse
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from face_hash import (
+    ensemble_similarity_matrix,
+    hash_ensemble,
+    hash_image,
+    similarity_matrix,
+)
+from fields import validate_documents
+from preprocess import remap_response
+from utils import (
+    FEATURES_DOCUMENTO,
+    FEATURES_TEXTO,
+    _build_request,
+    batch_annotate,
+    compare_faces,
+    extract_face,
+    face_box_from_response,
+    prepare_annotation,
+    text_from_response,
+)
+from vision_fake import ReplayVisionClient
+
+ROOT_DIR = Path(__file__).resolve().parent
+FIXTURES_DIR = ROOT_DIR / "bench" / "fixtures"
+RESULTS_DIR = ROOT_DIR / "bench" / "results"
+SAMPLE_DIRS = ("input", "data", "outputs")
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+# candidato de referência do pipeline completo (CNH, comprovante, selfie)
+E2E_APPLICANT = ("data/002.JPG", "data/003.jpg", "data/LUIZ.png")
+
+
+def sample_images():
+    """Lista as imagens de exemplo (caminhos relativos à raiz)."""
+    paths = []
+    for folder in SAMPLE_DIRS:
+        for path in sorted((ROOT_DIR / folder).iterdir()):
+            if path.suffix.lower() in IMAGE_SUFFIXES:
+                paths.append(path)
+    return paths
+
+
+def measure(func, items, repeat: int) -> dict:
+    """
+    Executa func(item) para cada item, `repeat` vezes, medindo cada chamada.
+
+    Returns:
+        dict | None: n, total_s, ops_por_s e latências p50/p95/p99/max em
+            ms, ou None se a etapa não tem amostras.
+    """
+    latencies = []
+    for _ in range(repeat):
+        for item in items:
+            start = time.perf_counter()
+            func(item)
+            latencies.append(time.perf_counter() - start)
+    if not latencies:
+        return None
+
+    latencies = np.array(latencies) * 1000.0
+    total_s = float(latencies.sum()) / 1000.0
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "n": int(len(latencies)),
+        "total_s": round(total_s, 4),
+        "ops_por_s": round(len(latencies) / total_s, 1) if total_s else None,
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "max_ms": round(float(latencies.max()), 4),
+    }
+
+
+def run_benchmarks(repeat: int = 20) -> dict:
+    """Executa todas as etapas e devolve as estatísticas por etapa."""
+    from google.cloud import vision
+
+    client = ReplayVisionClient(FIXTURES_DIR)
+    images = sample_images()
+    contents = [p.read_bytes() for p in images]
+    decoded = []
+    for content in contents:
+        img = Image.open(io.BytesIO(content))
+        img.load()
+        decoded.append(img)
+
+    # respostas gravadas e as imagens correspondentes (para o recorte),
+    # já nas coordenadas da imagem original
+    fixtures = []
+    for fixture in sorted(FIXTURES_DIR.glob("*.json")):
+        with open(fixture, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        response = remap_response(
+            vision.AnnotateImageResponse.from_json(
+                json.dumps(data["resposta"]), ignore_unknown_fields=True
+            ),
+            *data.get("escala", (1.0, 1.0)),
+        )
+        fixtures.append(
+            (ROOT_DIR / data["arquivo"] if data.get("arquivo") else None,
+             vision.AnnotateImageResponse.serialize(response))
+        )
+
+    def decode(content):
+        Image.open(io.BytesIO(content)).load()
+
+    def serialize_upload(content):
+        vision.BatchAnnotateImagesRequest.serialize(
+            vision.BatchAnnotateImagesRequest(
+                requests=[_build_request(content, FEATURES_DOCUMENTO)]
+            )
+        )
+
+    def parse_response(raw):
+        response = vision.AnnotateImageResponse.deserialize(raw)
+        text_from_response(response)
+        face_box_from_response(response)
+
+    texts = {}
+    for path, raw in fixtures:
+        if path is not None:
+            texts[path] = text_from_response(
+                vision.AnnotateImageResponse.deserialize(raw)
+            )
+    doc_text = texts.get(ROOT_DIR / E2E_APPLICANT[0], "")
+    comp_text = texts.get(ROOT_DIR / E2E_APPLICANT[1], "")
+
+    crops = []
+    for path, raw in fixtures:
+        box = face_box_from_response(
+            vision.AnnotateImageResponse.deserialize(raw)
+        )
+        if path is not None and box is not None:
+            img = Image.open(path)
+            img.load()
+            crops.append((img, box))
+
+    hashes = np.array(
+        [hash_image(img) for img in decoded], dtype=np.uint64
+    )
+    ensembles = np.stack([hash_ensemble(img) for img in decoded])
+
+    doc, comp, selfie = (str(ROOT_DIR / p) for p in E2E_APPLICANT)
+
+    def end_to_end(_):
+        responses = [r for _, r in batch_annotate(
+            client, [(doc, FEATURES_DOCUMENTO), (comp, FEATURES_TEXTO)]
+        )]
+        face = extract_face(client, doc, responses[0])
+        compare_faces(selfie, face)
+        validate_documents(
+            text_from_response(responses[0]), text_from_response(responses[1])
+        )
+
+    stages = {
+        "decode": (decode, contents),
+        "upload_serialization": (serialize_upload, contents),
+        "response_parsing": (parse_response, [raw for _, raw in fixtures]),
+        "fields": (
+            lambda _: validate_documents(doc_text, comp_text), [None]
+        ),
+        "crop": (lambda item: item[0].crop(item[1]).load(), crops),
+        "hash": (hash_image, decoded),
+        "hash_ensemble": (hash_ensemble, contents),
+        "compare": (lambda _: similarity_matrix(hashes, hashes), [None]),
+        "compare_ensemble": (
+            lambda _: ensemble_similarity_matrix(ensembles, ensembles), [None]
+        ),
+        "end_to_end": (end_to_end, [None]),
+    }
+
+    results = {}
+    for name, (func, items) in stages.items():
+        print(f"  {name}...", flush=True)
+        stats = measure(func, items, repeat)
+        if stats is None:
+            print(f"  {name}: sem amostras (fixtures sem \"arquivo\"?), "
+                  "ignorada")
+            continue
+        results[name] = stats
+
+    results["upload_serialization"]["bytes_medio"] = int(
+        np.mean([len(c) for c in contents])
+    )
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT_DIR),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "sem-git"
+
+
+def print_report(results: dict, baseline: dict = None):
+    header = f"{'etapa':22} {'ops/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}"
+    if baseline:
+        header += f" {'p50 vs base':>12}"
+    print(header)
+    for name, stats in results.items():
+        line = (f"{name:22} {stats['ops_por_s'] or 0:>10.1f} "
+                f"{stats['p50_ms']:>10.3f} {stats['p95_ms']:>10.3f} "
+                f"{stats['p99_ms']:>10.3f}")
+        base = (baseline or {}).get(name)
+        if base and base.get("p50_ms"):
+            line += f" {stats['p50_ms'] / base['p50_ms']:>11.2f}x"
+        print(line)
+
+
+def record(credentials):
+    """Grava respostas reais do Vision para as imagens de exemplo."""
+    from cli import build_client
+    from vision_fake import RecordingVisionClient
+
+    client = RecordingVisionClient(build_client(credentials), FIXTURES_DIR)
+    images = sample_images()
+    for path in images:
+        # a chave é o sha256 dos bytes que batch_annotate envia (já
+        # reduzidos), a mesma usada pelo ReplayVisionClient
+        _, request, _, _, scale = prepare_annotation(
+            str(path), FEATURES_DOCUMENTO
+        )
+        client.describe(
+            request.image.content,
+            arquivo=path.relative_to(ROOT_DIR).as_posix(),
+            escala=list(scale),
+        )
+    for path, _ in batch_annotate(client, [str(p) for p in images]):
+        print(f"gravado: {path}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark por etapa do pipeline (sem rede)."
+    )
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="repetições de cada etapa")
+    parser.add_argument("--output", help="arquivo JSON de saída "
+                        "(padrão: bench/results/<commit>.json)")
+    parser.add_argument("--compare", help="resultado anterior para comparar")
+    parser.add_argument("--record", action="store_true",
+                        help="grava respostas reais em bench/fixtures")
+    parser.add_argument("--credentials",
+                        help="JSON da conta de serviço (com --record)")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        record(args.credentials)
+        return 0
+
+    print("Executando benchmarks...")
+    results = run_benchmarks(args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["etapas"]
+    print()
+    print_report(results, baseline)
+
+    commit = git_commit()
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit,
+            "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "repeticoes": args.repeat,
+            "etapas": results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados salvos em {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Registro de candidatos já processados, para execuções em lote
+incrementais e retomáveis.
+
+A chave de cada candidato é o SHA-256 do conteúdo da CNH, do comprovante
+e da selfie somado à configuração do pipeline (limiar, hashes e pesos,
+backend). Uma nova execução do mesmo manifesto, depois de uma queda ou
+com candidatos novos, só processa o que mudou; os demais resultados vêm
+do registro. Resultados com erro não são registrados e são refeitos.
+
+O hash de cada arquivo também fica guardado, junto com tamanho e mtime,
+então arquivos que não mudaram nem são relidos.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import telemetry
+
+CHECKPOINTS = "validacao_checkpoint_total"
+
+# versão do formato dos resultados; mudanças no pipeline que alteram os
+# resultados devem incrementá-la para invalidar o registro
+PIPELINE_VERSION = 1
+
+
+def pipeline_config(threshold: float, backend: str = "vision",
+                    detector: str = "vision", preprocess: bool = True,
+                    gate: bool = True) -> dict:
+    """
+    Configuração que entra na chave do registro.
+
+    Args:
+        threshold (float): Similaridade mínima aceita.
+        backend (str): Cliente do OCR (ex.: "vision" ou "fake").
+        detector (str): Detector de rosto da CNH.
+        preprocess (bool): Redução das imagens antes do envio.
+        gate (bool): Triagem local das imagens (ver quality_gate).
+
+    Returns:
+        dict: Configuração serializável em JSON.
+    """
+    from face_hash import DEFAULT_WEIGHTS, ENSEMBLE_METHODS, SCORING_METHOD
+
+    ensemble = SCORING_METHOD == "ensemble"
+    return {
+        "versao": PIPELINE_VERSION,
+        "threshold": threshold,
+        "hash": list(ENSEMBLE_METHODS) if ensemble else SCORING_METHOD,
+        "pesos": [float(w) for w in DEFAULT_WEIGHTS] if ensemble else None,
+        "backend": backend,
+        "detector": detector,
+        "preprocess": preprocess,
+        "triagem": gate,
+    }
+
+
+class CheckpointLedger:
+    """
+    Registro (SQLite) de resultados por conteúdo + configuração.
+
+    Exemplo:
+        ledger = CheckpointLedger(".cache/checkpoints.sqlite",
+                                  pipeline_config(0.7))
+        key = ledger.key(applicant)
+        result = ledger.get(key)
+    """
+
+    def __init__(self, path=".cache/checkpoints.sqlite", config: dict = None):
+        """
+        Args:
+            path: Caminho do arquivo SQLite do registro.
+            config (dict): Configuração do pipeline (ver pipeline_config).
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.config_hash = hashlib.sha256(
+            json.dumps(config or {}, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " chave TEXT PRIMARY KEY,"
+            " resultado TEXT NOT NULL,"
+            " criado_em REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS arquivos ("
+            " caminho TEXT PRIMARY KEY,"
+            " carimbo INTEGER NOT NULL,"
+            " sha256 TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def file_hash(self, path) -> str:
+        """SHA-256 do arquivo (relido só se tamanho ou mtime mudaram)."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        stamp = stat.st_mtime_ns ^ (stat.st_size << 1)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT carimbo, sha256 FROM arquivos WHERE caminho = ?",
+                (path,),
+            ).fetchone()
+        if row is not None and row[0] == stamp:
+            return row[1]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        value = digest.hexdigest()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO arquivos (caminho, carimbo, sha256)"
+                " VALUES (?, ?, ?)",
+                (path, stamp, value),
+            )
+            self._conn.commit()
+        return value
+
+    def key(self, applicant: dict) -> str:
+        """
+        Chave do candidato: conteúdo dos três arquivos + configuração.
+
+        Args:
+            applicant (dict): Candidato lido por cli.read_manifest.
+
+        Returns:
+            str: SHA-256 em hexadecimal.
+        """
+        parts = [
+            self.file_hash(applicant[field])
+            for field in ("documento", "comprovante", "selfie")
+        ]
+        parts.append(self.config_hash)
+        return hashlib.sha256(":".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """
+        Resultado registrado para a chave.
+
+        Returns:
+            dict | None: Resultado (sem id e label) ou None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT resultado FROM checkpoints WHERE chave = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        telemetry.inc(
+            CHECKPOINTS, resultado="reaproveitado" if row else "novo"
+        )
+        return None if row is None else json.loads(row[0])
+
+    def put_many(self, items):
+        """
+        Registra resultados numa única transação.
+
+        Args:
+            items: Pares (chave, resultado); resultados com "erro" são
+                ignorados, e id e label não são guardados.
+        """
+        rows = []
+        now = time.time()
+        for key, result in items:
+            if result.get("erro"):
+                continue
+            stored = {
+                k: v for k, v in result.items() if k not in ("id", "label")
+            }
+            rows.append((key, json.dumps(stored, ensure_ascii=False), now))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO checkpoints (chave, resultado,"
+                " criado_em) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM checkpoints"
+            ).fetchone()
+        return count
+
+    def close(self):
+        """Fecha a conexão com o banco do registro."""
+        self._conn.close()
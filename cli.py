@@ -0,0 +1,582 @@
+"""
+Processamento em lote a partir de um manifesto (CSV ou JSONL).
+
+Cada linha do manifesto descreve um candidato:
+
+    id,documento,comprovante,selfie,label
+
+(`label` é opcional: 1 = deve ser aceito, 0 = deve ser rejeitado). Os
+resultados são gravados linha a linha num arquivo JSONL ou CSV, ou
+acrescentados ao histórico SQLite (saída .sqlite), então a memória usada
+não depende do tamanho do manifesto.
+
+Exemplo:
+
+    validar-lote manifesto.csv -o outputs/resultados.jsonl
+"""
+import argparse
+import collections
+import csv
+import json
+import os
+import sys
+from itertools import islice
+from pathlib import Path
+
+from documents import extract_document_text, is_pdf
+from fields import extract_cnh_fields, validate_documents
+from quality_gate import QualityGateError, prescreen
+from utils import (
+    FEATURES_DOCUMENTO,
+    FEATURES_TEXTO,
+    MAX_BATCH_IMAGES,
+    batch_annotate,
+    compare_faces,
+    extract_face,
+    load_image,
+    text_from_response,
+)
+
+MANIFEST_FIELDS = ("id", "documento", "comprovante", "selfie", "label")
+RESULT_FIELDS = (
+    "id",
+    "label",
+    "face_match",
+    "similaridade",
+    "threshold_utilizado",
+    "documento_extraido",
+    "comprovante_extraido",
+    "documento_nome",
+    "documento_cpf",
+    "cpf_valido",
+    "documento_nascimento",
+    "documento_validade",
+    "comprovante_nome",
+    "comprovante_endereco",
+    "comprovante_cep",
+    "nome_valido",
+    "erro",
+)
+
+# buffer de escrita dos resultados (evita um flush por linha)
+WRITE_BUFFER = 1024 * 1024
+
+
+def _parse_label(value):
+    """Converte o label do manifesto (vazio, 0 ou 1; aceita "1.0")."""
+    if value in ("", None):
+        return None
+    try:
+        label = float(value)
+    except (TypeError, ValueError):
+        label = None
+    if label not in (0.0, 1.0):
+        raise ValueError(f"label inválido: {value!r} (use 0, 1 ou vazio)")
+    return int(label)
+
+
+def _json_rows(f):
+    """Linhas do JSONL; linhas inválidas viram um dict com "_erro"."""
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield {"_erro": f"JSON inválido: {e}"}
+            continue
+        yield row if isinstance(row, dict) else {
+            "_erro": "linha do JSONL não é um objeto"
+        }
+
+
+def read_manifest(path):
+    """
+    Lê o manifesto linha a linha (CSV ou JSONL, pela extensão).
+
+    Linhas inválidas (campo obrigatório ausente, label malformado, JSON
+    inválido) não interrompem a leitura: o candidato sai com "erro" e vira
+    uma linha de erro no resultado.
+
+    Args:
+        path: Caminho do manifesto.
+
+    Yields:
+        dict: Candidato com as chaves de MANIFEST_FIELDS (label pode ser
+            None), ou com id, label e "erro" se a linha for inválida.
+    """
+    path = Path(path)
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if path.suffix.lower() in (".jsonl", ".ndjson", ".json"):
+            rows = _json_rows(f)
+        else:
+            rows = csv.DictReader(f)
+
+        base_dir = path.parent
+        for number, row in enumerate(rows, start=1):
+            applicant = {"id": str(row.get("id") or number), "label": None}
+            try:
+                if "_erro" in row:
+                    raise ValueError(row["_erro"])
+                applicant["label"] = _parse_label(row.get("label"))
+                for field in ("documento", "comprovante", "selfie"):
+                    if not row.get(field):
+                        raise ValueError(f"campo obrigatório ausente: {field}")
+                    applicant[field] = str(base_dir / row[field])
+            except ValueError as e:
+                applicant = {
+                    "id": applicant["id"],
+                    "label": applicant["label"],
+                    "erro": f"{path}:{number}: {e}",
+                }
+            yield applicant
+
+
+class ResultWriter:
+    """
+    Grava resultados em JSONL, CSV ou no histórico SQLite (.sqlite/.db, ver
+    results_store), pela extensão, com buffer.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._store = None
+        if self.path.suffix.lower() in (".sqlite", ".db"):
+            from results_store import ResultsStore
+
+            # histórico só de inserção: execuções anteriores são mantidas
+            self._store = ResultsStore(self.path)
+            return
+        self._file = open(
+            self.path, "w", encoding="utf-8", newline="",
+            buffering=WRITE_BUFFER,
+        )
+        self._csv = None
+        if self.path.suffix.lower() == ".csv":
+            self._csv = csv.DictWriter(
+                self._file, fieldnames=RESULT_FIELDS, extrasaction="ignore"
+            )
+            self._csv.writeheader()
+
+    def write(self, result: dict):
+        if self._store is not None:
+            self._store.append(result, source="cli")
+        elif self._csv is not None:
+            self._csv.writerow(result)
+        else:
+            self._file.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+        else:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _chunks(iterable, size: int):
+    """Agrupa um iterável em listas de até `size` itens."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _ordered_map(func, items, workers: int):
+    """
+    Aplica func em paralelo (threads) devolvendo na ordem de entrada.
+
+    No máximo 2 * workers itens ficam em andamento, então a entrada é
+    consumida aos poucos.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(workers) as executor:
+        running = collections.deque()
+        for item in items:
+            running.append(executor.submit(func, item))
+            if len(running) >= 2 * workers:
+                yield running.popleft().result()
+        while running:
+            yield running.popleft().result()
+
+
+def process_group(client, applicants, faces_dir, threshold: float,
+                  cache=None, preprocess: bool = True, detector=None,
+                  pool=None, gate: bool = True):
+    """
+    Processa um grupo de candidatos com uma única chamada ao Vision.
+
+    Args:
+        client: Cliente autenticado do Google Vision.
+        applicants (list): Candidatos lidos por read_manifest.
+        faces_dir: Pasta onde os rostos recortados das CNHs são salvos
+            (opcional; None não grava nada em disco).
+        threshold (float): Similaridade mínima aceita.
+        cache: VisionCache opcional.
+        preprocess (bool): Reduz as imagens antes do envio ao Vision.
+        detector: Detector local de rosto (ver face_detect). Com ele a CNH
+            vai ao Vision só para OCR, e o FACE_DETECTION do Vision é usado
+            apenas como fallback.
+        pool: Pool de processos para o detector (ver face_detect.make_pool).
+        gate (bool): Triagem local das imagens (ver quality_gate) antes do
+            Vision; imagens reprovadas viram erro do candidato e não
+            entram no lote.
+
+    Yields:
+        dict: Resultado de cada candidato, na ordem de entrada.
+    """
+    # arquivos ausentes viram erro do próprio candidato, sem derrubar o grupo
+    missing = {}
+    for n, applicant in enumerate(applicants):
+        if applicant.get("erro"):
+            # linha inválida do manifesto (ver read_manifest)
+            missing[n] = applicant["erro"]
+            continue
+        for field in ("documento", "comprovante", "selfie"):
+            if not os.path.isfile(applicant[field]):
+                missing[n] = f"arquivo não encontrado: {applicant[field]}"
+                break
+
+    # triagem local: imagens ruins não gastam chamadas ao Vision e as
+    # giradas (EXIF) seguem já corrigidas, em memória
+    if gate:
+        applicants = list(applicants)
+        for n, applicant in enumerate(applicants):
+            if n in missing:
+                continue
+            screened = dict(applicant)
+            try:
+                for field in ("documento", "comprovante", "selfie"):
+                    if not is_pdf(applicant[field]):
+                        screened[field] = prescreen(applicant[field], field)
+            except QualityGateError as e:
+                missing[n] = str(e)
+            except Exception as e:
+                missing[n] = f"imagem inválida ({field}): {e}"
+            applicants[n] = screened
+    valid = [a for n, a in enumerate(applicants) if n not in missing]
+
+    # com detector local a CNH só precisa de OCR no Vision
+    doc_features = FEATURES_TEXTO if detector else FEATURES_DOCUMENTO
+    # comprovantes em PDF são lidos página a página depois (ver documents)
+    comp_pdf = [is_pdf(a["comprovante"]) for a in valid]
+    items, positions = [], []
+    for applicant, pdf in zip(valid, comp_pdf):
+        positions.append(len(items))
+        items.append((applicant["documento"], doc_features))
+        if not pdf:
+            items.append((applicant["comprovante"], FEATURES_TEXTO))
+
+    detections = [None] * len(valid)
+    if detector is not None:
+        from face_detect import detect_many
+
+        try:
+            detections = detect_many(
+                detector, [a["documento"] for a in valid], pool
+            )
+        except Exception as e:
+            print(f"Erro no detector local: {e}")
+
+    responses, batch_error = [], None
+    try:
+        responses = [r for _, r in batch_annotate(
+            client, items, cache=cache, preprocess=preprocess
+        )]
+    except Exception as e:
+        batch_error = str(e)
+
+    i = -1
+    for n, applicant in enumerate(applicants):
+        result = {"id": applicant["id"], "label": applicant["label"]}
+        error = missing.get(n, batch_error)
+        if error:
+            result["erro"] = error
+            yield result
+            continue
+
+        i += 1
+        try:
+            doc_response = responses[positions[i]]
+            # rosto em memória; a pasta de rostos é só um destino opcional
+            if detections[i] is not None:
+                face_from_doc = load_image(applicant["documento"]).crop(
+                    detections[i][0]
+                )
+            elif detector is not None:
+                # fallback: FACE_DETECTION do Vision só para esta CNH
+                face_from_doc = extract_face(
+                    client, applicant["documento"], cache=cache
+                )
+            else:
+                face_from_doc = extract_face(
+                    client, applicant["documento"], doc_response
+                )
+            if face_from_doc is not None and faces_dir:
+                face_from_doc.save(
+                    Path(faces_dir) / f"face_{applicant['id']}.jpg"
+                )
+            match, similarity = False, 0.0
+            if face_from_doc is not None:
+                match, similarity = compare_faces(
+                    applicant["selfie"], face_from_doc, threshold
+                )
+            doc_text = text_from_response(doc_response)
+            if comp_pdf[i]:
+                # só as páginas necessárias até achar nome e endereço
+                comp_text = extract_document_text(
+                    client, applicant["comprovante"],
+                    extract_cnh_fields(doc_text)["nome"], cache=cache,
+                )
+            else:
+                comp_text = text_from_response(responses[positions[i] + 1])
+            result.update({
+                "face_match": bool(match),
+                "similaridade": float(round(similarity, 3)),
+                "threshold_utilizado": threshold,
+                "documento_extraido": doc_text,
+                "comprovante_extraido": comp_text,
+                **validate_documents(doc_text, comp_text),
+            })
+        except Exception as e:
+            result["erro"] = str(e)
+        yield result
+
+
+def run_manifest(client, manifest, output, faces_dir=None,
+                 threshold: float = 0.7, cache=None,
+                 preprocess: bool = True, detector=None,
+                 detector_workers: int = 0, workers: int = 1,
+                 ledger=None, gate: bool = True) -> int:
+    """
+    Processa todo o manifesto gravando os resultados em streaming.
+
+    Args:
+        client: Cliente autenticado do Google Vision.
+        manifest: Caminho do manifesto (CSV ou JSONL).
+        output: Caminho do arquivo de resultados (.jsonl, .csv ou .sqlite).
+        faces_dir: Pasta onde os rostos recortados das CNHs são salvos
+            (opcional; None não grava nada em disco).
+        threshold (float): Similaridade mínima aceita.
+        cache: VisionCache opcional.
+        preprocess (bool): Reduz as imagens antes do envio ao Vision.
+        detector: Detector local de rosto (opcional; ver process_group).
+        detector_workers (int): Processos para o detector (0 = no próprio
+            processo).
+        workers (int): Grupos processados em paralelo (threads). Use com
+            um ScheduledVisionClient para respeitar a cota do projeto.
+        ledger: CheckpointLedger opcional. Candidatos cujo conteúdo e
+            configuração já estão registrados não são reprocessados; o
+            resultado registrado vai para a saída junto com os novos (os
+            rostos desses candidatos não são gravados de novo).
+        gate (bool): Triagem local das imagens antes do Vision.
+
+    Returns:
+        int: Número de candidatos processados.
+    """
+    if faces_dir:
+        Path(faces_dir).mkdir(parents=True, exist_ok=True)
+    # dois itens (CNH e comprovante) por candidato em cada requisição
+    group_size = MAX_BATCH_IMAGES // 2
+
+    pool = None
+    if detector is not None and detector_workers > 0:
+        from face_detect import make_pool
+
+        pool = make_pool(detector, detector_workers)
+
+    def run_group(group):
+        if ledger is None:
+            return list(process_group(
+                client, group, faces_dir, threshold, cache, preprocess,
+                detector, pool, gate,
+            ))
+
+        # só candidatos novos ou alterados vão para o pipeline
+        results, keys, pending = [None] * len(group), [None] * len(group), []
+        for n, applicant in enumerate(group):
+            if applicant.get("erro"):
+                # linha inválida do manifesto: process_group registra o erro
+                pending.append(n)
+                continue
+            try:
+                keys[n] = ledger.key(applicant)
+            except OSError:
+                # arquivo ausente: process_group registra o erro
+                pending.append(n)
+                continue
+            stored = ledger.get(keys[n])
+            if stored is None:
+                pending.append(n)
+            else:
+                results[n] = {
+                    "id": applicant["id"], "label": applicant["label"],
+                    **stored,
+                }
+
+        if pending:
+            processed = process_group(
+                client, [group[n] for n in pending], faces_dir, threshold,
+                cache, preprocess, detector, pool, gate,
+            )
+            for n, result in zip(pending, processed):
+                results[n] = result
+            ledger.put_many(
+                (keys[n], results[n]) for n in pending if keys[n] is not None
+            )
+        return results
+
+    groups = _chunks(read_manifest(manifest), group_size)
+    if workers > 1:
+        results = _ordered_map(run_group, groups, workers)
+    else:
+        results = map(run_group, groups)
+
+    total = 0
+    try:
+        with ResultWriter(output) as writer:
+            for group_results in results:
+                for result in group_results:
+                    writer.write(result)
+                    total += 1
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return total
+
+
+def build_client(credentials=None):
+    """Cria o cliente do Vision (credenciais do arquivo ou do ambiente)."""
+    from google.cloud import vision
+
+    if credentials:
+        from google.oauth2 import service_account
+
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = str(credentials)
+        creds = service_account.Credentials.from_service_account_file(
+            str(credentials)
+        )
+        return vision.ImageAnnotatorClient(credentials=creds)
+    return vision.ImageAnnotatorClient()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Validação biométrica em lote a partir de um manifesto."
+    )
+    parser.add_argument("manifest", help="manifesto CSV ou JSONL")
+    parser.add_argument("-o", "--output", default="outputs/resultados.jsonl",
+                        help="arquivo de saída (.jsonl, .csv ou .sqlite "
+                        "para o histórico de resultados)")
+    parser.add_argument("--faces-dir",
+                        help="grava os rostos recortados das CNHs nesta "
+                        "pasta (padrão: não grava)")
+    parser.add_argument("--threshold", type=float, default=0.7,
+                        help="similaridade mínima aceita")
+    parser.add_argument("--credentials",
+                        help="JSON da conta de serviço do Google")
+    parser.add_argument("--cache", default=".cache/vision.sqlite",
+                        help="cache das respostas do Vision ('' desativa)")
+    parser.add_argument("--no-preprocess", action="store_true",
+                        help="envia as imagens originais, sem reduzir")
+    parser.add_argument("--detector", choices=("vision", "haar"),
+                        default="vision",
+                        help="detector de rosto da CNH (haar = OpenCV local, "
+                        "com o Vision como fallback)")
+    parser.add_argument("--detector-workers", type=int, default=0,
+                        help="processos para o detector local")
+    parser.add_argument("--rate", type=float, default=30.0,
+                        help="imagens por segundo da cota do Vision")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="grupos de candidatos processados em paralelo")
+    parser.add_argument("--max-retries", type=int, default=5,
+                        help="novas tentativas em erros transitórios")
+    parser.add_argument("--no-gate", action="store_true",
+                        help="desativa a triagem local (resolução, nitidez, "
+                        "exposição e orientação) antes do Vision")
+    parser.add_argument("--checkpoint", default=".cache/checkpoints.sqlite",
+                        help="registro de candidatos já processados, para "
+                        "retomar e processar só o que mudou ('' desativa)")
+    parser.add_argument("--metrics",
+                        help="grava métricas por etapa ao final "
+                        "(.json ou formato texto do Prometheus)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="usa um cliente falso local (sem rede)")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        import telemetry
+
+        telemetry.enable()
+
+    if args.dry_run:
+        from vision_fake import FakeVisionClient
+
+        client = FakeVisionClient()
+    else:
+        client = build_client(args.credentials)
+
+    # taxa da cota, novas tentativas com backoff e concorrência adaptativa
+    from vision_scheduler import AdaptiveLimiter, ScheduledVisionClient
+
+    client = ScheduledVisionClient(
+        client, rate=args.rate, max_retries=args.max_retries,
+        limiter=AdaptiveLimiter(maximum=max(1, args.workers)),
+    )
+
+    cache = None
+    if args.cache and not args.dry_run:
+        from vision_cache import VisionCache
+
+        cache = VisionCache(args.cache)
+
+    detector = None
+    if args.detector != "vision":
+        from face_detect import DETECTORS
+
+        detector = DETECTORS[args.detector]()
+
+    ledger = None
+    if args.checkpoint:
+        from checkpoint import CheckpointLedger, pipeline_config
+
+        ledger = CheckpointLedger(args.checkpoint, pipeline_config(
+            args.threshold,
+            backend="fake" if args.dry_run else "vision",
+            detector=args.detector,
+            preprocess=not args.no_preprocess,
+            gate=not args.no_gate,
+        ))
+
+    total = run_manifest(
+        client, args.manifest, args.output, args.faces_dir,
+        args.threshold, cache, not args.no_preprocess,
+        detector, args.detector_workers, args.workers, ledger,
+        not args.no_gate,
+    )
+    print(f"{total} candidatos processados. Resultados em {args.output}")
+    if ledger is not None:
+        print(f"{ledger.hits} reaproveitados do registro {args.checkpoint}")
+        ledger.close()
+
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            if args.metrics.endswith(".json"):
+                json.dump(telemetry.snapshot(), f, ensure_ascii=False, indent=2)
+            else:
+                f.write(telemetry.to_prometheus())
+        print(f"Métricas salvas em {args.metrics}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
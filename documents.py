@@ -0,0 +1,246 @@
+"""
+Ingestão de documentos em imagem ou PDF, página a página.
+
+PDFs (comuns em comprovantes de endereço) são abertos sem carregar o
+arquivo inteiro e rasterizados uma página por vez, na resolução pedida;
+só a página atual fica em memória, qualquer que seja o número de páginas.
+Páginas que já têm camada de texto (PDF digital) nem vão ao OCR.
+
+extract_document_text para assim que o texto lido basta, por padrão
+quando o nome e o endereço do comprovante foram encontrados, então
+extratos longos não gastam chamadas ao Vision com páginas irrelevantes.
+
+O suporte a PDF é opcional (pip install .[pdf]): usa pypdfium2 ou, se não
+houver, PyMuPDF.
+"""
+from pathlib import Path
+
+from PIL import Image
+
+import telemetry
+from fields import extract_comprovante_fields
+from utils import extract_text, load_image
+
+PAGES = "validacao_paginas_total"
+
+# resolução padrão da rasterização (suficiente para o OCR de texto comum)
+DEFAULT_DPI = 200
+# maior lado da página rasterizada, em pixels (limita a memória por página)
+MAX_SIDE = 4096
+# caracteres mínimos para aceitar a camada de texto de uma página
+MIN_TEXT_LAYER_CHARS = 20
+
+
+def is_pdf(source) -> bool:
+    """
+    Indica se a fonte é um PDF (pelos primeiros bytes).
+
+    Args:
+        source: Caminho ou bytes do documento.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source[:5]) == b"%PDF-"
+    if isinstance(source, (str, Path)):
+        with open(source, "rb") as f:
+            return f.read(5) == b"%PDF-"
+    return False
+
+
+def _render_scale(width: float, height: float, dpi: int, max_side: int):
+    """Escala (pixels por ponto) para a resolução pedida, limitada."""
+    scale = dpi / 72.0
+    if max_side and max(width, height) * scale > max_side:
+        scale = max_side / max(width, height)
+    return scale
+
+
+class _PdfiumReader:
+    """Leitor de PDF com pypdfium2."""
+
+    def __init__(self, source):
+        import pypdfium2
+
+        if isinstance(source, (bytes, bytearray)):
+            source = bytes(source)
+        else:
+            source = str(source)
+        self._pdf = pypdfium2.PdfDocument(source)
+
+    def __len__(self):
+        return len(self._pdf)
+
+    def text(self, index: int) -> str:
+        page = self._pdf[index]
+        try:
+            textpage = page.get_textpage()
+            try:
+                return textpage.get_text_range().replace("\r\n", "\n")
+            finally:
+                textpage.close()
+        finally:
+            page.close()
+
+    def render(self, index: int, dpi: int, max_side: int) -> Image.Image:
+        page = self._pdf[index]
+        try:
+            width, height = page.get_size()
+            bitmap = page.render(
+                scale=_render_scale(width, height, dpi, max_side)
+            )
+            return bitmap.to_pil().convert("RGB")
+        finally:
+            page.close()
+
+    def close(self):
+        self._pdf.close()
+
+
+class _MuPdfReader:
+    """Leitor de PDF com PyMuPDF."""
+
+    def __init__(self, source):
+        try:
+            import pymupdf
+        except ImportError:  # versões antigas
+            import fitz as pymupdf
+
+        self._module = pymupdf
+        if isinstance(source, (bytes, bytearray)):
+            self._doc = pymupdf.open(stream=bytes(source), filetype="pdf")
+        else:
+            self._doc = pymupdf.open(str(source))
+
+    def __len__(self):
+        return self._doc.page_count
+
+    def text(self, index: int) -> str:
+        return self._doc.load_page(index).get_text()
+
+    def render(self, index: int, dpi: int, max_side: int) -> Image.Image:
+        page = self._doc.load_page(index)
+        scale = _render_scale(page.rect.width, page.rect.height, dpi, max_side)
+        pixmap = page.get_pixmap(
+            matrix=self._module.Matrix(scale, scale), alpha=False
+        )
+        return Image.frombytes(
+            "RGB", (pixmap.width, pixmap.height), pixmap.samples
+        )
+
+    def close(self):
+        self._doc.close()
+
+
+def open_pdf(source):
+    """
+    Abre um PDF com o primeiro backend disponível.
+
+    Args:
+        source: Caminho ou bytes do PDF.
+
+    Returns:
+        Leitor com len(), text(i), render(i, dpi, max_side) e close().
+    """
+    for reader in (_PdfiumReader, _MuPdfReader):
+        try:
+            return reader(source)
+        except ImportError:
+            continue
+    raise Exception(
+        "Suporte a PDF não instalado: pip install pypdfium2 (ou pymupdf)"
+    )
+
+
+def iter_pages(source, dpi: int = DEFAULT_DPI, max_pages: int = None,
+               max_side: int = MAX_SIDE):
+    """
+    Gera as páginas do documento como imagens, uma por vez.
+
+    Args:
+        source: Caminho ou bytes de uma imagem ou PDF.
+        dpi (int): Resolução da rasterização dos PDFs.
+        max_pages (int): Máximo de páginas (None = todas).
+        max_side (int): Maior lado da página rasterizada, em pixels.
+
+    Yields:
+        PIL.Image: Página renderizada (imagens comuns geram uma página).
+    """
+    if not is_pdf(source):
+        yield load_image(source)
+        return
+
+    reader = open_pdf(source)
+    try:
+        total = len(reader)
+        if max_pages is not None:
+            total = min(total, max_pages)
+        for index in range(total):
+            yield reader.render(index, dpi, max_side)
+    finally:
+        reader.close()
+
+
+def comprovante_complete(text: str, expected_name: str = None) -> bool:
+    """Critério de parada padrão: nome e endereço do comprovante achados."""
+    fields = extract_comprovante_fields(text, expected_name)
+    return bool(fields["nome"] and fields["endereco"])
+
+
+def extract_document_text(client, source, expected_name: str = None,
+                          dpi: int = DEFAULT_DPI, max_pages: int = None,
+                          cache=None, text_layer: bool = True,
+                          is_complete=comprovante_complete) -> str:
+    """
+    Extrai o texto de uma imagem ou PDF lendo só as páginas necessárias.
+
+    Cada página usa a camada de texto do PDF quando houver (sem chamada ao
+    Vision) ou é rasterizada e enviada ao OCR. A leitura para assim que
+    is_complete(texto_acumulado, expected_name) for verdadeiro.
+
+    Args:
+        client: Cliente autenticado do Google Vision.
+        source: Caminho ou bytes do documento (imagem ou PDF).
+        expected_name (str): Nome esperado (ex.: nome da CNH), repassado ao
+            critério de parada.
+        dpi (int): Resolução da rasterização.
+        max_pages (int): Máximo de páginas lidas (None = todas).
+        cache: VisionCache opcional.
+        text_layer (bool): Usa a camada de texto do PDF quando existir.
+        is_complete: Critério de parada (None lê todas as páginas).
+
+    Returns:
+        str: Texto das páginas lidas, separadas por quebra de linha.
+    """
+    if not is_pdf(source):
+        return extract_text(client, source, cache=cache)
+
+    texts = []
+    reader = open_pdf(source)
+    try:
+        total = len(reader)
+        if max_pages is not None:
+            total = min(total, max_pages)
+        for index in range(total):
+            text = reader.text(index) if text_layer else ""
+            if len(text.strip()) >= MIN_TEXT_LAYER_CHARS:
+                telemetry.inc(PAGES, origem="texto")
+            else:
+                # só a página atual fica em memória
+                page = reader.render(index, dpi, MAX_SIDE)
+                text = extract_text(client, page, cache=cache)
+                del page
+                telemetry.inc(PAGES, origem="ocr")
+            texts.append(text)
+
+            if is_complete is not None and is_complete(
+                "\n".join(texts), expected_name
+            ):
+                telemetry.inc(PAGES, total - index - 1, origem="ignorada")
+                break
+    finally:
+        reader.close()
+    return "\n".join(texts)
+
+
+def first_page(source, dpi: int = 72) -> Image.Image:
+    """Primeira página do documento (miniatura para exibição)."""
+    return next(iter_pages(source, dpi=dpi, max_pages=1))
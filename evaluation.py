@@ -0,0 +1,351 @@
+"""
+Calibração do limiar de similaridade facial sobre um conjunto de pares.
+
+Os hashes de cada imagem são calculados uma única vez (e guardados em
+cache no disco); as similaridades dos pares saem de XOR + popcount
+vetorizados. Todos os limiares são avaliados de uma vez ordenando os
+scores e acumulando acertos e erros, o que dá as curvas ROC/DET, o EER e
+o ponto de operação para uma taxa de falso aceite (FAR) alvo.
+
+Com --method ensemble o score é a combinação ponderada de pHash, dHash,
+wHash e colorhash (face_hash); --fit-weights calibra os pesos nos pares
+antes de calcular o limiar, e os valores impressos são os que devem ir
+para face_hash.DEFAULT_WEIGHTS junto com o limiar.
+
+O arquivo de pares (CSV ou JSONL) tem uma linha por par:
+
+    imagem_a,imagem_b,label
+
+(label 1 = mesma pessoa, 0 = pessoas diferentes). Exemplo:
+
+    python evaluation.py pares.csv --target-far 0.01 --curves outputs/roc.csv
+    python evaluation.py pares.csv --method ensemble --fit-weights
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from face_hash import (
+    DEFAULT_WEIGHTS,
+    HASH_BITS,
+    ensemble_distances,
+    fit_ensemble_weights,
+    hash_ensemble,
+    hash_image,
+    popcount64,
+)
+
+METHODS = ("phash", "whash", "ensemble")
+
+
+def read_pairs(path):
+    """
+    Lê os pares rotulados de um arquivo CSV ou JSONL.
+
+    Caminhos relativos são resolvidos a partir da pasta do arquivo.
+
+    Returns:
+        tuple: (imagens_a, imagens_b, labels) como listas.
+    """
+    path = Path(path)
+    base_dir = path.parent
+    images_a, images_b, labels = [], [], []
+
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.suffix.lower() in (".jsonl", ".json"):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for row in rows:
+            images_a.append(str(base_dir / row["imagem_a"]))
+            images_b.append(str(base_dir / row["imagem_b"]))
+            labels.append(int(row["label"]))
+
+    return images_a, images_b, labels
+
+
+class HashCache:
+    """
+    Hashes perceptuais por arquivo, persistidos num .npz.
+
+    Cada entrada guarda o tamanho e o mtime do arquivo; se o arquivo mudar,
+    o hash é recalculado. No ensemble cada arquivo tem um hash por método
+    de face_hash.ENSEMBLE_METHODS.
+    """
+
+    def __init__(self, path=None, method: str = "phash"):
+        self.path = Path(path) if path else None
+        self.method = method
+        self._entries = {}
+        self._dirty = False
+
+        if self.path is not None and self.path.exists():
+            data = np.load(self.path, allow_pickle=False)
+            if str(data["method"]) == method:
+                for image, stamp, value in zip(
+                    data["paths"], data["stamps"], data["hashes"]
+                ):
+                    self._entries[str(image)] = (
+                        int(stamp),
+                        tuple(int(v) for v in value) if value.ndim
+                        else int(value),
+                    )
+
+    @staticmethod
+    def _stamp(image) -> int:
+        stat = os.stat(image)
+        return stat.st_mtime_ns ^ (stat.st_size << 1)
+
+    def get(self, image):
+        """Hash da imagem (do cache, se o arquivo não mudou)."""
+        stamp = self._stamp(image)
+        entry = self._entries.get(image)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+        if self.method == "ensemble":
+            value = tuple(int(v) for v in hash_ensemble(image))
+        else:
+            value = hash_image(image, self.method)
+        self._entries[image] = (stamp, value)
+        self._dirty = True
+        return value
+
+    def save(self):
+        """Grava o cache (se houver hashes novos)."""
+        if self.path is None or not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        paths = list(self._entries)
+        np.savez(
+            self.path,
+            method=np.array(self.method),
+            paths=np.array(paths),
+            stamps=np.array([self._entries[p][0] for p in paths], np.int64),
+            hashes=np.array([self._entries[p][1] for p in paths], np.uint64),
+        )
+        self._dirty = False
+
+
+def pair_hashes(images_a, images_b, method: str = "phash", cache_path=None):
+    """
+    Hashes dos dois lados de cada par, calculados uma vez por imagem.
+
+    Args:
+        images_a: Caminhos da primeira imagem de cada par.
+        images_b: Caminhos da segunda imagem de cada par.
+        method (str): "phash", "whash" ou "ensemble".
+        cache_path: Arquivo .npz do cache de hashes (opcional).
+
+    Returns:
+        tuple: (hashes_a, hashes_b) uint64, (P,) ou, no ensemble, P x K.
+    """
+    cache = HashCache(cache_path, method)
+    unique = {}
+    for image in list(images_a) + list(images_b):
+        if image not in unique:
+            unique[image] = len(unique)
+
+    hashes = np.array([cache.get(image) for image in unique], dtype=np.uint64)
+    cache.save()
+
+    index_a = np.fromiter((unique[i] for i in images_a), dtype=np.intp)
+    index_b = np.fromiter((unique[i] for i in images_b), dtype=np.intp)
+    return hashes[index_a], hashes[index_b]
+
+
+def pair_scores(images_a, images_b, method: str = "phash",
+                cache_path=None, weights=DEFAULT_WEIGHTS) -> np.ndarray:
+    """
+    Similaridade (0 a 1) de cada par, com um hash por imagem distinta.
+
+    Args:
+        images_a: Caminhos da primeira imagem de cada par.
+        images_b: Caminhos da segunda imagem de cada par.
+        method (str): "phash", "whash" ou "ensemble".
+        cache_path: Arquivo .npz do cache de hashes (opcional).
+        weights: Pesos do ensemble (ver face_hash.fit_ensemble_weights).
+
+    Returns:
+        np.ndarray: Vetor float32 com a similaridade de cada par.
+    """
+    hashes_a, hashes_b = pair_hashes(images_a, images_b, method, cache_path)
+    if method == "ensemble":
+        distances = ensemble_distances(hashes_a, hashes_b)
+        return 1.0 - distances @ np.asarray(weights, dtype=np.float32)
+    distances = popcount64(hashes_a ^ hashes_b)
+    return 1.0 - distances.astype(np.float32) / HASH_BITS
+
+
+def sweep(scores, labels) -> dict:
+    """
+    Avalia todos os limiares de uma vez.
+
+    Ordena os scores em ordem decrescente e acumula verdadeiros e falsos
+    aceites; cada score distinto é um limiar candidato (aceita se
+    score >= limiar).
+
+    Args:
+        scores: Similaridade de cada par.
+        labels: 1 para pares genuínos, 0 para impostores.
+
+    Returns:
+        dict: Vetores "threshold", "far" (falso aceite), "frr" (falsa
+            rejeição) e "tpr", do limiar mais alto (infinito) para o mais
+            baixo.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    labels = np.asarray(labels, dtype=bool)
+    positives = int(labels.sum())
+    negatives = len(labels) - positives
+    if not positives or not negatives:
+        raise Exception("São necessários pares genuínos e impostores.")
+
+    order = np.argsort(-scores, kind="mergesort")
+    scores, labels = scores[order], labels[order]
+
+    # último índice de cada score distinto (empates entram juntos)
+    last = np.r_[np.nonzero(np.diff(scores))[0], len(scores) - 1]
+    true_accepts = np.cumsum(labels)[last]
+    false_accepts = np.cumsum(~labels)[last]
+
+    # primeiro ponto: limiar infinito (rejeita tudo)
+    tpr = np.r_[0.0, true_accepts / positives]
+    return {
+        "threshold": np.r_[np.inf, scores[last]],
+        "far": np.r_[0.0, false_accepts / negatives],
+        "frr": 1.0 - tpr,
+        "tpr": tpr,
+    }
+
+
+def equal_error_rate(curves: dict):
+    """
+    Ponto em que FAR e FRR se cruzam.
+
+    Returns:
+        tuple: (eer, limiar), interpolando entre os dois limiares vizinhos.
+    """
+    far, frr, thresholds = curves["far"], curves["frr"], curves["threshold"]
+    diff = far - frr  # cresce com o índice (far sobe, frr cai)
+    crossed = diff >= 0
+    i = int(np.argmax(crossed)) if crossed.any() else len(diff) - 1
+    # sem vizinho finito para interpolar (o primeiro ponto é o limiar infinito)
+    if i <= 1 or diff[i] <= 0:
+        return float((far[i] + frr[i]) / 2), float(thresholds[i])
+
+    # interpolação linear entre i - 1 (far < frr) e i (far >= frr)
+    w = -diff[i - 1] / (diff[i] - diff[i - 1])
+    eer = far[i - 1] + w * (far[i] - far[i - 1])
+    threshold = thresholds[i - 1] + w * (thresholds[i] - thresholds[i - 1])
+    return float(eer), float(threshold)
+
+
+def operating_point(curves: dict, target_far: float) -> dict:
+    """
+    Menor limiar cuja taxa de falso aceite não passa de target_far.
+
+    Returns:
+        dict: threshold, far, frr e tpr no ponto escolhido.
+    """
+    # o primeiro ponto (rejeita tudo) sempre tem FAR 0
+    i = int(np.nonzero(curves["far"] <= target_far)[0][-1])
+    return {name: float(values[i]) for name, values in curves.items()}
+
+
+def save_curves(curves: dict, path):
+    """Grava as curvas ROC/DET (um limiar por linha) em CSV."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["threshold", "far", "frr", "tpr"])
+        writer.writerows(zip(
+            curves["threshold"], curves["far"], curves["frr"], curves["tpr"]
+        ))
+
+
+def plot_curves(curves: dict, path):
+    """Salva os gráficos ROC e DET num PNG (matplotlib importado só aqui)."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, (roc, det) = plt.subplots(1, 2, figsize=(10, 4))
+    roc.plot(curves["far"], curves["tpr"])
+    roc.set_xlabel("FAR")
+    roc.set_ylabel("TPR")
+    roc.set_title("ROC")
+
+    det.loglog(curves["far"], curves["frr"])
+    det.set_xlabel("FAR")
+    det.set_ylabel("FRR")
+    det.set_title("DET")
+
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Calibração do limiar facial (ROC, DET, EER)."
+    )
+    parser.add_argument("pairs", help="pares rotulados (CSV ou JSONL)")
+    parser.add_argument("--method", default="phash", choices=METHODS,
+                        help="hash perceptual (ensemble = pHash, dHash, "
+                        "wHash e colorhash ponderados)")
+    parser.add_argument("--fit-weights", action="store_true",
+                        help="calibra os pesos do ensemble nos pares antes "
+                        "do limiar")
+    parser.add_argument("--target-far", type=float, default=0.01,
+                        help="taxa de falso aceite alvo")
+    parser.add_argument("--hash-cache", default=".cache/hashes.npz",
+                        help="cache dos hashes por imagem ('' desativa)")
+    parser.add_argument("--curves", help="grava as curvas em CSV")
+    parser.add_argument("--plot", help="grava os gráficos ROC/DET em PNG")
+    args = parser.parse_args(argv)
+
+    images_a, images_b, labels = read_pairs(args.pairs)
+    weights = DEFAULT_WEIGHTS
+    if args.method == "ensemble" and args.fit_weights:
+        distances = ensemble_distances(*pair_hashes(
+            images_a, images_b, args.method, args.hash_cache or None
+        ))
+        weights = fit_ensemble_weights(distances, labels)
+    scores = pair_scores(
+        images_a, images_b, args.method, args.hash_cache or None, weights
+    )
+    curves = sweep(scores, labels)
+    eer, eer_threshold = equal_error_rate(curves)
+    point = operating_point(curves, args.target_far)
+
+    print(f"Pares: {len(labels)} ({sum(labels)} genuínos)")
+    if args.method == "ensemble":
+        print("Pesos: " + ", ".join(f"{w:.4f}" for w in weights))
+        if args.fit_weights:
+            print("(pesos ajustados nestes pares; confirme o limiar num "
+                  "conjunto separado)")
+    print(f"EER: {eer:.4f} (limiar {eer_threshold:.4f})")
+    print(
+        f"FAR <= {args.target_far}: limiar {point['threshold']:.4f}, "
+        f"FAR {point['far']:.4f}, FRR {point['frr']:.4f}"
+    )
+
+    if args.curves:
+        save_curves(curves, args.curves)
+        print(f"Curvas salvas em {args.curves}")
+    if args.plot:
+        plot_curves(curves, args.plot)
+        print(f"Gráficos salvos em {args.plot}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Detectores de rosto plugáveis.
+
+Todo detector tem `detect(image)`, que devolve ((x_min, y_min, x_max,
+y_max), confiança) do rosto principal ou None. O HaarFaceDetector roda
+localmente com OpenCV (sem rede nem custo por imagem); o
+VisionFaceDetector usa o FACE_DETECTION do Google Vision e serve de
+fallback quando o detector local não encontra rosto ou tem baixa
+confiança (ver utils.extract_face).
+
+Detectores locais podem ser distribuídos num pool de processos com
+detect_many: cada processo carrega o classificador uma única vez.
+"""
+import numpy as np
+
+import telemetry
+from utils import (
+    FACE_DETECTION,
+    annotate_image,
+    face_box_from_response,
+    load_image,
+)
+
+DETECTIONS = "validacao_deteccao_rosto_total"
+
+
+class HaarFaceDetector:
+    """
+    Detector local com cascata Haar do OpenCV.
+
+    A imagem é reduzida até `max_side` antes da detecção (o rosto da CNH
+    continua grande o bastante) e a caixa é devolvida nas coordenadas da
+    imagem original. A confiança é o peso do último estágio da cascata;
+    detecções abaixo de `min_confidence` são descartadas.
+    """
+
+    name = "haar"
+
+    def __init__(self, cascade: str = "haarcascade_frontalface_default.xml",
+                 max_side: int = 800, min_neighbors: int = 5,
+                 min_size_ratio: float = 0.15, min_confidence: float = 1.0):
+        self.cascade = cascade
+        self.max_side = max_side
+        self.min_neighbors = min_neighbors
+        self.min_size_ratio = min_size_ratio
+        self.min_confidence = min_confidence
+        self._classifier = None
+
+    def __getstate__(self):
+        # o classificador do OpenCV não é serializável: cada processo do
+        # pool carrega o seu na primeira detecção
+        state = self.__dict__.copy()
+        state["_classifier"] = None
+        return state
+
+    def _load(self):
+        import cv2
+
+        path = self.cascade
+        if "/" not in path and "\\" not in path:
+            path = cv2.data.haarcascades + path
+        classifier = cv2.CascadeClassifier(path)
+        if classifier.empty():
+            raise Exception(f"Cascata Haar não encontrada: {path}")
+        return classifier
+
+    def detect(self, image):
+        """
+        Detecta o maior rosto da imagem.
+
+        Args:
+            image: Caminho, bytes, np.ndarray ou PIL.Image.
+
+        Returns:
+            tuple | None: ((x_min, y_min, x_max, y_max), confiança) ou None.
+        """
+        import cv2
+
+        if self._classifier is None:
+            self._classifier = self._load()
+
+        img = load_image(image)
+        scale = max(img.size) / self.max_side
+        gray = img.convert("L")
+        if scale > 1:
+            gray = gray.resize(
+                (round(img.width / scale), round(img.height / scale))
+            )
+        else:
+            scale = 1.0
+        gray = cv2.equalizeHist(np.asarray(gray))
+
+        min_side = max(20, int(min(gray.shape) * self.min_size_ratio))
+        boxes, _, weights = self._classifier.detectMultiScale3(
+            gray,
+            scaleFactor=1.1,
+            minNeighbors=self.min_neighbors,
+            minSize=(min_side, min_side),
+            outputRejectLevels=True,
+        )
+        if len(boxes) == 0:
+            telemetry.inc(DETECTIONS, detector=self.name, resultado="sem_rosto")
+            return None
+
+        # rosto principal: o de maior área
+        i = int(np.argmax([w * h for _, _, w, h in boxes]))
+        confidence = float(np.ravel(weights)[i])
+        if confidence < self.min_confidence:
+            telemetry.inc(
+                DETECTIONS, detector=self.name, resultado="baixa_confianca"
+            )
+            return None
+
+        x, y, w, h = boxes[i]
+        telemetry.inc(DETECTIONS, detector=self.name, resultado="rosto")
+        box = (
+            int(x * scale),
+            int(y * scale),
+            min(img.width, int(round((x + w) * scale))),
+            min(img.height, int(round((y + h) * scale))),
+        )
+        return box, confidence
+
+
+class VisionFaceDetector:
+    """Detector que usa o FACE_DETECTION do Google Vision."""
+
+    name = "vision"
+
+    def __init__(self, client, cache=None):
+        self.client = client
+        self.cache = cache
+
+    def detect(self, image):
+        """
+        Detecta o rosto principal com uma chamada ao Vision.
+
+        Args:
+            image: Caminho, bytes, np.ndarray ou PIL.Image.
+
+        Returns:
+            tuple | None: ((x_min, y_min, x_max, y_max), confiança) ou None.
+        """
+        response = annotate_image(
+            self.client, image, (FACE_DETECTION,), self.cache
+        )
+        box = face_box_from_response(response)
+        telemetry.inc(
+            DETECTIONS, detector=self.name,
+            resultado="rosto" if box else "sem_rosto",
+        )
+        if box is None:
+            return None
+        return box, float(response.face_annotations[0].detection_confidence)
+
+
+_worker_detector = None
+
+
+def _init_worker(detector):
+    global _worker_detector
+    _worker_detector = detector
+
+
+def _detect_in_worker(image):
+    return _worker_detector.detect(image)
+
+
+def make_pool(detector, processes: int = None):
+    """
+    Cria um pool de processos em que cada processo tem seu detector.
+
+    Args:
+        detector: Detector local (ex.: HaarFaceDetector).
+        processes (int): Número de processos (padrão: número de CPUs).
+
+    Returns:
+        ProcessPoolExecutor: Pool para usar com detect_many.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    return ProcessPoolExecutor(
+        max_workers=processes, initializer=_init_worker, initargs=(detector,)
+    )
+
+
+def detect_many(detector, images, pool=None):
+    """
+    Detecta rostos em várias imagens, opcionalmente num pool de processos.
+
+    Args:
+        detector: Detector usado quando não há pool.
+        images: Caminhos das imagens (são enviados aos processos).
+        pool: Pool criado por make_pool (opcional).
+
+    Returns:
+        list: Resultado de detect() para cada imagem, na ordem de entrada.
+    """
+    images = list(images)
+    if pool is None:
+        return [detector.detect(image) for image in images]
+    return list(pool.map(_detect_in_worker, images))
+
+
+DETECTORS = {
+    "haar": HaarFaceDetector,
+}
@@ -0,0 +1,361 @@
+import io
+
+import numpy as np
+from PIL import Image, ImageOps
+import imagehash
+
+import telemetry
+from utils import load_image
+
+
+HASH_BITS = 64
+
+# tabela de popcount por byte (fallback para numpy sem bitwise_count)
+_POPCOUNT_TABLE = np.array(
+    [bin(i).count("1") for i in range(256)], dtype=np.uint8
+)
+
+
+def _phash(img: Image.Image):
+    """pHash sobre a imagem original (mesmo critério de utils.compare_faces)."""
+    return imagehash.phash(img)
+
+
+def _whash(img: Image.Image):
+    """wHash sobre 256x256 em tons de cinza (mesmo critério do app)."""
+    return imagehash.whash(img.convert("L").resize((256, 256)))
+
+
+HASH_METHODS = {
+    "phash": _phash,
+    "whash": _whash,
+}
+
+
+def hash_image(image, method: str = "phash") -> int:
+    """
+    Calcula o hash perceptual de 64 bits de uma imagem como inteiro.
+
+    Args:
+        image: Caminho, bytes, np.ndarray ou PIL.Image já aberta.
+        method (str): "phash" ou "whash".
+
+    Returns:
+        int: Hash de 64 bits (bit mais significativo = primeiro pixel).
+    """
+    bits = HASH_METHODS[method](load_image(image)).hash.flatten()
+
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+@telemetry.instrument("hash")
+def hash_images(images, method: str = "phash") -> np.ndarray:
+    """
+    Calcula os hashes de várias imagens, uma única vez cada.
+
+    Args:
+        images: Iterável de caminhos, bytes, np.ndarray ou PIL.Image.
+        method (str): "phash" ou "whash".
+
+    Returns:
+        np.ndarray: Vetor uint64 com um hash por imagem.
+    """
+    return np.fromiter(
+        (hash_image(image, method) for image in images), dtype=np.uint64
+    )
+
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    """
+    Conta os bits ligados de cada elemento de um array uint64.
+
+    Args:
+        values (np.ndarray): Array uint64 de qualquer formato.
+
+    Returns:
+        np.ndarray: Array uint8 com o mesmo formato.
+    """
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+
+    as_bytes = values.view(np.uint8).reshape(values.shape + (8,))
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+
+def hamming_matrix(hashes_a: np.ndarray, hashes_b: np.ndarray) -> np.ndarray:
+    """
+    Distância de Hamming entre todos os pares (XOR + popcount vetorizados).
+
+    Args:
+        hashes_a (np.ndarray): N hashes uint64 (ex.: selfies).
+        hashes_b (np.ndarray): M hashes uint64 (ex.: rostos das CNHs).
+
+    Returns:
+        np.ndarray: Matriz N x M (uint8) de distâncias de 0 a 64.
+    """
+    hashes_a = np.asarray(hashes_a, dtype=np.uint64)
+    hashes_b = np.asarray(hashes_b, dtype=np.uint64)
+    return popcount64(hashes_a[:, None] ^ hashes_b[None, :])
+
+
+def similarity_matrix(hashes_a: np.ndarray, hashes_b: np.ndarray) -> np.ndarray:
+    """
+    Similaridade (0 a 1) entre todos os pares, como em utils.compare_faces.
+
+    Args:
+        hashes_a (np.ndarray): N hashes uint64 (ex.: selfies).
+        hashes_b (np.ndarray): M hashes uint64 (ex.: rostos das CNHs).
+
+    Returns:
+        np.ndarray: Matriz N x M (float32) com 1 - distância / 64.
+    """
+    distances = hamming_matrix(hashes_a, hashes_b)
+    return 1.0 - distances.astype(np.float32) / HASH_BITS
+
+
+# ensemble: hashes calculados sobre a mesma imagem normalizada
+ENSEMBLE_METHODS = ("phash", "dhash", "whash", "colorhash")
+ENSEMBLE_BITS = np.array([64, 64, 64, 42], dtype=np.float32)
+# pesos iniciais (somam 1), ainda não calibrados: ajuste com
+# `python evaluation.py pares.csv --method ensemble --fit-weights`
+DEFAULT_WEIGHTS = np.array([0.3, 0.2, 0.3, 0.2], dtype=np.float32)
+NORMALIZED_SIZE = 128
+WHASH_SCALE = 64
+COLOR_SIZE = 64
+
+
+def normalize_image(image, size: int = NORMALIZED_SIZE):
+    """
+    Decodifica e normaliza uma imagem uma única vez para o ensemble.
+
+    Para arquivos JPEG o decodificador já lê numa escala reduzida (draft).
+    A orientação do EXIF é aplicada antes de reduzir; pHash, dHash e wHash
+    usam a versão em tons de cinza e o colorhash a versão colorida.
+
+    Args:
+        image: Caminho, bytes, np.ndarray ou PIL.Image.
+        size (int): Lado da imagem em tons de cinza.
+
+    Returns:
+        tuple: (cinza size x size, RGB COLOR_SIZE x COLOR_SIZE).
+    """
+    if isinstance(image, Image.Image):
+        img = image
+    elif hasattr(image, "__array_interface__"):
+        img = Image.fromarray(image)
+    else:
+        if isinstance(image, (bytes, bytearray)):
+            image = io.BytesIO(image)
+        img = Image.open(image)
+        img.draft("RGB", (size, size))
+
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    # reducing_gap reduz primeiro por blocos inteiros (barato em fotos grandes)
+    gray = img.convert("L").resize(
+        (size, size), Image.BILINEAR, reducing_gap=2.0
+    )
+    color = img.resize(
+        (COLOR_SIZE, COLOR_SIZE), Image.BILINEAR, reducing_gap=2.0
+    )
+    return gray, color.convert("RGB")
+
+
+def _bits_to_int(image_hash) -> int:
+    bits = image_hash.hash.flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big") >> (
+        (-len(bits)) % 8
+    )
+
+
+def hash_ensemble(image) -> np.ndarray:
+    """
+    Calcula pHash, dHash, wHash e colorhash a partir de uma única decodificação.
+
+    Args:
+        image: Caminho, bytes, np.ndarray ou PIL.Image.
+
+    Returns:
+        np.ndarray: Vetor uint64 com um hash por método de ENSEMBLE_METHODS.
+    """
+    gray, color = normalize_image(image)
+    return np.array([
+        _bits_to_int(imagehash.phash(gray)),
+        _bits_to_int(imagehash.dhash(gray)),
+        _bits_to_int(imagehash.whash(gray, image_scale=WHASH_SCALE)),
+        _bits_to_int(imagehash.colorhash(color, binbits=3)),
+    ], dtype=np.uint64)
+
+
+@telemetry.instrument("hash")
+def hash_ensembles(images, processes: int = 0) -> np.ndarray:
+    """
+    Calcula os hashes do ensemble de várias imagens.
+
+    Args:
+        images: Iterável de caminhos, bytes, np.ndarray ou PIL.Image.
+        processes (int): Processos do pool (0 = no próprio processo).
+
+    Returns:
+        np.ndarray: Matriz uint64 N x len(ENSEMBLE_METHODS).
+    """
+    images = list(images)
+    if processes and len(images) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunksize = max(1, len(images) // (4 * processes))
+        with ProcessPoolExecutor(processes) as pool:
+            rows = list(pool.map(hash_ensemble, images, chunksize=chunksize))
+    else:
+        rows = [hash_ensemble(image) for image in images]
+
+    if not rows:
+        return np.empty((0, len(ENSEMBLE_METHODS)), dtype=np.uint64)
+    return np.stack(rows)
+
+
+def ensemble_distances(hashes_a: np.ndarray, hashes_b: np.ndarray) -> np.ndarray:
+    """
+    Distâncias normalizadas (0 a 1) por método, par a par.
+
+    Args:
+        hashes_a (np.ndarray): N x K hashes (ex.: selfies).
+        hashes_b (np.ndarray): N x K hashes (mesmo formato, ou broadcast).
+
+    Returns:
+        np.ndarray: Matriz float32 com a fração de bits diferentes.
+    """
+    hashes_a = np.asarray(hashes_a, dtype=np.uint64)
+    hashes_b = np.asarray(hashes_b, dtype=np.uint64)
+    return popcount64(hashes_a ^ hashes_b).astype(np.float32) / ENSEMBLE_BITS
+
+
+def ensemble_similarity_matrix(hashes_a: np.ndarray, hashes_b: np.ndarray,
+                               weights=DEFAULT_WEIGHTS) -> np.ndarray:
+    """
+    Similaridade combinada (0 a 1) entre todos os pares.
+
+    Args:
+        hashes_a (np.ndarray): N x K hashes (ex.: selfies).
+        hashes_b (np.ndarray): M x K hashes (ex.: rostos das CNHs).
+        weights: Peso de cada método (somando 1).
+
+    Returns:
+        np.ndarray: Matriz N x M (float32) com 1 - soma ponderada das
+            distâncias normalizadas.
+    """
+    distances = ensemble_distances(
+        np.asarray(hashes_a)[:, None, :], np.asarray(hashes_b)[None, :, :]
+    )
+    return 1.0 - distances @ np.asarray(weights, dtype=np.float32)
+
+
+def fit_ensemble_weights(distances: np.ndarray, labels, iterations: int = 50):
+    """
+    Calibra os pesos do ensemble em pares rotulados (regressão logística).
+
+    Os coeficientes negativos são zerados e os pesos normalizados para
+    somar 1, então o score continua na escala 0 a 1 de similarity_matrix
+    (o limiar é escolhido depois, ver evaluation.sweep).
+
+    Args:
+        distances (np.ndarray): P x K distâncias (ver ensemble_distances).
+        labels: 1 para pares genuínos, 0 para impostores.
+        iterations (int): Iterações de Newton.
+
+    Returns:
+        np.ndarray: Pesos float32 (K,).
+    """
+    x = np.c_[np.ones(len(distances)), np.asarray(distances, np.float64)]
+    y = np.asarray(labels, dtype=np.float64)
+    coef = np.zeros(x.shape[1])
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-x @ coef))
+        gradient = x.T @ (y - p)
+        hessian = (x * (p * (1 - p))[:, None]).T @ x + 1e-6 * np.eye(len(coef))
+        step = np.linalg.solve(hessian, gradient)
+        coef += step
+        if np.abs(step).max() < 1e-8:
+            break
+
+    # distância maior deve diminuir a chance de ser genuíno
+    weights = np.maximum(-coef[1:], 0.0)
+    if not weights.sum():
+        return DEFAULT_WEIGHTS.copy()
+    return (weights / weights.sum()).astype(np.float32)
+
+
+def compare_ensemble(img1, img2, threshold: float = 0.75,
+                     weights=DEFAULT_WEIGHTS):
+    """
+    Compara duas imagens faciais com o ensemble de hashes.
+
+    Args:
+        img1: Primeira imagem (selfie): caminho, bytes, np.ndarray ou
+            PIL.Image.
+        img2: Segunda imagem (rosto extraído da CNH), nos mesmos formatos.
+        threshold (float): Valor mínimo de similaridade aceitável (0 a 1).
+        weights: Peso de cada método (ver fit_ensemble_weights).
+
+    Returns:
+        tuple: (match, similaridade), como utils.compare_faces.
+    """
+    hashes = hash_ensembles([img1, img2])
+    similarity = float(
+        ensemble_similarity_matrix(hashes[:1], hashes[1:], weights)[0, 0]
+    )
+    return similarity >= threshold, similarity
+
+
+# método das decisões (utils.compare_faces, stage_graph e scripts de
+# avaliação). Os limiares do projeto (0.7, 0.75, 0.90) estão na escala do
+# pHash: troque para "ensemble" só junto com pesos e limiar calibrados
+# (ver evaluation.py --method ensemble --fit-weights)
+SCORING_METHOD = "phash"
+
+
+def hash_faces(images, method: str = SCORING_METHOD) -> np.ndarray:
+    """
+    Hashes das imagens para o método de comparação.
+
+    Args:
+        images: Iterável de caminhos, bytes, np.ndarray ou PIL.Image.
+        method (str): "phash", "whash" ou "ensemble".
+
+    Returns:
+        np.ndarray: Vetor uint64 (N,) ou, no ensemble, matriz N x K.
+    """
+    if method == "ensemble":
+        return hash_ensembles(images)
+    return hash_images(images, method)
+
+
+def face_similarity_matrix(hashes_a: np.ndarray, hashes_b: np.ndarray,
+                           method: str = SCORING_METHOD,
+                           weights=DEFAULT_WEIGHTS) -> np.ndarray:
+    """
+    Similaridade (0 a 1) entre todos os pares de hashes de hash_faces.
+
+    Returns:
+        np.ndarray: Matriz N x M (float32).
+    """
+    if method == "ensemble":
+        return ensemble_similarity_matrix(hashes_a, hashes_b, weights)
+    return similarity_matrix(hashes_a, hashes_b)
+
+
+def compare_images(img1, img2, threshold: float = 0.75,
+                   method: str = SCORING_METHOD):
+    """
+    Compara duas imagens faciais com o método de comparação configurado.
+
+    Returns:
+        tuple: (match, similaridade), como utils.compare_faces.
+    """
+    hashes = hash_faces([img1, img2], method)
+    similarity = float(
+        face_similarity_matrix(hashes[:1], hashes[1:], method)[0, 0]
+    )
+    return similarity >= threshold, similarity
@@ -0,0 +1,200 @@
+from itertools import combinations
+
+import numpy as np
+
+from face_hash import HASH_BITS, hash_image, popcount64
+
+
+class FaceHashIndex:
+    """
+    Índice 1:N de hashes faciais de 64 bits por distância de Hamming.
+
+    Usa multi-index hashing: o hash é dividido em `num_chunks` blocos e,
+    pelo princípio da casa dos pombos, qualquer hash a distância <= r
+    tem ao menos um bloco a distância <= r // num_chunks do bloco
+    correspondente da consulta. Cada bloco é indexado num array ordenado
+    (busca binária), e só os candidatos encontrados são verificados com
+    XOR + popcount. Inserções recentes ficam num trecho ainda não indexado,
+    verificado linearmente, até a próxima reindexação.
+    """
+
+    def __init__(self, num_chunks: int = 4, method: str = "phash"):
+        """
+        Args:
+            num_chunks (int): Número de blocos (divisor de 64).
+            method (str): Método de hash usado em add_image/query_image.
+        """
+        if HASH_BITS % num_chunks:
+            raise ValueError("num_chunks precisa dividir 64")
+
+        self.num_chunks = num_chunks
+        self.chunk_bits = HASH_BITS // num_chunks
+        self.method = method
+        self.labels = []
+        self._hashes = np.empty(1024, dtype=np.uint64)
+        self._size = 0
+        self._indexed = 0
+        self._tables = [
+            (np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64))
+        ] * num_chunks
+        self._masks = {}
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def hashes(self) -> np.ndarray:
+        """Hashes inseridos, na ordem de inserção."""
+        return self._hashes[:self._size]
+
+    def _chunk(self, values: np.ndarray, chunk: int) -> np.ndarray:
+        """Extrai o bloco `chunk` de cada hash."""
+        shift = np.uint64(chunk * self.chunk_bits)
+        mask = np.uint64((1 << self.chunk_bits) - 1)
+        return (values >> shift) & mask
+
+    def _probe_masks(self, max_bits: int) -> np.ndarray:
+        """Máscaras XOR com até `max_bits` bits ligados dentro de um bloco."""
+        if max_bits not in self._masks:
+            masks = [0]
+            for n in range(1, max_bits + 1):
+                for bits in combinations(range(self.chunk_bits), n):
+                    masks.append(sum(1 << b for b in bits))
+            self._masks[max_bits] = np.array(masks, dtype=np.uint64)
+        return self._masks[max_bits]
+
+    def _reindex(self):
+        """Reconstrói as tabelas ordenadas de todos os blocos."""
+        hashes = self.hashes
+        tables = []
+        for chunk in range(self.num_chunks):
+            keys = self._chunk(hashes, chunk)
+            order = np.argsort(keys, kind="stable")
+            tables.append((keys[order], order))
+        self._tables = tables
+        self._indexed = self._size
+
+    def add(self, face_hash: int, label: str) -> int:
+        """
+        Insere um hash no índice.
+
+        Args:
+            face_hash (int): Hash de 64 bits (ver face_hash.hash_image).
+            label (str): Identificação do cadastro (ex.: CPF).
+
+        Returns:
+            int: Id interno da entrada.
+        """
+        return self.add_many([face_hash], [label])[0]
+
+    def add_many(self, face_hashes, labels) -> list:
+        """
+        Insere vários hashes de uma vez.
+
+        Args:
+            face_hashes: Iterável de hashes de 64 bits.
+            labels: Iterável de identificações, na mesma ordem.
+
+        Returns:
+            list: Ids internos das entradas inseridas.
+        """
+        new = np.asarray(list(face_hashes), dtype=np.uint64)
+        labels = list(labels)
+        if len(new) != len(labels):
+            raise ValueError("face_hashes e labels têm tamanhos diferentes")
+
+        needed = self._size + len(new)
+        if needed > len(self._hashes):
+            grown = np.empty(max(needed, 2 * len(self._hashes)), np.uint64)
+            grown[:self._size] = self.hashes
+            self._hashes = grown
+
+        start = self._size
+        self._hashes[start:needed] = new
+        self._size = needed
+        self.labels.extend(labels)
+
+        if self._size - self._indexed > max(4096, self._indexed // 16):
+            self._reindex()
+
+        return list(range(start, needed))
+
+    def add_image(self, image, label: str) -> int:
+        """Calcula o hash de uma imagem (caminho ou PIL.Image) e o insere."""
+        return self.add(hash_image(image, self.method), label)
+
+    def query(self, face_hash: int, radius: int = 6, exclude_label=None):
+        """
+        Busca todas as entradas a distância de Hamming <= radius.
+
+        Args:
+            face_hash (int): Hash de 64 bits da consulta.
+            radius (int): Distância máxima (0 a 64).
+            exclude_label: Identificação a ignorar (ex.: o próprio CPF,
+                para achar o mesmo rosto cadastrado sob outro CPF).
+
+        Returns:
+            list: Tuplas (label, distância, id) ordenadas por distância.
+        """
+        query = np.uint64(face_hash)
+        masks = self._probe_masks(radius // self.num_chunks)
+
+        candidates = [np.arange(self._indexed, self._size)]
+        for chunk, (keys, ids) in enumerate(self._tables):
+            probes = self._chunk(query, chunk) ^ masks
+            lo = np.searchsorted(keys, probes, side="left")
+            hi = np.searchsorted(keys, probes, side="right")
+            for a, b in zip(lo[lo < hi], hi[lo < hi]):
+                candidates.append(ids[a:b])
+
+        ids = np.unique(np.concatenate(candidates))
+        distances = popcount64(self._hashes[ids] ^ query)
+        keep = distances <= radius
+        ids, distances = ids[keep], distances[keep]
+        order = np.argsort(distances, kind="stable")
+
+        results = []
+        for i in order:
+            label = self.labels[ids[i]]
+            if exclude_label is not None and label == exclude_label:
+                continue
+            results.append((label, int(distances[i]), int(ids[i])))
+        return results
+
+    def query_image(self, image, radius: int = 6, exclude_label=None):
+        """Calcula o hash de uma imagem e executa query."""
+        return self.query(
+            hash_image(image, self.method), radius, exclude_label
+        )
+
+    def save(self, path):
+        """
+        Salva o índice em disco (.npz, sem pickle).
+
+        Args:
+            path: Caminho do arquivo de saída.
+        """
+        np.savez(
+            path,
+            hashes=self.hashes,
+            labels=np.array(self.labels, dtype=str),
+            num_chunks=self.num_chunks,
+            method=self.method,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Carrega um índice salvo com save.
+
+        Args:
+            path: Caminho do arquivo .npz.
+
+        Returns:
+            FaceHashIndex: Índice pronto para consultas.
+        """
+        with np.load(path) as data:
+            index = cls(int(data["num_chunks"]), str(data["method"]))
+            index.add_many(data["hashes"], data["labels"].tolist())
+        index._reindex()
+        return index
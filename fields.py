@@ -0,0 +1,314 @@
+import re
+import unicodedata
+
+import telemetry
+
+
+# padrões compilados uma única vez (reutilizados em todas as chamadas)
+_RE_CPF = re.compile(r"(?<!\d)(\d{3})\.?\s?(\d{3})\.?\s?(\d{3})\s?-?\s?(\d{2})(?!\d)")
+_RE_DATE = re.compile(r"(?<!\d)(\d{2})/(\d{2})/(\d{4})(?!\d)")
+_RE_CEP = re.compile(r"(?<!\d)(\d{5})-?(\d{3})(?!\d)")
+_RE_NAME_LINE = re.compile(r"^[A-ZÀ-Ý][A-ZÀ-Ý' ]+$")
+_RE_STREET = re.compile(
+    r"^(R|RUA|AV|AVENIDA|AL|ALAMEDA|TRAV|TRAVESSA|TV|ESTR|ESTRADA|ROD|"
+    r"RODOVIA|PC|PRACA|PRAÇA|LARGO|LGO|VIELA)\b\.?\s+\S.*\d",
+    re.IGNORECASE,
+)
+_RE_NON_LETTER = re.compile(r"[^A-Z ]+")
+_RE_SPACES = re.compile(r"\s+")
+
+# rótulos da CNH: o valor do campo aparece nas linhas seguintes
+_CNH_LABELS = (
+    ("nome", re.compile(r"\bNOME\b")),
+    ("data_nascimento", re.compile(r"NASCIMENTO")),
+    ("validade", re.compile(r"VALIDADE")),
+    ("cpf", re.compile(r"\bCPF\b")),
+)
+_RE_CLIENT_NAME_LABEL = re.compile(r"NOME DO CLIENTE|TITULAR|DESTINAT", re.I)
+
+# confusões comuns do OCR em nomes (dígito lido no lugar de letra)
+_OCR_DIGITS = str.maketrans("015824", "OISBZA")
+
+# quantas linhas depois do rótulo o valor ainda é procurado
+_LOOKAHEAD = 3
+
+
+def format_cpf(digits: str) -> str:
+    """Formata 11 dígitos como 000.000.000-00."""
+    return f"{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}"
+
+
+def is_valid_cpf(cpf: str) -> bool:
+    """
+    Verifica os dígitos verificadores de um CPF.
+
+    Args:
+        cpf (str): CPF com ou sem pontuação.
+
+    Returns:
+        bool: True se o CPF tem 11 dígitos e dígitos verificadores corretos.
+    """
+    digits = [int(c) for c in cpf if c.isdigit()]
+    if len(digits) != 11 or len(set(digits)) == 1:
+        return False
+
+    for size in (9, 10):
+        total = sum(d * w for d, w in zip(digits, range(size + 1, 1, -1)))
+        check = (total * 10) % 11 % 10
+        if check != digits[size]:
+            return False
+    return True
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normaliza um nome para comparação (sem acentos, maiúsculo, só letras).
+
+    Args:
+        name (str): Nome como veio do OCR.
+
+    Returns:
+        str: Nome normalizado (ex.: "joão  da silva" -> "JOAO DA SILVA").
+    """
+    folded = unicodedata.normalize("NFKD", name.upper())
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    folded = _RE_NON_LETTER.sub(" ", folded.translate(_OCR_DIGITS))
+    return _RE_SPACES.sub(" ", folded).strip()
+
+
+def bounded_edit_distance(a: str, b: str, max_dist: int) -> int:
+    """
+    Distância de Levenshtein limitada (para assim que passa de max_dist).
+
+    Só calcula a faixa diagonal de largura 2 * max_dist + 1, então o custo
+    é O(len(a) * max_dist) em vez de O(len(a) * len(b)).
+
+    Args:
+        a (str): Primeira string.
+        b (str): Segunda string.
+        max_dist (int): Distância máxima de interesse.
+
+    Returns:
+        int: Distância de edição, ou max_dist + 1 se for maior que max_dist.
+    """
+    if abs(len(a) - len(b)) > max_dist:
+        return max_dist + 1
+    if a == b:
+        return 0
+
+    too_far = max_dist + 1
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        lo = max(1, i - max_dist)
+        hi = min(len(b), i + max_dist)
+        current = [too_far] * (len(b) + 1)
+        current[0] = i if i <= max_dist else too_far
+        row_min = current[0]
+        for j in range(lo, hi + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + cost,
+            )
+            current[j] = value if value <= max_dist else too_far
+            row_min = min(row_min, current[j])
+        if row_min > max_dist:
+            return too_far
+        previous = current
+
+    return previous[len(b)]
+
+
+def names_match(name_a: str, name_b: str, max_ratio: float = 0.15) -> bool:
+    """
+    Compara dois nomes tolerando acentos e ruído de OCR.
+
+    Args:
+        name_a (str): Primeiro nome.
+        name_b (str): Segundo nome.
+        max_ratio (float): Fração máxima de edições em relação ao tamanho
+            do nome (mínimo de 1 edição).
+
+    Returns:
+        bool: True se os nomes normalizados estão dentro do limite.
+    """
+    a, b = normalize_name(name_a), normalize_name(name_b)
+    if not a or not b:
+        return False
+
+    max_dist = max(1, int(len(a) * max_ratio))
+    return bounded_edit_distance(a, b, max_dist) <= max_dist
+
+
+def find_name(name: str, text: str, max_ratio: float = 0.15):
+    """
+    Procura um nome em qualquer linha de um texto de OCR.
+
+    Args:
+        name (str): Nome procurado (ex.: nome da CNH).
+        text (str): Texto completo (ex.: OCR do comprovante).
+        max_ratio (float): Ver names_match.
+
+    Returns:
+        str | None: Linha do texto que corresponde ao nome, ou None.
+    """
+    target = normalize_name(name)
+    if not target:
+        return None
+
+    max_dist = max(1, int(len(target) * max_ratio))
+    for line in text.splitlines():
+        candidate = normalize_name(line)
+        if candidate and bounded_edit_distance(
+            target, candidate, max_dist
+        ) <= max_dist:
+            return line.strip()
+    return None
+
+
+def extract_cnh_fields(text: str) -> dict:
+    """
+    Extrai os campos da CNH a partir do texto do OCR, numa única passada.
+
+    Cada rótulo reconhecido ("NOME", "NASCIMENTO", "VALIDADE", "CPF")
+    abre uma janela de algumas linhas onde o valor correspondente é
+    procurado; linhas de ruído entre rótulo e valor são ignoradas.
+
+    Args:
+        text (str): Texto completo da CNH (saída de extract_text).
+
+    Returns:
+        dict: nome, cpf, data_nascimento e validade (None se não achados).
+    """
+    fields = {
+        "nome": None, "cpf": None, "data_nascimento": None, "validade": None,
+    }
+    pending = {}
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        upper = line.upper()
+
+        is_label = False
+        for field, pattern in _CNH_LABELS:
+            if fields[field] is None and pattern.search(upper):
+                pending[field] = _LOOKAHEAD
+                is_label = True
+        if is_label:
+            continue
+
+        for field in list(pending):
+            value = None
+            if field == "nome" and _RE_NAME_LINE.match(upper):
+                value = line
+            elif field == "cpf":
+                match = _RE_CPF.search(line)
+                value = format_cpf("".join(match.groups())) if match else None
+            elif field in ("data_nascimento", "validade"):
+                match = _RE_DATE.search(line)
+                value = match.group(0) if match else None
+
+            if value is not None:
+                fields[field] = value
+                del pending[field]
+            else:
+                pending[field] -= 1
+                if not pending[field]:
+                    del pending[field]
+
+    if fields["cpf"] is None:
+        match = _RE_CPF.search(text)
+        if match:
+            fields["cpf"] = format_cpf("".join(match.groups()))
+
+    return fields
+
+
+def extract_comprovante_fields(text: str, expected_name: str = None) -> dict:
+    """
+    Extrai nome e endereço do comprovante a partir do texto do OCR.
+
+    O nome é a linha após "Nome do Cliente" (ou a linha que corresponde a
+    expected_name); o endereço é a primeira linha de logradouro depois do
+    nome, e o CEP o primeiro CEP a partir dali. Assim o endereço da
+    empresa emissora, que costuma vir antes, é ignorado.
+
+    Args:
+        text (str): Texto completo do comprovante.
+        expected_name (str): Nome esperado (ex.: nome da CNH), opcional.
+
+    Returns:
+        dict: nome, endereco e cep (None se não achados).
+    """
+    fields = {"nome": None, "endereco": None, "cep": None}
+    target = normalize_name(expected_name) if expected_name else None
+    max_dist = max(1, int(len(target) * 0.15)) if target else 0
+    after_label = 0
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        if fields["nome"] is None:
+            if _RE_CLIENT_NAME_LABEL.search(line):
+                after_label = _LOOKAHEAD
+                continue
+            candidate = normalize_name(line)
+            if target and candidate and bounded_edit_distance(
+                target, candidate, max_dist
+            ) <= max_dist:
+                fields["nome"] = line
+            elif after_label and _RE_NAME_LINE.match(line.upper()):
+                fields["nome"] = line
+            elif after_label:
+                after_label -= 1
+            continue
+
+        if fields["endereco"] is None and _RE_STREET.match(line):
+            fields["endereco"] = line
+            continue
+
+        if fields["endereco"] is not None and fields["cep"] is None:
+            match = _RE_CEP.search(line)
+            if match:
+                fields["cep"] = f"{match.group(1)}-{match.group(2)}"
+                break
+
+    return fields
+
+
+@telemetry.instrument("campos")
+def validate_documents(doc_text: str, comp_text: str) -> dict:
+    """
+    Extrai os campos da CNH e do comprovante e confere se os nomes batem.
+
+    Args:
+        doc_text (str): Texto do OCR da CNH.
+        comp_text (str): Texto do OCR do comprovante.
+
+    Returns:
+        dict: documento_nome, documento_cpf, cpf_valido,
+            documento_nascimento, documento_validade, comprovante_nome,
+            comprovante_endereco, comprovante_cep e nome_valido.
+    """
+    cnh = extract_cnh_fields(doc_text)
+    comp = extract_comprovante_fields(comp_text, cnh["nome"])
+
+    return {
+        "documento_nome": cnh["nome"],
+        "documento_cpf": cnh["cpf"],
+        "cpf_valido": bool(cnh["cpf"] and is_valid_cpf(cnh["cpf"])),
+        "documento_nascimento": cnh["data_nascimento"],
+        "documento_validade": cnh["validade"],
+        "comprovante_nome": comp["nome"],
+        "comprovante_endereco": comp["endereco"],
+        "comprovante_cep": comp["cep"],
+        "nome_valido": bool(
+            cnh["nome"] and comp["nome"]
+            and names_match(cnh["nome"], comp["nome"])
+        ),
+    }
@@ -0,0 +1,89 @@
+"""
+Verificação do orçamento de tempo de importação.
+
+Importa um módulo num processo Python novo com `-X importtime`, lista os
+imports mais lentos e falha se o tempo total passar do orçamento ou se
+algum módulo proibido for carregado.
+
+Exemplo (comparação por pHash não deve carregar dlib, sklearn nem gRPC):
+
+    python import_budget.py face_hash --budget-ms 400 \\
+        --forbid face_recognition dlib sklearn grpc google.cloud.vision
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent
+
+
+def measure_imports(module: str):
+    """
+    Importa `module` num processo novo e coleta os tempos de importação.
+
+    Args:
+        module (str): Nome do módulo a importar (ex.: "utils").
+
+    Returns:
+        list: Tuplas (módulo, próprio_us, acumulado_us), na ordem do Python.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=str(ROOT_DIR),
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    timings = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings.append((name.strip(), int(self_us), int(cumulative_us)))
+    return timings
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("modules", nargs="+", help="módulos a verificar")
+    parser.add_argument("--budget-ms", type=float, default=500.0,
+                        help="tempo máximo de importação por módulo")
+    parser.add_argument("--forbid", nargs="*", default=[],
+                        help="módulos que não podem ser carregados")
+    parser.add_argument("--top", type=int, default=10,
+                        help="quantos imports lentos listar")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        timings = measure_imports(module)
+        total_ms = next(c for n, _, c in timings if n == module) / 1000.0
+        loaded = {name for name, _, _ in timings}
+
+        print(f"\n{module}: {total_ms:.1f} ms (orçamento {args.budget_ms} ms)")
+        slowest = sorted(timings, key=lambda t: t[1], reverse=True)
+        for name, self_us, cumulative_us in slowest[:args.top]:
+            print(f"  {self_us / 1000:8.1f} ms  "
+                  f"(acum. {cumulative_us / 1000:8.1f} ms)  {name}")
+
+        if total_ms > args.budget_ms:
+            print("  ERRO: orçamento de importação excedido")
+            failed = True
+
+        for forbidden in args.forbid:
+            hits = sorted(
+                n for n in loaded
+                if n == forbidden or n.startswith(forbidden + ".")
+            )
+            if hits:
+                print(f"  ERRO: módulo proibido carregado: {hits[0]}")
+                failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,547 @@
+"""
+Fila local de verificações (SQLite) e pool de processos trabalhadores.
+
+A interface web só enfileira o envio (CNH, comprovante e selfie como
+BLOBs) e acompanha o status; OCR, detecção do rosto e comparação rodam em
+processos separados, iniciados com:
+
+    python job_queue.py --workers 4 --credentials cred/conta.json
+
+Os jobs sobrevivem a reinícios da interface e dos trabalhadores: um job
+que ficou "processando" por mais de `lease` segundos (trabalhador que
+caiu) volta a ser distribuído, até `max_attempts` tentativas. Os bytes
+enviados são apagados do banco quando o job termina. Reenvios dos mesmos
+arquivos reaproveitam o job pendente ou concluído (pelo hash do
+conteúdo), sem repetir a verificação.
+
+O banco padrão fica em `.cache/jobs.sqlite` na raiz do projeto (ou em
+$JOBS_DB), qualquer que seja a pasta de onde a interface e os
+trabalhadores são iniciados; o cache do Vision dos trabalhadores, em
+`.cache/vision.sqlite` (ou em $VISION_CACHE).
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import telemetry
+
+PENDING = "pendente"
+RUNNING = "processando"
+DONE = "concluido"
+FAILED = "falhou"
+
+JOBS = "validacao_jobs_total"
+
+# mesmo arquivo para a interface e os trabalhadores, independente da cwd
+DEFAULT_DB = os.environ.get(
+    "JOBS_DB", str(Path(__file__).resolve().parent / ".cache" / "jobs.sqlite")
+)
+DEFAULT_CACHE = os.environ.get(
+    "VISION_CACHE",
+    str(Path(__file__).resolve().parent / ".cache" / "vision.sqlite"),
+)
+# reenvios idênticos reaproveitam jobs criados há menos que isso
+REUSE_SECONDS = 24 * 60 * 60
+
+# threads das etapas de um job (ver stage_graph)
+STAGE_THREADS = 4
+
+
+class JobQueue:
+    """
+    Fila de jobs de verificação guardada num arquivo SQLite.
+
+    Pode ser aberta ao mesmo tempo pela interface e por vários processos
+    trabalhadores; cada job é entregue a um único trabalhador.
+    """
+
+    def __init__(self, path=DEFAULT_DB, lease: float = 300.0,
+                 max_attempts: int = 3):
+        """
+        Args:
+            path: Caminho do arquivo SQLite da fila.
+            lease (float): Segundos até um job em processamento ser
+                considerado abandonado e voltar para a fila.
+            max_attempts (int): Tentativas por job antes de marcá-lo como
+                falho.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease = lease
+        self.max_attempts = max_attempts
+        # uma conexão compartilhada pelas threads (interface, etapas): o
+        # lock serializa comandos e transações
+        self._lock = threading.Lock()
+        # autocommit: as transações de enqueue() e claim() são abertas
+        # explicitamente
+        self._conn = sqlite3.connect(
+            str(self.path), timeout=30, isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " documento BLOB,"
+            " comprovante BLOB,"
+            " selfie BLOB,"
+            " threshold REAL NOT NULL,"
+            " tentativas INTEGER NOT NULL DEFAULT 0,"
+            " trabalhador TEXT,"
+            " resultado TEXT,"
+            " erro TEXT,"
+            " criado_em REAL NOT NULL,"
+            " iniciado_em REAL,"
+            " concluido_em REAL,"
+            " chave TEXT)"
+        )
+        # bancos criados antes da coluna chave
+        columns = [row[1] for row in self._conn.execute(
+            "PRAGMA table_info(jobs)"
+        )]
+        if "chave" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN chave TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_status"
+            " ON jobs (status, criado_em)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_chave"
+            " ON jobs (chave, criado_em)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trabalhadores ("
+            " id TEXT PRIMARY KEY,"
+            " visto_em REAL NOT NULL)"
+        )
+
+    @staticmethod
+    def content_key(doc: bytes, comp: bytes, selfie: bytes,
+                    threshold: float) -> str:
+        """Hash do conteúdo enviado e do limiar (chave de reaproveitamento)."""
+        digest = hashlib.sha256()
+        for content in (doc, comp, selfie):
+            digest.update(hashlib.sha256(content).digest())
+        digest.update(repr(float(threshold)).encode("ascii"))
+        return digest.hexdigest()
+
+    def enqueue(self, doc: bytes, comp: bytes, selfie: bytes,
+                threshold: float = 0.7, reuse: bool = True) -> str:
+        """
+        Enfileira uma verificação.
+
+        Args:
+            doc (bytes): Imagem da CNH.
+            comp (bytes): Imagem ou PDF do comprovante de endereço.
+            selfie (bytes): Imagem da selfie.
+            threshold (float): Similaridade mínima aceita.
+            reuse (bool): Devolve o job pendente, em processamento ou
+                concluído (há menos de REUSE_SECONDS) com o mesmo conteúdo,
+                em vez de criar outro.
+
+        Returns:
+            str: Id do job.
+        """
+        key = self.content_key(doc, comp, selfie, threshold)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if reuse:
+                    row = self._conn.execute(
+                        "SELECT id FROM jobs WHERE chave = ?"
+                        " AND criado_em >= ? AND status IN (?, ?, ?)"
+                        " ORDER BY criado_em DESC LIMIT 1",
+                        (key, now - REUSE_SECONDS, PENDING, RUNNING, DONE),
+                    ).fetchone()
+                    if row is not None:
+                        self._conn.execute("COMMIT")
+                        telemetry.inc(JOBS, status="reaproveitado")
+                        return row[0]
+
+                job_id = uuid.uuid4().hex
+                self._conn.execute(
+                    "INSERT INTO jobs (id, status, documento, comprovante,"
+                    " selfie, threshold, criado_em, chave)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, PENDING, doc, comp, selfie, threshold, now,
+                     key),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        telemetry.inc(JOBS, status="enfileirado")
+        return job_id
+
+    def claim(self, worker: str):
+        """
+        Reserva o job pendente mais antigo para um trabalhador.
+
+        Jobs em processamento há mais de `lease` segundos também podem
+        ser reservados de novo.
+
+        Args:
+            worker (str): Id do trabalhador.
+
+        Returns:
+            dict | None: id, documento, comprovante, selfie, threshold e
+                tentativas do job, ou None se a fila estiver vazia.
+        """
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE trava a escrita: dois trabalhadores nunca
+            # reservam o mesmo job
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # abandonados sem tentativas restantes não voltam mais à fila
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, erro = ?, concluido_em = ?,"
+                    " documento = NULL, comprovante = NULL, selfie = NULL"
+                    " WHERE status = ? AND iniciado_em < ?"
+                    " AND tentativas >= ?",
+                    (FAILED, "Tentativas esgotadas", now, RUNNING,
+                     now - self.lease, self.max_attempts),
+                )
+                row = self._conn.execute(
+                    "SELECT id, documento, comprovante, selfie, threshold,"
+                    " tentativas FROM jobs"
+                    " WHERE (status = ? OR (status = ? AND iniciado_em < ?))"
+                    " AND tentativas < ?"
+                    " ORDER BY criado_em LIMIT 1",
+                    (PENDING, RUNNING, now - self.lease, self.max_attempts),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, trabalhador = ?,"
+                        " iniciado_em = ?, tentativas = tentativas + 1"
+                        " WHERE id = ?",
+                        (RUNNING, worker, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+        keys = ("id", "documento", "comprovante", "selfie", "threshold",
+                "tentativas")
+        job = dict(zip(keys, row))
+        job["tentativas"] += 1
+        return job
+
+    def complete(self, job_id: str, result: dict):
+        """Grava o resultado do job e descarta as imagens enviadas."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, resultado = ?, erro = NULL,"
+                " concluido_em = ?, documento = NULL, comprovante = NULL,"
+                " selfie = NULL WHERE id = ?",
+                (DONE, json.dumps(result, ensure_ascii=False), time.time(),
+                 job_id),
+            )
+        telemetry.inc(JOBS, status=DONE)
+
+    def fail(self, job_id: str, error: str, retry: bool = False):
+        """
+        Registra o erro de um job.
+
+        Args:
+            job_id (str): Id do job.
+            error (str): Mensagem de erro.
+            retry (bool): Devolve o job à fila se ainda houver tentativas.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tentativas FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            retried = (retry and row is not None
+                       and row[0] < self.max_attempts)
+            if retried:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, erro = ?, trabalhador = NULL"
+                    " WHERE id = ?",
+                    (PENDING, error, job_id),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, erro = ?, concluido_em = ?,"
+                    " documento = NULL, comprovante = NULL, selfie = NULL"
+                    " WHERE id = ?",
+                    (FAILED, error, time.time(), job_id),
+                )
+        telemetry.inc(JOBS, status="repetido" if retried else FAILED)
+
+    def get(self, job_id: str):
+        """
+        Status de um job (sem as imagens).
+
+        Returns:
+            dict | None: id, status, tentativas, resultado (dict ou None),
+                erro, posicao (jobs pendentes à frente) e horários.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, tentativas, resultado, erro, criado_em,"
+                " iniciado_em, concluido_em FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            keys = ("id", "status", "tentativas", "resultado", "erro",
+                    "criado_em", "iniciado_em", "concluido_em")
+            job = dict(zip(keys, row))
+            job["posicao"] = 0
+            if job["status"] == PENDING:
+                (job["posicao"],) = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs"
+                    " WHERE status = ? AND criado_em < ?",
+                    (PENDING, job["criado_em"]),
+                ).fetchone()
+        if job["resultado"] is not None:
+            job["resultado"] = json.loads(job["resultado"])
+        return job
+
+    def wait(self, job_id: str, timeout: float = None, poll: float = 0.5,
+             sleep=time.sleep):
+        """
+        Espera o job terminar (concluído ou falho).
+
+        Args:
+            job_id (str): Id do job.
+            timeout (float): Espera máxima em segundos (None = sem limite).
+            poll (float): Intervalo entre consultas.
+            sleep: Função de espera (substituível em testes).
+
+        Returns:
+            dict | None: Último status lido (ver get).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] in (DONE, FAILED):
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return job
+            sleep(poll)
+
+    def heartbeat(self, worker: str):
+        """Marca o trabalhador como ativo."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO trabalhadores (id, visto_em)"
+                " VALUES (?, ?)",
+                (worker, time.time()),
+            )
+
+    def active_workers(self, within: float = 30.0) -> int:
+        """Trabalhadores que deram sinal de vida nos últimos `within` s."""
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM trabalhadores WHERE visto_em >= ?",
+                (time.time() - within,),
+            ).fetchone()
+        return count
+
+    def counts(self) -> dict:
+        """Quantidade de jobs por status."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        """Fecha a conexão com o banco da fila."""
+        with self._lock:
+            self._conn.close()
+
+
+def process_job(client, doc: bytes, comp: bytes, selfie: bytes,
+                threshold: float = 0.7, cache=None, executor=None) -> dict:
+    """
+    Executa a verificação completa de um envio.
+
+    As etapas independentes (OCR da CNH e do comprovante, decodificação
+    da CNH e hash da selfie) rodam em paralelo (ver stage_graph).
+
+    Args:
+        client: Cliente do Google Vision (ou um fake compatível).
+        doc (bytes): Imagem da CNH.
+        comp (bytes): Imagem ou PDF do comprovante.
+        selfie (bytes): Imagem da selfie.
+        threshold (float): Similaridade mínima aceita.
+        cache: VisionCache opcional.
+        executor: ThreadPoolExecutor das etapas (opcional).
+
+    Returns:
+        dict: Resultado no formato da interface, com "face_box" (caixa do
+            rosto na CNH ou None).
+    """
+    from stage_graph import verify
+
+    outputs = verify(
+        client, doc, comp, selfie, threshold, cache, executor=executor
+    )
+    return outputs["resultado"]
+
+
+def run_worker(db=DEFAULT_DB, credentials=None,
+               cache=DEFAULT_CACHE, rate: float = 30.0,
+               poll: float = 0.5, dry_run: bool = False, max_jobs: int = None,
+               stop=None):
+    """
+    Laço de um processo trabalhador: reserva, processa e grava jobs.
+
+    Args:
+        db: Arquivo SQLite da fila.
+        credentials: JSON da conta de serviço (None = credenciais do
+            ambiente).
+        cache: Cache das respostas do Vision ('' ou None desativa).
+        rate (float): Imagens por segundo deste trabalhador.
+        poll (float): Espera quando a fila está vazia.
+        dry_run (bool): Usa o cliente falso local (sem rede).
+        max_jobs (int): Encerra após esse número de jobs (None = sem fim).
+        stop: multiprocessing.Event opcional que encerra o laço.
+
+    Returns:
+        int: Número de jobs processados.
+    """
+    import socket
+    from concurrent.futures import ThreadPoolExecutor
+
+    from utils import VisionAPIError
+    from vision_scheduler import ScheduledVisionClient
+
+    if dry_run:
+        from vision_fake import FakeVisionClient
+
+        client = FakeVisionClient()
+    else:
+        from cli import build_client
+
+        client = build_client(credentials)
+    client = ScheduledVisionClient(client, rate=rate)
+
+    vision_cache = None
+    if cache and not dry_run:
+        from vision_cache import VisionCache
+
+        vision_cache = VisionCache(cache)
+
+    # pool das etapas de cada job, reaproveitado entre jobs
+    executor = ThreadPoolExecutor(STAGE_THREADS)
+    queue = JobQueue(db)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    done = 0
+    try:
+        while stop is None or not stop.is_set():
+            if max_jobs is not None and done >= max_jobs:
+                break
+            queue.heartbeat(worker)
+            job = queue.claim(worker)
+            if job is None:
+                time.sleep(poll)
+                continue
+
+            try:
+                with telemetry.timed("job"):
+                    result = process_job(
+                        client, job["documento"], job["comprovante"],
+                        job["selfie"], job["threshold"], vision_cache,
+                        executor,
+                    )
+            except VisionAPIError as e:
+                queue.fail(job["id"], str(e), retry=e.retryable)
+            except Exception as e:
+                queue.fail(job["id"], str(e))
+            else:
+                queue.complete(job["id"], result)
+            done += 1
+    finally:
+        executor.shutdown()
+        queue.close()
+        if vision_cache is not None:
+            vision_cache.close()
+    return done
+
+
+def _worker_process(kwargs):
+    import signal
+
+    # Ctrl+C é tratado pelo processo principal, que sinaliza `stop`
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_worker(**kwargs)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Processos trabalhadores da fila de verificações."
+    )
+    parser.add_argument("--db", default=DEFAULT_DB,
+                        help="arquivo SQLite da fila (padrão: "
+                        ".cache/jobs.sqlite na raiz do projeto ou $JOBS_DB)")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="processos trabalhadores")
+    parser.add_argument("--credentials",
+                        help="JSON da conta de serviço do Google")
+    parser.add_argument("--cache", default=DEFAULT_CACHE,
+                        help="cache das respostas do Vision ('' desativa; "
+                        "padrão: .cache/vision.sqlite na raiz do projeto ou "
+                        "$VISION_CACHE)")
+    parser.add_argument("--rate", type=float, default=30.0,
+                        help="imagens por segundo da cota do Vision "
+                        "(dividida entre os processos)")
+    parser.add_argument("--poll", type=float, default=0.5,
+                        help="espera em segundos com a fila vazia")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="usa um cliente falso local (sem rede)")
+    args = parser.parse_args(argv)
+
+    import multiprocessing
+
+    workers = max(1, args.workers)
+    stop = multiprocessing.Event()
+    processes = [
+        multiprocessing.Process(
+            target=_worker_process,
+            args=({
+                "db": args.db,
+                "credentials": args.credentials,
+                "cache": args.cache,
+                "rate": args.rate / workers,
+                "poll": args.poll,
+                "dry_run": args.dry_run,
+                "stop": stop,
+            },),
+            daemon=True,
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    print(f"{workers} trabalhadores aguardando jobs em {args.db}")
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # termina o job atual de cada processo antes de sair
+        stop.set()
+        for process in processes:
+            process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,12 @@
 import os
-import json
-import pandas as pd
 from pathlib import Path
 from google.cloud import vision
 from google.oauth2 import service_account
 
 # importa funções utilitárias
-from utils import extract_text, compare_faces, extract_face_and_save
+from results_store import ResultsStore
+from stage_graph import verify
+from vision_cache import VisionCache
 
 # configuração de credenciais
 SERVICE_ACCOUNT_FILE = (
@@ -40,24 +40,25 @@ selfie_path = Path(
 out_dir = Path("outputs")
 out_dir.mkdir(parents=True, exist_ok=True)
 
-# OCR
-print("Extraindo OCR da CNH...")
-doc_text = extract_text(client, str(doc_path))
+# cache das respostas do Vision (evita reprocessar as mesmas imagens)
+cache = VisionCache(Path(".cache") / "vision.sqlite")
 
-print("Extraindo OCR do Comprovante...")
-comp_text = extract_text(client, str(comp_path))
-
-# extração de rosto
-print("Extraindo rosto da CNH...")
-face_from_doc = extract_face_and_save(
-    client, str(doc_path), str(out_dir / "face_doc.jpg")
+# OCR da CNH e do comprovante, rosto da CNH e hash da selfie em paralelo;
+# a comparação começa assim que o rosto e o hash ficam prontos
+print("Verificando CNH, comprovante e selfie...")
+outputs = verify(
+    client, str(doc_path), str(comp_path), str(selfie_path),
+    threshold=THRESHOLD, cache=cache,
 )
 
-# comparação facial
-print("Comparando selfie com CNH...")
-match, similarity = compare_faces(
-    str(selfie_path), str(face_from_doc), threshold=THRESHOLD
-)
+# rosto extraído da CNH (gravado só como artefato)
+face_from_doc = outputs["face"]
+if face_from_doc is not None:
+    face_from_doc.save(out_dir / "face_doc.jpg")
+
+resultado = outputs["resultado"]
+resultado.pop("face_box")
+match, similarity = resultado["face_match"], resultado["similaridade"]
 
 if match:
     print(
@@ -71,25 +72,12 @@ else:
     )
 
 # consolidação de resultados
-resultado = {
-    "face_match": bool(match),
-    "similaridade": float(round(similarity, 3)),
-    "threshold_utilizado": THRESHOLD,
-    "documento_extraido": str(doc_text),
-    "comprovante_extraido": str(comp_text),
-    "nome_valido": bool("LUIZ ANTONIO DE OLIVEIRA" in comp_text),
-}
-
-# salvar JSON
-json_file = out_dir / "results.json"
-with open(json_file, "w", encoding="utf-8") as f:
-    json.dump(resultado, f, ensure_ascii=False, indent=4)
-print(f"JSON salvo em {json_file.resolve()}")
+resultado["threshold_utilizado"] = THRESHOLD
 
-# salvar CSV
-df = pd.DataFrame([resultado])
-csv_file = out_dir / "results.csv"
-df.to_csv(csv_file, index=False, encoding="utf-8-sig")
-print(f"CSV salvo em {csv_file.resolve()}")
+# histórico de resultados (SQLite só de inserção, indexado por candidato,
+# CPF, data e decisão)
+with ResultsStore(out_dir / "resultados.sqlite") as store:
+    store.append(resultado, applicant_id=doc_path.stem, source="main")
+print(f"Resultado gravado em {store.path.resolve()}")
 
 print("Pipeline concluído com sucesso!")
@@ -0,0 +1,212 @@
+import asyncio
+from pathlib import Path
+
+import telemetry
+from fields import validate_documents
+from quality_gate import prescreen
+from utils import (
+    FEATURES_DOCUMENTO,
+    FEATURES_TEXTO,
+    compare_faces,
+    extract_face,
+    prepare_annotation,
+    record_annotation_call,
+    store_annotations,
+    text_from_response,
+)
+
+
+def _prescreen_triple(doc_path, comp_path, selfie_path):
+    """Triagem local dos três arquivos (ver quality_gate)."""
+    return (
+        prescreen(doc_path, "documento"),
+        prescreen(comp_path, "comprovante"),
+        prescreen(selfie_path, "selfie"),
+    )
+
+
+async def _run_blocking(func, *args):
+    """Executa uma função bloqueante (disco/CPU) no executor padrão."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, func, *args)
+
+
+async def annotate_applicant(client, doc_path, comp_path, cache=None):
+    """
+    Anota CNH (OCR + rosto) e comprovante (OCR) numa única chamada assíncrona.
+
+    Args:
+        client: ImageAnnotatorAsyncClient (ou um fake compatível).
+        doc_path: Caminho da imagem da CNH.
+        comp_path: Caminho da imagem do comprovante de endereço.
+        cache: VisionCache opcional para reaproveitar respostas anteriores.
+
+    Returns:
+        tuple: (resposta da CNH, resposta do comprovante).
+    """
+    # leitura, cache (SQLite) e redução das imagens fora do loop de eventos
+    entries = [
+        await _run_blocking(prepare_annotation, path, features, cache)
+        for path, features in (
+            (doc_path, FEATURES_DOCUMENTO), (comp_path, FEATURES_TEXTO)
+        )
+    ]
+
+    pending = [entry for entry in entries if entry[1] is not None]
+    if pending:
+        record_annotation_call(pending)
+        with telemetry.timed("vision_annotate"):
+            batch = await client.batch_annotate_images(
+                requests=[entry[1] for entry in pending]
+            )
+        await _run_blocking(
+            store_annotations, pending, batch.responses, cache
+        )
+
+    return entries[0][3], entries[1][3]
+
+
+async def process_applicant(client, applicant_id, doc_path, comp_path,
+                            selfie_path, out_dir, threshold: float = 0.7,
+                            cache=None, gate: bool = True):
+    """
+    Executa o pipeline completo (OCR, rosto e comparação) de um candidato.
+
+    Args:
+        client: ImageAnnotatorAsyncClient (ou um fake compatível).
+        applicant_id: Identificador do candidato (usado no nome do recorte).
+        doc_path: Caminho da imagem da CNH.
+        comp_path: Caminho da imagem do comprovante de endereço.
+        selfie_path: Caminho da selfie.
+        out_dir: Pasta onde o rosto recortado da CNH é salvo (None não
+            grava nada em disco).
+        threshold (float): Similaridade mínima aceita.
+        cache: VisionCache opcional para reaproveitar respostas anteriores.
+        gate (bool): Triagem local das imagens antes do Vision; imagens
+            reprovadas levantam QualityGateError sem chamar a API.
+
+    Returns:
+        dict: Resultado consolidado do candidato.
+    """
+    if gate:
+        # imagens giradas (EXIF) seguem corrigidas, em bytes
+        doc_path, comp_path, selfie_path = await _run_blocking(
+            _prescreen_triple, doc_path, comp_path, selfie_path
+        )
+
+    doc_response, comp_response = await annotate_applicant(
+        client, doc_path, comp_path, cache
+    )
+    doc_text = text_from_response(doc_response)
+    comp_text = text_from_response(comp_response)
+
+    # rosto recortado em memória; gravado só se houver pasta de saída
+    face_file = None
+    if out_dir is not None:
+        face_file = str(Path(out_dir) / f"face_{applicant_id}.jpg")
+    face_from_doc = await _run_blocking(
+        extract_face, None, doc_path, doc_response
+    )
+    if face_from_doc is not None and face_file is not None:
+        await _run_blocking(face_from_doc.save, face_file)
+
+    match, similarity = False, 0.0
+    if face_from_doc is not None:
+        match, similarity = await _run_blocking(
+            compare_faces, selfie_path, face_from_doc, threshold
+        )
+
+    return {
+        "id": applicant_id,
+        "face_match": bool(match),
+        "similaridade": float(round(similarity, 3)),
+        "threshold_utilizado": threshold,
+        "documento_extraido": str(doc_text),
+        "comprovante_extraido": str(comp_text),
+        **validate_documents(doc_text, comp_text),
+    }
+
+
+async def _safe_process(client, applicant_id, triple, out_dir, threshold,
+                        cache, gate=True):
+    """Processa um candidato devolvendo o erro no resultado em vez de propagar."""
+    doc_path, comp_path, selfie_path = triple
+    try:
+        return await process_applicant(
+            client, applicant_id, doc_path, comp_path, selfie_path,
+            out_dir, threshold, cache, gate,
+        )
+    except Exception as e:
+        return {"id": applicant_id, "erro": str(e)}
+
+
+async def _aiter(items):
+    """Aceita tanto iteráveis comuns quanto assíncronos."""
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def run_pipeline(client, triples, out_dir=None,
+                       concurrency: int = 8, threshold: float = 0.7,
+                       cache=None, gate: bool = True):
+    """
+    Processa muitos candidatos mantendo até `concurrency` em andamento.
+
+    Os resultados são emitidos conforme cada candidato termina (não na
+    ordem de entrada), e a entrada é consumida aos poucos, então a memória
+    não cresce com o tamanho do lote.
+
+    Args:
+        client: ImageAnnotatorAsyncClient (ou um fake compatível).
+        triples: Iterável (síncrono ou assíncrono) de tuplas
+            (documento, comprovante, selfie) ou (id, (documento,
+            comprovante, selfie)).
+        out_dir: Pasta onde os rostos recortados são salvos (opcional;
+            por padrão nada é gravado em disco).
+        concurrency (int): Máximo de candidatos em processamento simultâneo.
+        threshold (float): Similaridade mínima aceita.
+        cache: VisionCache opcional para reaproveitar respostas anteriores.
+        gate (bool): Triagem local das imagens antes do Vision.
+
+    Yields:
+        dict: Resultado de cada candidato assim que fica pronto.
+    """
+    if out_dir is not None:
+        Path(out_dir).mkdir(parents=True, exist_ok=True)
+    running = set()
+    index = 0
+
+    try:
+        async for item in _aiter(triples):
+            if len(item) == 2:
+                applicant_id, triple = item
+            else:
+                applicant_id, triple = index, item
+            index += 1
+
+            running.add(asyncio.ensure_future(_safe_process(
+                client, applicant_id, triple, out_dir, threshold, cache, gate
+            )))
+            if len(running) >= concurrency:
+                done, running = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+
+        while running:
+            done, running = await asyncio.wait(
+                running, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                yield task.result()
+    finally:
+        # consumidor parou antes do fim (break, aclose, erro): cancela os
+        # candidatos em andamento em vez de deixá-los chamando o Vision
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
@@ -0,0 +1,99 @@
+import io
+
+from PIL import Image
+
+# valores de vision.Feature.Type (mesmos de utils)
+FACE_DETECTION = 1
+TEXT_DETECTION = 5
+
+# perfis de envio: lado máximo em pixels e qualidade do JPEG
+# OCR precisa de mais resolução que a detecção facial
+UPLOAD_PROFILES = {
+    "ocr": {"max_side": 2048, "quality": 90},
+    "face": {"max_side": 1024, "quality": 85},
+}
+
+# abaixo deste tamanho o arquivo original é enviado sem reprocessar
+MIN_BYTES_TO_REENCODE = 256 * 1024
+
+
+def profile_for(features) -> dict:
+    """
+    Escolhe o perfil de envio a partir das features pedidas.
+
+    Pedidos com OCR usam o perfil "ocr" (o mais exigente), inclusive a
+    chamada combinada OCR + rosto; só rosto usa o perfil "face".
+    """
+    if TEXT_DETECTION in features:
+        return UPLOAD_PROFILES["ocr"]
+    return UPLOAD_PROFILES["face"]
+
+
+def prepare_upload(content: bytes, features):
+    """
+    Reduz e recodifica uma imagem antes do envio ao Google Vision.
+
+    A imagem é reduzida até o lado máximo do perfil e salva como JPEG com
+    a qualidade do perfil. Se o resultado não for menor que o original, o
+    original é mantido.
+
+    Args:
+        content (bytes): Bytes originais da imagem.
+        features: Features pedidas (definem o perfil).
+
+    Returns:
+        tuple: (bytes para envio, escala_x, escala_y), onde a escala
+            converte coordenadas da imagem enviada para a original.
+    """
+    profile = profile_for(features)
+    max_side = profile["max_side"]
+
+    img = Image.open(io.BytesIO(content))
+    width, height = img.size
+    if len(content) < MIN_BYTES_TO_REENCODE and max(width, height) <= max_side:
+        return content, 1.0, 1.0
+
+    # draft permite ao decodificador JPEG já ler numa escala reduzida
+    img.draft("RGB", (max_side, max_side))
+    img = img.convert("RGB")
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=profile["quality"], optimize=True)
+    data = buffer.getvalue()
+    if len(data) >= len(content):
+        return content, 1.0, 1.0
+
+    return data, width / img.width, height / img.height
+
+
+def _scale_poly(poly, scale_x: float, scale_y: float):
+    for vertex in poly.vertices:
+        vertex.x = int(round(vertex.x * scale_x))
+        vertex.y = int(round(vertex.y * scale_y))
+
+
+def remap_response(response, scale_x: float, scale_y: float):
+    """
+    Converte as coordenadas de uma resposta para a resolução original.
+
+    Ajusta os bounding_poly de rostos e textos (in place), para que o
+    recorte do rosto seja feito na imagem original em qualidade total.
+
+    Args:
+        response: AnnotateImageResponse da imagem reduzida.
+        scale_x (float): Fator horizontal (original / enviada).
+        scale_y (float): Fator vertical (original / enviada).
+
+    Returns:
+        AnnotateImageResponse: A própria resposta, já ajustada.
+    """
+    if scale_x == 1.0 and scale_y == 1.0:
+        return response
+
+    for face in response.face_annotations:
+        _scale_poly(face.bounding_poly, scale_x, scale_y)
+        _scale_poly(face.fd_bounding_poly, scale_x, scale_y)
+    for text in response.text_annotations:
+        _scale_poly(text.bounding_poly, scale_x, scale_y)
+    return response
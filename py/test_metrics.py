@@ -1,24 +1,23 @@
 import os
 import sys
-import json
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 from pathlib import Path
 from google.cloud import vision
 from google.oauth2 import service_account
-from sklearn.metrics import (
-    accuracy_score,
-    precision_score,
-    recall_score,
-    f1_score,
-    confusion_matrix,
-)
 
 # Importa funções utilitárias
 BASE_DIR = Path(__file__).resolve().parent.parent
 sys.path.append(str(BASE_DIR / "src"))
-from utils import extract_text, compare_faces, extract_face_and_save
+from fields import validate_documents
+from face_hash import face_similarity_matrix, hash_faces
+from results_store import ResultsStore
+from vision_cache import VisionCache
+from utils import (
+    FEATURES_DOCUMENTO,
+    FEATURES_TEXTO,
+    batch_annotate,
+    extract_face,
+    extract_text,
+)
 
 # Configuração de credenciais
 SERVICE_ACCOUNT_FILE = BASE_DIR / "cred" / "dts-10-ds-32748754226a.json"
@@ -39,28 +38,50 @@ selfies = {
 out_dir = BASE_DIR / "outputs"
 out_dir.mkdir(parents=True, exist_ok=True)
 
+# cache das respostas do Vision (evita reprocessar as mesmas imagens)
+cache = VisionCache(BASE_DIR / ".cache" / "vision.sqlite")
+
 # OCR (CNH e Comprovante)
+print("Anotando CNH e comprovante...")
+responses = dict(batch_annotate(
+    client,
+    [(str(doc_path), FEATURES_DOCUMENTO), (str(comp_path), FEATURES_TEXTO)],
+    cache=cache,
+))
+
 print("Extraindo OCR da CNH...")
-doc_text = extract_text(client, str(doc_path))
+doc_text = extract_text(client, str(doc_path), responses[str(doc_path)])
 
 print("Extraindo OCR do comprovante...")
-comp_text = extract_text(client, str(comp_path))
+comp_text = extract_text(client, str(comp_path), responses[str(comp_path)])
 
 print("Extraindo rosto da CNH...")
-face_from_doc = extract_face_and_save(
-    client, str(doc_path), str(out_dir / "face_doc.jpg")
-)
+# rosto recortado em memória (sem gravar e reler o arquivo)
+face_from_doc = extract_face(client, str(doc_path), responses[str(doc_path)])
+
+# Campos da CNH e do comprovante (nome, CPF, endereço) extraídos do OCR
+campos = validate_documents(doc_text, comp_text)
+
+THRESHOLD = 0.90  # limite mínimo de similaridade
+
+# Hashes calculados uma vez por imagem; similaridades de todas as selfies
+# contra o rosto da CNH numa única operação vetorizada
+selfie_hashes = hash_faces(str(info["path"]) for info in selfies.values())
+doc_hashes = hash_faces([face_from_doc])
+scores = face_similarity_matrix(selfie_hashes, doc_hashes)[:, 0]
+
+# histórico de resultados (SQLite só de inserção)
+store = ResultsStore(out_dir / "resultados.sqlite")
 
 # Loop de testes
 y_true, y_pred = [], []
-THRESHOLD = 0.90  # limite mínimo de similaridade
 
-for nome, info in selfies.items():
+for (nome, info), score in zip(selfies.items(), scores):
     selfie_path = info["path"]
     label = info["label"]
 
     print(f"\n=== Rodando teste para {nome} ===")
-    match, score = compare_faces(str(selfie_path), str(face_from_doc))
+    score = float(score)
 
     # aplica threshold manual
     face_valid = score >= THRESHOLD
@@ -70,24 +91,34 @@ for nome, info in selfies.items():
     else:
         print(f"{nome} → Face não compatível. Similaridade: {score:.3f}")
 
-    # salvar resultado
+    # salvar resultado no histórico
     resultado = {
-        "nome": nome,
-        "label_real": label,
-        "predicao": int(face_valid),
+        **campos,
+        "label": label,
+        "face_match": face_valid,
         "similaridade": round(score, 3),
+        "threshold_utilizado": THRESHOLD,
         "documento_extraido": doc_text,
         "comprovante_extraido": comp_text,
     }
-
-    json_file = out_dir / f"results_{nome}.json"
-    with open(json_file, "w", encoding="utf-8") as f:
-        json.dump(resultado, f, ensure_ascii=False, indent=4)
+    store.append(resultado, applicant_id=nome, source="test_metrics")
 
     y_true.append(label)
     y_pred.append(int(face_valid))
 
-# Métricas
+store.close()
+print(f"Resultados gravados em {store.path.resolve()}")
+
+# Métricas (pandas e sklearn importados só aqui, onde são usados)
+import pandas as pd
+from sklearn.metrics import (
+    accuracy_score,
+    precision_score,
+    recall_score,
+    f1_score,
+    confusion_matrix,
+)
+
 acc = accuracy_score(y_true, y_pred)
 prec = precision_score(y_true, y_pred, zero_division=0)
 rec = recall_score(y_true, y_pred, zero_division=0)
@@ -99,6 +130,13 @@ print(f"Precisão  : {prec:.2f}")
 print(f"Recall    : {rec:.2f}")
 print(f"F1-Score  : {f1:.2f}")
 
+# Todos os limiares de uma vez sobre os mesmos scores (sem novas chamadas à
+# API); para calibrar com muitos pares use evaluation.py
+from evaluation import equal_error_rate, sweep
+
+eer, eer_threshold = equal_error_rate(sweep(scores, y_true))
+print(f"EER       : {eer:.2f} (limiar {eer_threshold:.3f})")
+
 metrics_file = out_dir / "metrics_summary.csv"
 df_metrics = pd.DataFrame([{
     "acuracia": acc,
@@ -109,7 +147,10 @@ df_metrics = pd.DataFrame([{
 df_metrics.to_csv(metrics_file, index=False, encoding="utf-8-sig")
 print(f"Métricas salvas em {metrics_file.resolve()}")
 
-# Matriz de confusão
+# Matriz de confusão (matplotlib/seaborn importados só aqui)
+import matplotlib.pyplot as plt
+import seaborn as sns
+
 cm = confusion_matrix(y_true, y_pred)
 labels = ["Inválido", "Válido"]
 
@@ -0,0 +1,216 @@
+"""
+Triagem local das imagens antes de qualquer chamada ao Google Vision.
+
+Cada imagem é medida numa versão reduzida em tons de cinza (o JPEG já é
+decodificado em escala menor), com operações vetorizadas do NumPy:
+
+- resolução da imagem original;
+- nitidez: variância do Laplaciano (imagens borradas têm variância baixa);
+- exposição: brilho médio e fração de pixels estourados/escuros;
+- contraste: desvio padrão (imagens em branco ou uniformes);
+- orientação do EXIF, corrigida automaticamente.
+
+Imagens que não passam levantam QualityGateError com os motivos, e a
+chamada ao Vision (e a cota) é poupada. A triagem leva poucos
+milissegundos por imagem.
+"""
+import io
+
+import numpy as np
+from PIL import Image, ImageOps
+
+import telemetry
+
+GATE = "validacao_triagem_total"
+
+# lado da versão reduzida usada nas medidas
+ANALYSIS_SIDE = 512
+
+# tag EXIF de orientação (1 = normal)
+EXIF_ORIENTATION = 0x0112
+
+# limites por tipo de imagem
+GATE_PROFILES = {
+    "documento": {
+        "min_side": 400,
+        "min_sharpness": 20.0,
+        "min_brightness": 35.0,
+        "max_brightness": 240.0,
+        "max_clipped": 0.6,
+        "min_contrast": 10.0,
+    },
+    "comprovante": {
+        "min_side": 400,
+        "min_sharpness": 20.0,
+        "min_brightness": 35.0,
+        "max_brightness": 245.0,
+        "max_clipped": 0.9,
+        "min_contrast": 8.0,
+    },
+    "selfie": {
+        "min_side": 120,
+        "min_sharpness": 10.0,
+        "min_brightness": 35.0,
+        "max_brightness": 235.0,
+        "max_clipped": 0.6,
+        "min_contrast": 10.0,
+    },
+}
+
+
+class QualityGateError(Exception):
+    """Imagem reprovada na triagem local (ver `reasons`)."""
+
+    def __init__(self, kind: str, reasons):
+        self.kind = kind
+        self.reasons = list(reasons)
+        super().__init__(f"{kind} reprovado na triagem: " + "; ".join(reasons))
+
+
+def _open(image):
+    """
+    Abre a imagem sem decodificar (caminho, bytes, np.ndarray ou PIL.Image).
+
+    Returns:
+        tuple: (PIL.Image, própria) — própria é False quando a imagem é do
+            chamador e não pode ser alterada (ex.: draft).
+    """
+    if isinstance(image, Image.Image):
+        return image, False
+    if hasattr(image, "__array_interface__"):
+        return Image.fromarray(image), True
+    if isinstance(image, (bytes, bytearray)):
+        return Image.open(io.BytesIO(image)), True
+    return Image.open(image), True
+
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """Variância do Laplaciano (4 vizinhos) de uma imagem em tons de cinza."""
+    g = gray.astype(np.float32)
+    lap = (
+        g[1:-1, :-2] + g[1:-1, 2:] + g[:-2, 1:-1] + g[2:, 1:-1]
+        - 4.0 * g[1:-1, 1:-1]
+    )
+    return float(lap.var())
+
+
+def measure(image) -> dict:
+    """
+    Mede resolução, nitidez, exposição e orientação de uma imagem.
+
+    Args:
+        image: Caminho, bytes, np.ndarray ou PIL.Image.
+
+    Returns:
+        dict: largura, altura, nitidez, brilho, contraste, escuros e
+            claros (frações de pixels), orientacao (tag EXIF).
+    """
+    img, owned = _open(image)
+    width, height = img.size
+    orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+
+    # decodificação já reduzida (JPEG) só em imagens abertas aqui: o draft
+    # encolheria no lugar a imagem do chamador (mesmo cuidado de
+    # face_hash.normalize_image); as medidas saem sempre de uma cópia
+    if owned and img.format == "JPEG":
+        img.draft("L", (ANALYSIS_SIDE, ANALYSIS_SIDE))
+    gray = img.convert("L")
+    if gray is img:
+        gray = img.copy()
+    gray.thumbnail(
+        (ANALYSIS_SIDE, ANALYSIS_SIDE), Image.BILINEAR, reducing_gap=2.0
+    )
+    g = np.asarray(gray)
+
+    return {
+        "largura": width,
+        "altura": height,
+        "nitidez": laplacian_variance(g),
+        "brilho": float(g.mean()),
+        "contraste": float(g.std()),
+        "escuros": float((g <= 10).mean()),
+        "claros": float((g >= 245).mean()),
+        "orientacao": int(orientation),
+    }
+
+
+def screen(image, kind: str = "documento", profile: dict = None) -> dict:
+    """
+    Avalia a imagem contra os limites do tipo.
+
+    Args:
+        image: Caminho, bytes, np.ndarray ou PIL.Image.
+        kind (str): "documento", "comprovante" ou "selfie".
+        profile (dict): Limites próprios (padrão: GATE_PROFILES[kind]).
+
+    Returns:
+        dict: Medidas de measure() mais "motivos" (lista) e "aprovada".
+    """
+    limits = profile or GATE_PROFILES[kind]
+    report = measure(image)
+    reasons = []
+
+    if min(report["largura"], report["altura"]) < limits["min_side"]:
+        reasons.append(
+            f"resolução baixa ({report['largura']}x{report['altura']}, "
+            f"mínimo {limits['min_side']} px)"
+        )
+    if report["contraste"] < limits["min_contrast"]:
+        reasons.append(
+            f"imagem em branco ou uniforme (contraste "
+            f"{report['contraste']:.1f})"
+        )
+    elif report["nitidez"] < limits["min_sharpness"]:
+        reasons.append(
+            f"imagem borrada (nitidez {report['nitidez']:.1f}, "
+            f"mínimo {limits['min_sharpness']})"
+        )
+    if (report["brilho"] < limits["min_brightness"]
+            or report["escuros"] > limits["max_clipped"]):
+        reasons.append(f"imagem escura (brilho {report['brilho']:.0f})")
+    elif (report["brilho"] > limits["max_brightness"]
+            or report["claros"] > limits["max_clipped"]):
+        reasons.append(
+            f"imagem superexposta (brilho {report['brilho']:.0f})"
+        )
+
+    report["motivos"] = reasons
+    report["aprovada"] = not reasons
+    return report
+
+
+def fix_orientation(image) -> bytes:
+    """Aplica a orientação do EXIF e devolve a imagem em JPEG."""
+    img = ImageOps.exif_transpose(_open(image)[0]).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def prescreen(image, kind: str = "documento", profile: dict = None):
+    """
+    Triagem de uma imagem antes do envio ao Vision.
+
+    Args:
+        image: Caminho, bytes, np.ndarray ou PIL.Image.
+        kind (str): "documento", "comprovante" ou "selfie".
+        profile (dict): Limites próprios (padrão: GATE_PROFILES[kind]).
+
+    Returns:
+        A própria imagem, ou bytes JPEG já na orientação correta quando o
+        EXIF indicava rotação.
+
+    Raises:
+        QualityGateError: Se a imagem não passar nos limites.
+    """
+    with telemetry.timed("triagem"):
+        report = screen(image, kind, profile)
+    if not report["aprovada"]:
+        telemetry.inc(GATE, tipo=kind, resultado="reprovada")
+        raise QualityGateError(kind, report["motivos"])
+
+    if report["orientacao"] != 1:
+        telemetry.inc(GATE, tipo=kind, resultado="corrigida")
+        return fix_orientation(image)
+    telemetry.inc(GATE, tipo=kind, resultado="aprovada")
+    return image
@@ -0,0 +1,334 @@
+"""
+Histórico de resultados das verificações num banco SQLite (WAL).
+
+Cada verificação vira uma linha numa tabela só de inserção (UPDATE e
+DELETE são bloqueados por triggers), com índices por candidato, CPF,
+data e decisão. O texto do OCR não é repetido em cada linha: fica
+comprimido (zlib) numa tabela própria, uma vez por conteúdo, e as linhas
+guardam só o hash.
+
+Consultas de auditoria, por exemplo todas as rejeições de um CPF desde
+o início do mês:
+
+    python results_store.py --cpf 123.456.789-09 --decisao rejeitado \\
+        --desde 2026-10-01
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+APPROVED = "aprovado"
+REJECTED = "rejeitado"
+ERROR = "erro"
+
+# colunas próprias; os demais campos do resultado vão para "campos" (JSON)
+_COLUMNS = (
+    "face_match",
+    "similaridade",
+    "threshold_utilizado",
+    "nome_valido",
+    "cpf_valido",
+    "label",
+    "erro",
+)
+_BOOLEANS = ("face_match", "nome_valido", "cpf_valido")
+_TEXTS = ("documento_extraido", "comprovante_extraido")
+
+
+def decision_of(result: dict) -> str:
+    """Decisão da verificação: aprovado (rosto e nome conferem),
+    rejeitado ou erro."""
+    if result.get("erro"):
+        return ERROR
+    if result.get("face_match") and result.get("nome_valido"):
+        return APPROVED
+    return REJECTED
+
+
+def _timestamp(value):
+    """Converte datetime, data ISO ("2026-10-01") ou epoch em epoch."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+class ResultsStore:
+    """
+    Resultados de verificação gravados em lotes num arquivo SQLite.
+
+    Exemplo:
+        with ResultsStore("outputs/resultados.sqlite") as store:
+            store.append(resultado, applicant_id="123", source="main")
+        rejeicoes = list(store.query(cpf="12345678909", decision="rejeitado"))
+    """
+
+    def __init__(self, path="outputs/resultados.sqlite",
+                 batch_size: int = 500):
+        """
+        Args:
+            path: Caminho do arquivo SQLite.
+            batch_size (int): Resultados acumulados antes de cada gravação.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS textos ("
+            " hash TEXT PRIMARY KEY,"
+            " texto BLOB NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS resultados ("
+            " id INTEGER PRIMARY KEY,"
+            " criado_em REAL NOT NULL,"
+            " candidato TEXT,"
+            " cpf TEXT,"
+            " decisao TEXT NOT NULL,"
+            " origem TEXT,"
+            " face_match INTEGER,"
+            " similaridade REAL,"
+            " threshold_utilizado REAL,"
+            " nome_valido INTEGER,"
+            " cpf_valido INTEGER,"
+            " label INTEGER,"
+            " erro TEXT,"
+            " documento_texto TEXT REFERENCES textos (hash),"
+            " comprovante_texto TEXT REFERENCES textos (hash),"
+            " campos TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_resultados_candidato"
+            " ON resultados (candidato, criado_em);"
+            "CREATE INDEX IF NOT EXISTS idx_resultados_cpf"
+            " ON resultados (cpf, criado_em);"
+            "CREATE INDEX IF NOT EXISTS idx_resultados_criado_em"
+            " ON resultados (criado_em);"
+            "CREATE INDEX IF NOT EXISTS idx_resultados_decisao"
+            " ON resultados (decisao, criado_em);"
+            # histórico só de inserção
+            "CREATE TRIGGER IF NOT EXISTS resultados_sem_update"
+            " BEFORE UPDATE ON resultados"
+            " BEGIN SELECT RAISE(ABORT, 'resultados são só de inserção'); END;"
+            "CREATE TRIGGER IF NOT EXISTS resultados_sem_delete"
+            " BEFORE DELETE ON resultados"
+            " BEGIN SELECT RAISE(ABORT, 'resultados são só de inserção'); END;"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _cpf_key(cpf):
+        """CPF só com dígitos (formatos diferentes caem no mesmo índice)."""
+        if not cpf:
+            return None
+        return "".join(c for c in str(cpf) if c.isdigit()) or None
+
+    def append(self, result: dict, applicant_id=None, source: str = None,
+               timestamp: float = None):
+        """
+        Acrescenta um resultado (gravado no próximo flush).
+
+        Args:
+            result (dict): Resultado no formato do pipeline (face_match,
+                similaridade, documento_extraido, campos de
+                validate_documents...).
+            applicant_id: Id do candidato (padrão: result["id"]).
+            source (str): Origem do resultado (ex.: "main", "cli").
+            timestamp (float): Epoch da verificação (padrão: agora).
+        """
+        with self._lock:
+            self._pending.append((
+                dict(result),
+                applicant_id if applicant_id is not None else result.get("id"),
+                source,
+                timestamp if timestamp is not None else time.time(),
+            ))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        """Grava os resultados pendentes numa única transação."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+
+        texts, rows = {}, []
+        for result, applicant_id, source, timestamp in self._pending:
+            decision = decision_of(result)
+            hashes = []
+            for field in _TEXTS:
+                text = result.pop(field, None)
+                if text is None:
+                    hashes.append(None)
+                    continue
+                digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                texts.setdefault(digest, text)
+                hashes.append(digest)
+
+            columns = [result.pop(c, None) for c in _COLUMNS]
+            result.pop("id", None)
+            rows.append((
+                timestamp,
+                None if applicant_id is None else str(applicant_id),
+                self._cpf_key(result.get("documento_cpf")),
+                decision,
+                source,
+                *columns,
+                *hashes,
+                json.dumps(result, ensure_ascii=False),
+            ))
+
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO textos (hash, texto) VALUES (?, ?)",
+                (
+                    (digest, zlib.compress(text.encode("utf-8")))
+                    for digest, text in texts.items()
+                ),
+            )
+            self._conn.executemany(
+                "INSERT INTO resultados (criado_em, candidato, cpf, decisao,"
+                " origem, face_match, similaridade, threshold_utilizado,"
+                " nome_valido, cpf_valido, label, erro, documento_texto,"
+                " comprovante_texto, campos)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        self._pending = []
+
+    def text(self, digest: str):
+        """Texto do OCR guardado com o hash `digest` (ou None)."""
+        row = self._conn.execute(
+            "SELECT texto FROM textos WHERE hash = ?", (digest,)
+        ).fetchone()
+        return None if row is None else zlib.decompress(row[0]).decode("utf-8")
+
+    def query(self, applicant_id=None, cpf=None, decision: str = None,
+              since=None, until=None, limit: int = None,
+              with_text: bool = False):
+        """
+        Consulta o histórico pelos campos indexados.
+
+        Args:
+            applicant_id: Id do candidato.
+            cpf: CPF (com ou sem pontuação).
+            decision (str): "aprovado", "rejeitado" ou "erro".
+            since: Início do período (epoch, datetime ou data ISO).
+            until: Fim do período, exclusivo (mesmos formatos).
+            limit (int): Máximo de linhas.
+            with_text (bool): Inclui o texto completo do OCR.
+
+        Yields:
+            dict: Resultado com candidato, criado_em, decisao, origem e os
+                campos originais, do mais recente para o mais antigo.
+        """
+        self.flush()
+        where, params = [], []
+        if applicant_id is not None:
+            where.append("candidato = ?")
+            params.append(str(applicant_id))
+        if cpf is not None:
+            where.append("cpf = ?")
+            params.append(self._cpf_key(cpf))
+        if decision is not None:
+            where.append("decisao = ?")
+            params.append(decision)
+        if since is not None:
+            where.append("criado_em >= ?")
+            params.append(_timestamp(since))
+        if until is not None:
+            where.append("criado_em < ?")
+            params.append(_timestamp(until))
+
+        sql = (
+            "SELECT criado_em, candidato, decisao, origem, "
+            + ", ".join(_COLUMNS)
+            + ", documento_texto, comprovante_texto, campos FROM resultados"
+        )
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY criado_em DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
+        for row in self._conn.execute(sql, params).fetchall():
+            created_at, applicant, decision_, source = row[:4]
+            result = {
+                "candidato": applicant,
+                "criado_em": created_at,
+                "decisao": decision_,
+                "origem": source,
+            }
+            result.update(zip(_COLUMNS, row[4:4 + len(_COLUMNS)]))
+            for field in _BOOLEANS:
+                if result[field] is not None:
+                    result[field] = bool(result[field])
+            doc_hash, comp_hash, fields = row[4 + len(_COLUMNS):]
+            result.update(json.loads(fields))
+            if with_text:
+                result["documento_extraido"] = self.text(doc_hash)
+                result["comprovante_extraido"] = self.text(comp_hash)
+            else:
+                result["documento_texto"] = doc_hash
+                result["comprovante_texto"] = comp_hash
+            yield result
+
+    def __len__(self):
+        self.flush()
+        (count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM resultados"
+        ).fetchone()
+        return count
+
+    def close(self):
+        """Grava o que estiver pendente e fecha a conexão."""
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Consulta o histórico de verificações."
+    )
+    parser.add_argument("db", nargs="?", default="outputs/resultados.sqlite",
+                        help="arquivo SQLite dos resultados")
+    parser.add_argument("--candidato", help="id do candidato")
+    parser.add_argument("--cpf", help="CPF (com ou sem pontuação)")
+    parser.add_argument("--decisao", choices=(APPROVED, REJECTED, ERROR))
+    parser.add_argument("--desde", help="data inicial (ISO, ex.: 2026-10-01)")
+    parser.add_argument("--ate", help="data final, exclusiva (ISO)")
+    parser.add_argument("--limite", type=int, help="máximo de linhas")
+    parser.add_argument("--texto", action="store_true",
+                        help="inclui o texto completo do OCR")
+    args = parser.parse_args(argv)
+
+    with ResultsStore(args.db) as store:
+        for result in store.query(
+            args.candidato, args.cpf, args.decisao, args.desde, args.ate,
+            args.limite, args.texto,
+        ):
+            print(json.dumps(result, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
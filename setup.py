@@ -7,6 +7,27 @@ setup(
     author="Rafael Gallo",
     author_email="seu_email@example.com",  # substitua pelo seu
     packages=find_packages(),
+    py_modules=[
+        "cli",
+        "utils",
+        "vision_cache",
+        "vision_fake",
+        "pipeline_async",
+        "face_hash",
+        "face_index",
+        "fields",
+        "telemetry",
+        "preprocess",
+        "evaluation",
+        "face_detect",
+        "vision_scheduler",
+        "job_queue",
+        "results_store",
+        "documents",
+        "stage_graph",
+        "checkpoint",
+        "quality_gate",
+    ],
     install_requires=[
         "opencv-python",
         "numpy",
@@ -15,7 +36,18 @@ setup(
         "google-cloud-vision",
         "google-auth",
         "google-auth-oauthlib",
-        "google-auth-httplib2"
+        "google-auth-httplib2",
+        "Pillow",
+        "ImageHash",
     ],
+    extras_require={
+        # comprovantes em PDF (ver documents.py)
+        "pdf": ["pypdfium2"],
+    },
+    entry_points={
+        "console_scripts": [
+            "validar-lote=cli:main",
+        ],
+    },
     python_requires=">=3.8",
 )
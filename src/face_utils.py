@@ -1,16 +1,43 @@
-import face_recognition
-import cv2
+import io
+import os
+import json
+import numpy as np
 
-def compare_faces_embeddings(img1_path: str, img2_path: str, tolerance: float = 0.6):
+# face_recognition (dlib) é importado sob demanda: carregá-lo custa segundos
+# e só é necessário quando embeddings são realmente calculados
+
+
+def load_rgb_array(image) -> np.ndarray:
+    """
+    Converte uma imagem para array RGB uint8, decodificando uma única vez.
+    Aceita caminho, bytes, PIL.Image ou np.ndarray (devolvido como está).
+    """
+    if isinstance(image, np.ndarray):
+        return image
+
+    from PIL import Image
+
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert("RGB"))
+    if isinstance(image, (bytes, bytearray)):
+        image = io.BytesIO(image)
+    with Image.open(image) as img:
+        return np.asarray(img.convert("RGB"))
+
+
+def compare_faces_embeddings(img1, img2, tolerance: float = 0.6):
     """
     Compara duas imagens usando embeddings faciais (face_recognition).
     Retorna (match, distance).
+    - img1/img2: caminho, bytes, PIL.Image ou np.ndarray RGB.
     - Quanto menor a distância, mais parecidas são as faces.
     - tolerance padrão = 0.6 (valor recomendado pela lib).
     """
-    # Carregar imagens
-    img1 = face_recognition.load_image_file(img1_path)
-    img2 = face_recognition.load_image_file(img2_path)
+    import face_recognition
+
+    # Decodificar imagens (uma vez cada; arrays passam direto)
+    img1 = load_rgb_array(img1)
+    img2 = load_rgb_array(img2)
 
     # Extrair embeddings
     enc1 = face_recognition.face_encodings(img1)
@@ -23,3 +50,216 @@ def compare_faces_embeddings(img1_path: str, img2_path: str, tolerance: float =
     dist = face_recognition.face_distance([enc1[0]], enc2[0])[0]
 
     return dist <= tolerance, float(dist)
+
+
+class FaceGallery:
+    """
+    Galeria de embeddings faciais (128-d) calculados uma única vez.
+
+    Os embeddings ficam em `<prefixo>.npy` (float32, aberto via memmap) e os
+    ids em `<prefixo>.ids.json`, na mesma ordem. Consultas 1:1 e 1:N usam
+    uma única multiplicação matriz-vetor:
+    ||a - b||² = ||a||² + ||b||² - 2 a·b
+    """
+
+    # bytes de cada embedding no .npy
+    ROW_BYTES = 128 * 4
+
+    def __init__(self, prefix: str):
+        self.prefix = str(prefix)
+        self.npy_path = self.prefix + ".npy"
+        self.ids_path = self.prefix + ".ids.json"
+        self.ids = []
+        self.encodings = np.empty((0, 128), dtype=np.float32)
+        self._pending_ids = []
+        self._pending = []
+        self._pending_index = {}
+
+        if os.path.exists(self.npy_path) and os.path.exists(self.ids_path):
+            with open(self.ids_path, "r", encoding="utf-8") as f:
+                self.ids = json.load(f)
+            # linhas além dos ids (gravação interrompida) são ignoradas
+            self.encodings = np.load(self.npy_path, mmap_mode="r")[
+                :len(self.ids)
+            ]
+
+        self._index = {face_id: i for i, face_id in enumerate(self.ids)}
+        self._norms = np.einsum("ij,ij->i", self.encodings, self.encodings)
+
+    def __len__(self):
+        return len(self.ids) + len(self._pending_ids)
+
+    def __contains__(self, face_id):
+        return face_id in self._index or face_id in self._pending_index
+
+    def _all_ids(self):
+        """Ids salvos seguidos dos pendentes (ordem de distances())."""
+        return self.ids + self._pending_ids
+
+    def _encoding_of(self, face_id):
+        """Embedding cadastrado (o pendente mais recente tem prioridade)."""
+        if face_id in self._pending_index:
+            return self._pending[self._pending_index[face_id]]
+        return np.asarray(self.encodings[self._index[face_id]])
+
+    @staticmethod
+    def encode(img_path):
+        """
+        Calcula o embedding do primeiro rosto da imagem.
+        Aceita caminho, bytes, PIL.Image ou np.ndarray RGB.
+        Retorna um vetor float32 (128,) ou None se não houver rosto.
+        """
+        import face_recognition
+
+        image = load_rgb_array(img_path)
+        encodings = face_recognition.face_encodings(image)
+        if not encodings:
+            return None
+        return np.asarray(encodings[0], dtype=np.float32)
+
+    def add(self, face_id: str, img_path=None, encoding=None):
+        """
+        Adiciona um rosto à galeria (a partir da imagem ou do embedding).
+        Retorna False se nenhum rosto foi encontrado.
+        - As inclusões só vão para o disco em save().
+        """
+        if encoding is None:
+            encoding = self.encode(img_path)
+        if encoding is None:
+            return False
+
+        self._pending_index[face_id] = len(self._pending)
+        self._pending_ids.append(face_id)
+        self._pending.append(np.asarray(encoding, dtype=np.float32))
+        return True
+
+    def _append_npy(self, rows: np.ndarray) -> bool:
+        """
+        Acrescenta linhas ao .npy existente, atualizando só o cabeçalho.
+        Retorna False se o cabeçalho não comporta o novo shape.
+        """
+        fmt = np.lib.format
+        with open(self.npy_path, "r+b") as f:
+            version = fmt.read_magic(f)
+            header_start = f.tell()
+            if version == (1, 0):
+                fmt.read_array_header_1_0(f)
+                length_bytes = 2
+            else:
+                fmt.read_array_header_2_0(f)
+                length_bytes = 4
+            data_offset = f.tell()
+
+            total = len(self.ids) + len(rows)
+            header = repr({
+                "descr": "<f4", "fortran_order": False, "shape": (total, 128),
+            })
+            space = data_offset - header_start - length_bytes
+            if len(header) + 1 > space:
+                return False
+
+            # dados primeiro, cabeçalho depois: uma queda no meio deixa o
+            # arquivo com o shape antigo (linhas extras são ignoradas)
+            f.seek(data_offset + len(self.ids) * self.ROW_BYTES)
+            f.write(rows.tobytes())
+            f.truncate()
+            f.flush()
+            f.seek(header_start + length_bytes)
+            f.write(header.ljust(space - 1).encode("latin1") + b"\n")
+        return True
+
+    def _append_ids(self, new_ids):
+        """Acrescenta ids ao fim da lista JSON sem reescrever o arquivo."""
+        tail = json.dumps(new_ids, ensure_ascii=False)[1:].encode("utf-8")
+        with open(self.ids_path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            if self.ids:
+                tail = b", " + tail
+            f.write(tail)
+
+    def save(self):
+        """
+        Grava embeddings e ids pendentes, reabrindo a matriz via memmap.
+        - Só as linhas novas são escritas (o .npy e a lista de ids crescem
+          no fim), então cada inclusão não custa O(N).
+        """
+        if not self._pending:
+            return
+
+        rows = np.ascontiguousarray(np.stack(self._pending), dtype="<f4")
+        self.encodings = None
+        exists = os.path.exists(self.npy_path) and os.path.exists(
+            self.ids_path
+        )
+        if not (exists and self._append_npy(rows)):
+            # primeira gravação (ou cabeçalho sem espaço): arquivo completo
+            old = np.load(self.npy_path, mmap_mode="r")[:len(self.ids)] \
+                if exists else np.empty((0, 128), dtype=np.float32)
+            tmp_path = self.prefix + ".tmp.npy"
+            np.save(tmp_path, np.concatenate([old, rows]))
+            del old
+            os.replace(tmp_path, self.npy_path)
+            exists = False
+
+        if exists:
+            self._append_ids(self._pending_ids)
+        else:
+            with open(self.ids_path, "w", encoding="utf-8") as f:
+                json.dump(self.ids + self._pending_ids, f, ensure_ascii=False)
+
+        for face_id in self._pending_ids:
+            self._index[face_id] = len(self.ids)
+            self.ids.append(face_id)
+        self._norms = np.concatenate(
+            [self._norms, np.einsum("ij,ij->i", rows, rows)]
+        )
+        self._pending_ids, self._pending, self._pending_index = [], [], {}
+        self.encodings = np.load(self.npy_path, mmap_mode="r")
+
+    def distances(self, encoding) -> np.ndarray:
+        """
+        Distância euclidiana do embedding para todos os rostos (salvos e
+        pendentes, na ordem de ids + pendentes).
+        """
+        encoding = np.asarray(encoding, dtype=np.float32)
+        sq = self._norms + encoding @ encoding - 2.0 * (self.encodings @ encoding)
+        if self._pending:
+            pending = np.stack(self._pending)
+            diff = pending - encoding
+            sq = np.concatenate([sq, np.einsum("ij,ij->i", diff, diff)])
+        return np.sqrt(np.maximum(sq, 0.0))
+
+    def verify(self, face_id: str, img_path=None, encoding=None,
+               tolerance: float = 0.6):
+        """
+        Compara 1:1 um rosto com o cadastrado em `face_id`.
+        Retorna (match, distance), no mesmo formato de compare_faces_embeddings.
+        """
+        if encoding is None:
+            encoding = self.encode(img_path)
+        if encoding is None or face_id not in self:
+            return False, 1.0
+
+        ref = self._encoding_of(face_id)
+        dist = float(np.linalg.norm(ref - np.asarray(encoding, np.float32)))
+        return dist <= tolerance, dist
+
+    def search(self, img_path=None, encoding=None,
+               tolerance: float = 0.6, top_k: int = 5):
+        """
+        Busca 1:N os rostos mais próximos.
+        Retorna lista de (id, distance) com distance <= tolerance.
+        """
+        if encoding is None:
+            encoding = self.encode(img_path)
+        if encoding is None or not len(self):
+            return []
+
+        ids = self._all_ids()
+        dist = self.distances(encoding)
+        k = min(top_k, len(dist))
+        best = np.argpartition(dist, k - 1)[:k]
+        best = best[np.argsort(dist[best])]
+        return [
+            (ids[i], float(dist[i])) for i in best if dist[i] <= tolerance
+        ]
@@ -1,12 +1,20 @@
 import os
-import json
-import pandas as pd
 from pathlib import Path
 from google.cloud import vision
 from google.oauth2 import service_account
 
 # Importa funções do utils.py
-from utils import extract_text, compare_faces, extract_face_and_save
+from fields import validate_documents
+from results_store import ResultsStore
+from face_hash import face_similarity_matrix, hash_faces
+from vision_cache import VisionCache
+from utils import (
+    FEATURES_DOCUMENTO,
+    FEATURES_TEXTO,
+    batch_annotate,
+    extract_face,
+    extract_text,
+)
 
 # Configuração de credenciais
 SERVICE_ACCOUNT_FILE = (
@@ -32,24 +40,47 @@ selfies = {
 out_dir = BASE_DIR / "outputs"
 out_dir.mkdir(parents=True, exist_ok=True)
 
+# cache das respostas do Vision (evita reprocessar as mesmas imagens)
+cache = VisionCache(BASE_DIR / ".cache" / "vision.sqlite")
+
 # OCR (CNH e Comprovante - comum para ambos)
+print("Anotando CNH e comprovante...")
+responses = dict(batch_annotate(
+    client,
+    [(str(doc_path), FEATURES_DOCUMENTO), (str(comp_path), FEATURES_TEXTO)],
+    cache=cache,
+))
+
 print("Extraindo OCR da CNH...")
-doc_text = extract_text(client, str(doc_path))
+doc_text = extract_text(client, str(doc_path), responses[str(doc_path)])
 
 print("Extraindo OCR do Comprovante...")
-comp_text = extract_text(client, str(comp_path))
+comp_text = extract_text(client, str(comp_path), responses[str(comp_path)])
 
 print("Extraindo rosto da CNH...")
-face_from_doc = extract_face_and_save(
-    client, str(doc_path), str(out_dir / "face_doc.jpg")
-)
+# rosto recortado em memória (sem gravar e reler o arquivo)
+face_from_doc = extract_face(client, str(doc_path), responses[str(doc_path)])
+
+# Campos da CNH e do comprovante (nome, CPF, endereço) extraídos do OCR
+campos = validate_documents(doc_text, comp_text)
+
+# Hashes calculados uma vez por imagem; similaridades de todas as selfies
+# contra o rosto da CNH numa única operação vetorizada
+THRESHOLD = 0.75
+selfie_hashes = hash_faces(str(p) for p in selfies.values())
+doc_hashes = hash_faces([face_from_doc])
+scores = face_similarity_matrix(selfie_hashes, doc_hashes)[:, 0]
+
+# histórico de resultados (SQLite só de inserção)
+store = ResultsStore(out_dir / "resultados.sqlite")
 
 # Loop de testes (LUIZ e MARIA)
-for nome, selfie_path in selfies.items():
+for (nome, selfie_path), score in zip(selfies.items(), scores):
     print(f"\n=== Rodando teste para {nome} ===")
     print(f"Selfie: {selfie_path}")
 
-    match, score = compare_faces(str(selfie_path), str(face_from_doc))
+    score = float(score)
+    match = score >= THRESHOLD
 
     if match:
         print(f"{nome} → Face compatível! Similaridade: {score:.3f}")
@@ -58,28 +89,15 @@ for nome, selfie_path in selfies.items():
 
     # Resultado estruturado
     resultado = {
-        "documento_nome": "LUIZ ANTONIO DE OLIVEIRA",
-        "documento_cpf": "076.763.758-51",
-        "comprovante_nome": "LUIZ ANTONIO DE OLIVEIRA",
-        "comprovante_endereco": "R JOSE BASILIO GAMA 65, JACAREI/SP",
+        **campos,
         "face_match": bool(match),
         "similaridade": float(round(score, 3)),
         "documento_extraido": str(doc_text),
         "comprovante_extraido": str(comp_text),
-        "nome_valido": bool("LUIZ ANTONIO DE OLIVEIRA" in comp_text),
     }
 
-    # Salvar JSON
-    json_file = out_dir / f"results_{nome}.json"
-    with open(json_file, "w", encoding="utf-8") as f:
-        json.dump(resultado, f, ensure_ascii=False, indent=4)
-    print(f"JSON salvo em {json_file.resolve()}")
-
-    # Salvar CSV
-    csv_file = out_dir / f"results_{nome}.csv"
-    pd.DataFrame([resultado]).to_csv(
-        csv_file, index=False, encoding="utf-8-sig"
-    )
-    print(f"CSV salvo em {csv_file.resolve()}")
+    store.append(resultado, applicant_id=nome, source="test_cases")
 
+store.close()
+print(f"Resultados gravados em {store.path.resolve()}")
 print("\nTestes concluídos com sucesso.")
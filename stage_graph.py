@@ -0,0 +1,215 @@
+"""
+Verificação de um candidato como um grafo de etapas concorrentes.
+
+Cada etapa é uma função e a lista das etapas de que depende; run_stages
+executa num pool de threads tudo o que já tem as entradas prontas, então
+etapas independentes (OCR da CNH, OCR do comprovante, decodificação da
+CNH e hash da selfie) rodam ao mesmo tempo e as dependentes começam assim
+que suas entradas terminam. O tempo de um candidato fica perto do da
+chamada mais lenta ao Vision, em vez da soma das etapas.
+
+Exemplo:
+
+    outputs = verify(client, "cnh.jpg", "comprovante.pdf", "selfie.png")
+    outputs["resultado"]["face_match"]
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import telemetry
+from utils import (
+    FACE_DETECTION,
+    FEATURES_DOCUMENTO,
+    FEATURES_TEXTO,
+    annotate_image,
+    extract_text,
+    face_box_from_response,
+    load_image,
+    text_from_response,
+)
+
+
+def run_stages(stages: dict, executor=None, max_workers: int = None) -> dict:
+    """
+    Executa um grafo de etapas respeitando as dependências.
+
+    Args:
+        stages (dict): nome -> (função, [dependências]). A função recebe os
+            resultados das dependências, na ordem da lista.
+        executor: ThreadPoolExecutor reaproveitado entre chamadas (opcional).
+        max_workers (int): Threads do pool criado quando não há executor
+            (padrão: uma por etapa).
+
+    Returns:
+        dict: Resultado de cada etapa, por nome.
+
+    Raises:
+        Exception: O erro da primeira etapa que falhar (as dependentes
+            não são executadas).
+    """
+    for name, (_, deps) in stages.items():
+        for dep in deps:
+            if dep not in stages:
+                raise Exception(f"Etapa {name}: dependência desconhecida {dep}")
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers or len(stages) or 1)
+
+    def run(name, func, args):
+        with telemetry.timed(f"etapa_{name}"):
+            return func(*args)
+
+    results, running = {}, {}
+    waiting = dict(stages)
+    try:
+        while waiting or running:
+            for name, (func, deps) in list(waiting.items()):
+                if all(dep in results for dep in deps):
+                    args = [results[dep] for dep in deps]
+                    running[executor.submit(run, name, func, args)] = name
+                    del waiting[name]
+            if not running:
+                raise Exception(
+                    f"Dependências circulares entre etapas: {sorted(waiting)}"
+                )
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+    except BaseException:
+        for future in running:
+            future.cancel()
+        raise
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False)
+    return results
+
+
+def verification_stages(client, doc, comp, selfie, threshold: float = 0.7,
+                        cache=None, detector=None) -> dict:
+    """
+    Monta o grafo de etapas da verificação de um candidato.
+
+    Args:
+        client: Cliente do Google Vision (de preferência um
+            ScheduledVisionClient, pois as etapas chamam a API em paralelo).
+        doc: CNH (caminho ou bytes).
+        comp: Comprovante (caminho ou bytes, imagem ou PDF).
+        selfie: Selfie (caminho, bytes, np.ndarray ou PIL.Image).
+        threshold (float): Similaridade mínima aceita.
+        cache: VisionCache opcional.
+        detector: Detector local de rosto (opcional; ver face_detect). Com
+            ele a CNH vai ao Vision só para OCR.
+
+    Returns:
+        dict: Etapas no formato de run_stages; "resultado" é o dict final
+            (mesmas chaves de job_queue.process_job) e "face" o rosto
+            recortado da CNH (PIL.Image ou None).
+    """
+    from documents import extract_document_text, is_pdf
+    from face_hash import face_similarity_matrix, hash_faces
+    from fields import extract_cnh_fields, validate_documents
+
+    doc_features = FEATURES_TEXTO if detector else FEATURES_DOCUMENTO
+
+    def doc_response():
+        return annotate_image(client, doc, doc_features, cache)
+
+    def face_box(response, image):
+        if detector is None:
+            return face_box_from_response(response)
+        detection = detector.detect(image)
+        if detection is not None:
+            return detection[0]
+        # fallback: FACE_DETECTION do Vision só para esta CNH
+        return face_box_from_response(
+            annotate_image(client, doc, (FACE_DETECTION,), cache)
+        )
+
+    def face(box, image):
+        return image.crop(box) if box else None
+
+    def compare(face_image, selfie_hashes):
+        if face_image is None:
+            return False, 0.0
+        try:
+            score = float(face_similarity_matrix(
+                selfie_hashes, hash_faces([face_image])
+            )[0, 0])
+        except Exception as e:
+            # mesmo tratamento de utils.compare_faces
+            telemetry.inc(telemetry.ERRORS, etapa="face_compare")
+            print(f"Erro na comparação: {e}")
+            return False, 0.0
+        return score >= threshold, score
+
+    def result(comparison, doc_text, comp_text, fields, box):
+        match, score = comparison
+        return {
+            "face_match": bool(match),
+            "similaridade": float(round(score, 3)),
+            "documento_extraido": str(doc_text),
+            "comprovante_extraido": str(comp_text),
+            # nome, CPF e endereço extraídos do OCR + validação do nome
+            **fields,
+            "face_box": list(box) if box else None,
+        }
+
+    stages = {
+        "doc_response": (doc_response, []),
+        "doc_image": (lambda: load_image(doc), []),
+        "selfie_hashes": (lambda: hash_faces([selfie]), []),
+        "doc_text": (text_from_response, ["doc_response"]),
+        "face_box": (face_box, ["doc_response", "doc_image"]),
+        "face": (face, ["face_box", "doc_image"]),
+        "comparison": (compare, ["face", "selfie_hashes"]),
+        "fields": (validate_documents, ["doc_text", "comp_text"]),
+        "resultado": (
+            result,
+            ["comparison", "doc_text", "comp_text", "fields", "face_box"],
+        ),
+    }
+
+    if is_pdf(comp):
+        # PDF: páginas lidas até achar o nome da CNH e o endereço
+        stages["comp_text"] = (
+            lambda doc_text: extract_document_text(
+                client, comp, extract_cnh_fields(doc_text)["nome"],
+                cache=cache,
+            ),
+            ["doc_text"],
+        )
+    else:
+        stages["comp_text"] = (
+            lambda: extract_text(client, comp, cache=cache), []
+        )
+    return stages
+
+
+def verify(client, doc, comp, selfie, threshold: float = 0.7, cache=None,
+           detector=None, executor=None) -> dict:
+    """
+    Verifica um candidato executando as etapas em paralelo.
+
+    Args:
+        client: Cliente do Google Vision.
+        doc: CNH (caminho ou bytes).
+        comp: Comprovante (caminho ou bytes, imagem ou PDF).
+        selfie: Selfie (caminho, bytes, np.ndarray ou PIL.Image).
+        threshold (float): Similaridade mínima aceita.
+        cache: VisionCache opcional.
+        detector: Detector local de rosto (opcional).
+        executor: ThreadPoolExecutor reaproveitado entre candidatos.
+
+    Returns:
+        dict: Resultado de todas as etapas; os principais são "resultado",
+            "face" e "doc_image".
+    """
+    return run_stages(
+        verification_stages(
+            client, doc, comp, selfie, threshold, cache, detector
+        ),
+        executor,
+    )
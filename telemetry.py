@@ -0,0 +1,240 @@
+"""
+Métricas internas do pipeline (latência por etapa, chamadas ao Vision,
+bytes enviados, acertos de cache e erros).
+
+Desativadas por padrão: nesse caso cada chamada de instrumentação é só um
+teste de booleano. Ative com `telemetry.enable()` ou com a variável de
+ambiente PIPELINE_METRICS=1, e exporte com `snapshot()` (JSON) ou
+`to_prometheus()` (formato texto do Prometheus).
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+
+# limites dos histogramas (segundos e bytes)
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+BYTES_BUCKETS = (
+    16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2,
+    10 * 1024 ** 2, 20 * 1024 ** 2,
+)
+
+STAGE_SECONDS = "validacao_etapa_segundos"
+UPLOAD_BYTES = "validacao_upload_bytes"
+VISION_CALLS = "validacao_vision_chamadas_total"
+VISION_IMAGES = "validacao_vision_imagens_total"
+CACHE_LOOKUPS = "validacao_cache_total"
+ERRORS = "validacao_erros_total"
+
+
+class _Histogram:
+    """Histograma cumulativo no formato do Prometheus."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Pares (limite, contagem acumulada), terminando em +Inf."""
+        total, pairs = 0, []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class _Timer:
+    """Mede o tempo de um bloco e registra no histograma de etapas."""
+
+    __slots__ = ("registry", "labels", "start")
+
+    def __init__(self, registry, labels):
+        self.registry = registry
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(
+            STAGE_SECONDS, time.perf_counter() - self.start, **self.labels
+        )
+        if exc_type is not None:
+            self.registry.inc(ERRORS, **self.labels)
+        return False
+
+
+class _NoopTimer:
+    """Contexto vazio usado quando as métricas estão desativadas."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopTimer()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Registry:
+    """Contadores e histogramas do processo, protegidos por lock."""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Soma `value` ao contador `name` (com os rótulos dados)."""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS,
+                **labels):
+        """Registra uma observação no histograma `name`."""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def timed(self, stage: str):
+        """Contexto que mede a duração da etapa (e conta erros)."""
+        if not self.enabled:
+            return _NOOP
+        return _Timer(self, {"etapa": stage})
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> dict:
+        """
+        Retorna o estado atual das métricas como dicionário (JSON).
+
+        Returns:
+            dict: {"contadores": [...], "histogramas": [...]}.
+        """
+        with self._lock:
+            counters = [
+                {"nome": name, "rotulos": dict(labels), "valor": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {
+                    "nome": name,
+                    "rotulos": dict(labels),
+                    "contagem": h.count,
+                    "soma": h.sum,
+                    "buckets": {
+                        ("+Inf" if b == float("inf") else str(b)): c
+                        for b, c in h.cumulative()
+                    },
+                }
+                for (name, labels), h in sorted(self._histograms.items())
+            ]
+        return {"contadores": counters, "histogramas": histograms}
+
+    def to_prometheus(self) -> str:
+        """Exporta as métricas no formato texto do Prometheus."""
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} counter")
+                    seen.add(name)
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+            for (name, labels), h in sorted(self._histograms.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} histogram")
+                    seen.add(name)
+                for bound, count in h.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(
+                        f"{name}_bucket"
+                        f"{_format_labels(labels, [('le', le)])} {count}"
+                    )
+                lines.append(f"{name}_sum{_format_labels(labels)} {h.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry(enabled=os.environ.get("PIPELINE_METRICS") == "1")
+
+
+def enable():
+    REGISTRY.enabled = True
+
+
+def disable():
+    REGISTRY.enabled = False
+
+
+def inc(name: str, value: float = 1, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+
+def observe(name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+    REGISTRY.observe(name, value, buckets, **labels)
+
+
+def timed(stage: str):
+    return REGISTRY.timed(stage)
+
+
+def instrument(stage: str):
+    """Decorador que mede cada chamada da função como a etapa `stage`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not REGISTRY.enabled:
+                return func(*args, **kwargs)
+            with REGISTRY.timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> dict:
+    return REGISTRY.snapshot()
+
+
+def to_prometheus() -> str:
+    return REGISTRY.to_prometheus()
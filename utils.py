@@ -1,77 +1,462 @@
 import io
-from google.cloud import vision
 from PIL import Image
-import imagehash
 
+import telemetry
+from preprocess import prepare_upload, remap_response
 
-def extract_text(client, image_path: str) -> str:
+# google.cloud.vision (gRPC) e imagehash são importados sob demanda dentro
+# das funções, para que execuções que não usam a API não paguem o custo
+
+
+# valores de vision.Feature.Type (evita importar o Vision só pelas constantes)
+FACE_DETECTION = 1
+TEXT_DETECTION = 5
+
+# features pedidas numa única chamada para a CNH (OCR + rosto)
+FEATURES_DOCUMENTO = (TEXT_DETECTION, FACE_DETECTION)
+FEATURES_TEXTO = (TEXT_DETECTION,)
+
+# limites por requisição do batch_annotate_images
+MAX_BATCH_IMAGES = 16
+MAX_BATCH_BYTES = 10 * 1024 * 1024
+
+
+# códigos google.rpc.Code que valem uma nova tentativa
+RETRYABLE_CODES = frozenset({
+    4,   # DEADLINE_EXCEEDED
+    8,   # RESOURCE_EXHAUSTED (cota)
+    10,  # ABORTED
+    13,  # INTERNAL
+    14,  # UNAVAILABLE
+})
+RESOURCE_EXHAUSTED = 8
+
+
+class VisionAPIError(Exception):
+    """Erro devolvido pelo Google Vision para uma imagem ou chamada."""
+
+    def __init__(self, message: str, code: int = 0):
+        super().__init__(message)
+        self.code = code
+
+    @property
+    def retryable(self) -> bool:
+        """True se o erro é transitório (cota, indisponibilidade, prazo)."""
+        return self.code in RETRYABLE_CODES
+
+
+def check_response(response):
     """
-    Extrai texto de uma imagem usando Google Cloud Vision OCR.
+    Levanta VisionAPIError se a resposta do Vision contém erro.
+
+    Args:
+        response: AnnotateImageResponse.
+
+    Returns:
+        AnnotateImageResponse: A própria resposta, se não houver erro.
+    """
+    if response.error.message or response.error.code:
+        raise VisionAPIError(
+            response.error.message or f"erro {response.error.code}",
+            response.error.code,
+        )
+    return response
+
+
+def _build_request(content: bytes, features):
+    """Monta a requisição de anotação para um único conteúdo de imagem."""
+    from google.cloud import vision
+
+    return vision.AnnotateImageRequest(
+        image=vision.Image(content=content),
+        features=[vision.Feature(type_=f) for f in features],
+    )
+
+
+def _prepare_request(content: bytes, features, preprocess: bool = True):
+    """
+    Monta a requisição, reduzindo a imagem antes do envio se pedido.
+
+    Returns:
+        tuple: (requisição, escala_x, escala_y) para remapear a resposta.
+    """
+    scale_x = scale_y = 1.0
+    if preprocess:
+        content, scale_x, scale_y = prepare_upload(content, features)
+    return _build_request(content, features), scale_x, scale_y
+
+
+def load_image(image) -> Image.Image:
+    """
+    Decodifica uma imagem uma única vez.
+
+    Args:
+        image: Caminho, bytes, np.ndarray ou PIL.Image (devolvida como está).
+
+    Returns:
+        PIL.Image: Imagem já carregada em memória.
+    """
+    if isinstance(image, Image.Image):
+        return image
+    if hasattr(image, "__array_interface__"):
+        return Image.fromarray(image)
+
+    if isinstance(image, (bytes, bytearray)):
+        img = Image.open(io.BytesIO(image))
+    else:
+        img = Image.open(image)
+    img.load()
+    return img
+
+
+def _read_content(image) -> bytes:
+    """Devolve os bytes da imagem (já em memória ou lidos do caminho)."""
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+
+    # imagens já decodificadas são codificadas só para o envio
+    if isinstance(image, Image.Image) or hasattr(image, "__array_interface__"):
+        buffer = io.BytesIO()
+        load_image(image).convert("RGB").save(buffer, format="JPEG", quality=95)
+        return buffer.getvalue()
+
+    with io.open(image, "rb") as f:
+        return f.read()
+
+
+def prepare_annotation(image, features, cache=None, preprocess: bool = True):
+    """
+    Consulta o cache e, se não houver resposta, monta a requisição.
+
+    Etapa comum a batch_annotate e ao pipeline assíncrono (bloqueante: lê
+    o arquivo, consulta o SQLite do cache e reduz a imagem).
+
+    Args:
+        image: Caminho, bytes, np.ndarray ou PIL.Image.
+        features: Features pedidas.
+        cache: VisionCache opcional.
+        preprocess (bool): Reduz a imagem antes do envio.
+
+    Returns:
+        list: [imagem, requisição, chave, resposta, escala]; requisição é
+            None quando a resposta veio do cache.
+    """
+    content = _read_content(image)
+
+    key, response = None, None
+    if cache is not None:
+        key = cache.make_key(content, features)
+        response = cache.get(key)
+        telemetry.inc(
+            telemetry.CACHE_LOOKUPS,
+            resultado="hit" if response is not None else "miss",
+        )
+    if response is not None:
+        return [image, None, key, response, None]
+
+    request, scale_x, scale_y = _prepare_request(content, features, preprocess)
+    return [image, request, key, None, (scale_x, scale_y)]
+
+
+def record_annotation_call(entries):
+    """Conta uma chamada ao Vision com as requisições pendentes dadas."""
+    if not telemetry.REGISTRY.enabled:
+        return
+    telemetry.inc(telemetry.VISION_CALLS)
+    telemetry.inc(telemetry.VISION_IMAGES, len(entries))
+    for entry in entries:
+        telemetry.observe(
+            telemetry.UPLOAD_BYTES,
+            len(entry[1].image.content),
+            telemetry.BYTES_BUCKETS,
+        )
+
+
+def store_annotations(entries, responses, cache=None):
+    """
+    Preenche as entradas com as respostas do Vision.
+
+    As coordenadas são remapeadas para a resolução original, erros por
+    imagem são contados e as respostas vão para o cache (bloqueante).
+
+    Args:
+        entries: Entradas pendentes de prepare_annotation.
+        responses: AnnotateImageResponse de cada entrada, na mesma ordem.
+        cache: VisionCache opcional.
+    """
+    for entry, image_response in zip(entries, responses):
+        entry[3] = remap_response(image_response, *entry[4])
+        if image_response.error.code:
+            telemetry.inc(telemetry.ERRORS, etapa="vision_resposta")
+        if cache is not None:
+            cache.put(entry[2], image_response)
+
+
+def _iter_batches(items, features, max_images: int, max_bytes: int, cache,
+                  preprocess: bool = True):
+    """
+    Agrupa imagens em lotes respeitando os limites por requisição.
+
+    Cada item pode ser um caminho (ou bytes da imagem) ou uma tupla
+    (caminho, features). Itens
+    encontrados no cache entram no lote já com a resposta preenchida e
+    não contam para os limites. Com preprocess, os limites valem para os
+    bytes já reduzidos.
+
+    Yields:
+        list: Lista de [caminho, requisição, chave, resposta, escala] na
+            ordem de entrada; requisição é None para itens vindos do cache.
+    """
+    batch, batch_images, batch_bytes = [], 0, 0
+    for item in items:
+        if isinstance(item, tuple):
+            image_path, item_features = item
+        else:
+            image_path, item_features = item, features
+
+        entry = prepare_annotation(
+            image_path, item_features, cache, preprocess
+        )
+        if entry[1] is None:
+            batch.append(entry)
+            continue
+
+        size = len(entry[1].image.content)
+        if batch_images and (
+            batch_images >= max_images or batch_bytes + size > max_bytes
+        ):
+            yield batch
+            batch, batch_images, batch_bytes = [], 0, 0
+
+        batch.append(entry)
+        batch_images += 1
+        batch_bytes += size
+
+    if batch:
+        yield batch
+
+
+def batch_annotate(
+    client,
+    image_paths,
+    features=FEATURES_DOCUMENTO,
+    max_images: int = MAX_BATCH_IMAGES,
+    max_bytes: int = MAX_BATCH_BYTES,
+    cache=None,
+    preprocess: bool = True,
+):
+    """
+    Anota várias imagens agrupando-as em chamadas batch_annotate_images.
+
+    Args:
+        client: Cliente autenticado do Google Vision.
+        image_paths: Caminhos (ou bytes) das imagens ou tuplas
+            (caminho, features).
+        features: Features usadas para itens sem features próprias.
+        max_images (int): Máximo de imagens por requisição.
+        max_bytes (int): Máximo de bytes de imagem por requisição.
+        cache: VisionCache opcional; respostas em cache não vão à API.
+        preprocess (bool): Reduz e recodifica as imagens antes do envio
+            (ver preprocess.prepare_upload). As coordenadas das respostas
+            são sempre devolvidas na resolução original, então o recorte
+            do rosto continua sendo feito na imagem em qualidade total.
+
+    Yields:
+        tuple: (caminho, AnnotateImageResponse) na ordem de entrada.
+    """
+    for batch in _iter_batches(
+        image_paths, features, max_images, max_bytes, cache, preprocess
+    ):
+        pending = [entry for entry in batch if entry[1] is not None]
+        if pending:
+            record_annotation_call(pending)
+            with telemetry.timed("vision_annotate"):
+                response = client.batch_annotate_images(
+                    requests=[entry[1] for entry in pending]
+                )
+            store_annotations(pending, response.responses, cache)
+
+        for image_path, _, _, image_response, _ in batch:
+            yield image_path, image_response
+
+
+def annotate_image(
+    client, image_path: str, features=FEATURES_DOCUMENTO, cache=None,
+    preprocess: bool = True,
+):
+    """
+    Executa OCR e detecção facial numa única chamada ao Google Vision.
 
     Args:
         client: Cliente autenticado do Google Vision.
         image_path (str): Caminho para a imagem de entrada.
+        features: Features pedidas (padrão: TEXT_DETECTION e FACE_DETECTION).
+        cache: VisionCache opcional para reaproveitar respostas anteriores.
+        preprocess (bool): Reduz a imagem antes do envio (ver
+            batch_annotate).
 
     Returns:
-        str: Texto extraído da imagem (ou string vazia se não houver texto).
+        AnnotateImageResponse: Resposta com todas as anotações pedidas.
     """
-    with io.open(image_path, "rb") as f:
-        content = f.read()
-    image = vision.Image(content=content)
+    _, response = next(batch_annotate(
+        client, [image_path], features, cache=cache, preprocess=preprocess
+    ))
+    return response
 
-    response = client.text_detection(image=image)
-    texts = response.text_annotations
 
-    if response.error.message:
-        raise Exception(response.error.message)
+def text_from_response(response) -> str:
+    """
+    Obtém o texto completo de uma resposta do Google Vision.
+
+    Args:
+        response: AnnotateImageResponse com TEXT_DETECTION.
 
+    Returns:
+        str: Texto extraído (ou string vazia se não houver texto).
+    """
+    check_response(response)
+
+    texts = response.text_annotations
     return texts[0].description if texts else ""
 
 
-def extract_face_and_save(client, image_path: str, output_file: str):
+def face_box_from_response(response):
+    """
+    Obtém a caixa do rosto principal de uma resposta do Google Vision.
+
+    Args:
+        response: AnnotateImageResponse com FACE_DETECTION.
+
+    Returns:
+        tuple | None: (x_min, y_min, x_max, y_max) ou None se não houver rosto.
+    """
+    faces = response.face_annotations
+    if not faces:
+        return None
+
+    vertices = faces[0].bounding_poly.vertices
+    return (
+        min(v.x for v in vertices),
+        min(v.y for v in vertices),
+        max(v.x for v in vertices),
+        max(v.y for v in vertices),
+    )
+
+
+def extract_text(client, image_path: str, response=None, cache=None) -> str:
     """
-    Extrai o rosto principal de um documento e salva em arquivo.
+    Extrai texto de uma imagem usando Google Cloud Vision OCR.
 
     Args:
         client: Cliente autenticado do Google Vision.
         image_path (str): Caminho para a imagem de entrada.
-        output_file (str): Caminho para salvar o rosto recortado.
+        response: Resposta já obtida via annotate_image/batch_annotate
+            (opcional; evita uma nova chamada à API).
+        cache: VisionCache opcional para reaproveitar respostas anteriores.
 
     Returns:
-        str | None: Caminho do arquivo salvo ou None se não detectar rosto.
+        str: Texto extraído da imagem (ou string vazia se não houver texto).
     """
-    with io.open(image_path, "rb") as f:
-        content = f.read()
-    image = vision.Image(content=content)
+    if response is None:
+        response = annotate_image(client, image_path, FEATURES_TEXTO, cache)
 
-    response = client.face_detection(image=image)
-    faces = response.face_annotations
+    return text_from_response(response)
 
-    if not faces:
-        print("Nenhum rosto detectado na imagem.")
+
+def crop_face(image, response):
+    """
+    Recorta o rosto principal a partir de uma resposta já obtida.
+
+    Args:
+        image: Caminho, bytes, np.ndarray ou PIL.Image do documento.
+        response: AnnotateImageResponse com FACE_DETECTION.
+
+    Returns:
+        PIL.Image | None: Rosto recortado ou None se não houver rosto.
+    """
+    box = face_box_from_response(response)
+    if box is None:
         return None
+    return load_image(image).crop(box)
+
+
+@telemetry.instrument("face_crop")
+def extract_face(client, image, response=None, cache=None, detector=None):
+    """
+    Extrai o rosto principal de um documento, em memória.
+
+    Args:
+        client: Cliente autenticado do Google Vision.
+        image: Caminho, bytes, np.ndarray ou PIL.Image do documento.
+        response: Resposta já obtida via annotate_image/batch_annotate
+            (opcional; evita uma nova chamada à API).
+        cache: VisionCache opcional para reaproveitar respostas anteriores.
+        detector: Detector local (ver face_detect), usado antes do Vision
+            quando não há resposta; o Vision só é chamado se ele não
+            encontrar rosto com confiança suficiente.
 
-    with Image.open(image_path) as pil_img:
-        face = faces[0]
-        x_min = min(v.x for v in face.bounding_poly.vertices)
-        y_min = min(v.y for v in face.bounding_poly.vertices)
-        x_max = max(v.x for v in face.bounding_poly.vertices)
-        y_max = max(v.y for v in face.bounding_poly.vertices)
+    Returns:
+        PIL.Image | None: Rosto recortado ou None se não detectar rosto.
+    """
+    if response is None and detector is not None:
+        decoded = load_image(image)
+        found = detector.detect(decoded)
+        if found is not None:
+            return decoded.crop(found[0])
 
-        face_crop = pil_img.crop((x_min, y_min, x_max, y_max))
-        face_crop.save(output_file)
+    if response is None:
+        response = annotate_image(client, image, (FACE_DETECTION,), cache)
+    check_response(response)
 
-        print(f"Rosto salvo em: {output_file}")
-        return output_file
+    face_crop = crop_face(image, response)
+    if face_crop is None:
+        print("Nenhum rosto detectado na imagem.")
+    return face_crop
 
 
-def compare_faces(img1_path: str, img2_path: str, threshold: float = 0.75):
+def extract_face_and_save(
+    client, image_path, output_file: str = None, response=None, cache=None,
+    detector=None,
+):
     """
-    Compara duas imagens faciais usando perceptual hash (pHash).
+    Extrai o rosto principal de um documento e, opcionalmente, salva.
 
     Args:
-        img1_path (str): Caminho da primeira imagem (selfie).
-        img2_path (str): Caminho da segunda imagem (rosto extraído da CNH).
+        client: Cliente autenticado do Google Vision.
+        image_path: Caminho, bytes, np.ndarray ou PIL.Image do documento.
+        output_file (str): Caminho para salvar o rosto recortado
+            (opcional; sem ele nada é gravado em disco).
+        response: Resposta já obtida via annotate_image/batch_annotate
+            (opcional; evita uma nova chamada à API).
+        cache: VisionCache opcional para reaproveitar respostas anteriores.
+        detector: Detector local opcional (ver extract_face).
+
+    Returns:
+        str | PIL.Image | None: Caminho do arquivo salvo (com output_file),
+            o rosto recortado (sem output_file) ou None se não detectar rosto.
+    """
+    face_crop = extract_face(client, image_path, response, cache, detector)
+    if face_crop is None or output_file is None:
+        return face_crop
+
+    face_crop.save(output_file)
+    print(f"Rosto salvo em: {output_file}")
+    return output_file
+
+
+@telemetry.instrument("face_compare")
+def compare_faces(img1, img2, threshold: float = 0.75):
+    """
+    Compara duas imagens faciais por hash perceptual.
+
+    Usa o método de face_hash.SCORING_METHOD: pHash, na escala dos
+    limiares do projeto, até que o ensemble (pHash, dHash, wHash e
+    colorhash) tenha pesos e limiar calibrados com evaluation.py.
+
+    Args:
+        img1: Primeira imagem (selfie): caminho, bytes, np.ndarray ou
+            PIL.Image.
+        img2: Segunda imagem (rosto extraído da CNH), nos mesmos formatos.
         threshold (float): Valor mínimo de similaridade aceitável (0 a 1).
 
     Returns:
@@ -79,15 +464,13 @@ def compare_faces(img1_path: str, img2_path: str, threshold: float = 0.75):
             match (bool): True se similaridade >= threshold.
             similaridade (float): Valor da similaridade (0 a 1).
     """
-    try:
-        hash1 = imagehash.phash(Image.open(img1_path))
-        hash2 = imagehash.phash(Image.open(img2_path))
-        diff = hash1 - hash2
-        similarity = 1 - (diff / 64.0)  # hash de 64 bits
+    from face_hash import compare_images
 
-        match = similarity >= threshold
-        return match, float(similarity)
+    try:
+        match, similarity = compare_images(img1, img2, threshold)
+        return bool(match), float(similarity)
 
     except Exception as e:
+        telemetry.inc(telemetry.ERRORS, etapa="face_compare")
         print(f"Erro na comparação: {e}")
         return False, 0.0
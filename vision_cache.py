@@ -0,0 +1,170 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class VisionCache:
+    """
+    Cache em disco (SQLite) para respostas do Google Vision.
+
+    A chave é o SHA-256 dos bytes da imagem somado às features pedidas,
+    então reenvios da mesma imagem não geram nova chamada à API. As
+    entradas menos usadas são removidas quando o tamanho total passa de
+    max_bytes, e entradas mais antigas que ttl segundos são ignoradas.
+    """
+
+    def __init__(
+        self,
+        path=".cache/vision.sqlite",
+        max_bytes: int = 512 * 1024 * 1024,
+        ttl: float = None,
+    ):
+        """
+        Args:
+            path: Caminho do arquivo SQLite do cache.
+            max_bytes (int): Tamanho máximo somado das respostas guardadas.
+            ttl (float): Validade das entradas em segundos (None = sem prazo).
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS respostas ("
+            " chave TEXT PRIMARY KEY,"
+            " resposta BLOB NOT NULL,"
+            " tamanho INTEGER NOT NULL,"
+            " criado_em REAL NOT NULL,"
+            " acessado_em REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_acessado_em"
+            " ON respostas (acessado_em)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(content: bytes, features) -> str:
+        """
+        Gera a chave do cache a partir dos bytes da imagem e das features.
+
+        Args:
+            content (bytes): Conteúdo bruto da imagem.
+            features: Tipos de feature pedidos ao Vision.
+
+        Returns:
+            str: Chave no formato "<sha256>:<FEATURE>+<FEATURE>".
+        """
+        from google.cloud import vision
+
+        digest = hashlib.sha256(content).hexdigest()
+        names = sorted(vision.Feature.Type(f).name for f in features)
+        return f"{digest}:{'+'.join(names)}"
+
+    def get(self, key: str):
+        """
+        Busca uma resposta no cache.
+
+        Args:
+            key (str): Chave gerada por make_key.
+
+        Returns:
+            AnnotateImageResponse | None: Resposta guardada ou None.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT resposta, criado_em FROM respostas WHERE chave = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            data, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._conn.execute(
+                    "DELETE FROM respostas WHERE chave = ?", (key,)
+                )
+                self._conn.commit()
+                return None
+
+            self._conn.execute(
+                "UPDATE respostas SET acessado_em = ? WHERE chave = ?",
+                (now, key),
+            )
+            self._conn.commit()
+
+        from google.cloud import vision
+
+        return vision.AnnotateImageResponse.deserialize(data)
+
+    def put(self, key: str, response):
+        """
+        Guarda uma resposta no cache e aplica a remoção por tamanho (LRU).
+
+        Respostas com erro não são guardadas.
+
+        Args:
+            key (str): Chave gerada por make_key.
+            response: AnnotateImageResponse a ser guardada.
+        """
+        if response.error.message or response.error.code:
+            return
+
+        from google.cloud import vision
+
+        data = vision.AnnotateImageResponse.serialize(response)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO respostas"
+                " (chave, resposta, tamanho, criado_em, acessado_em)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Remove as entradas menos usadas até caber em max_bytes."""
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(tamanho), 0) FROM respostas"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT chave, tamanho FROM respostas ORDER BY acessado_em"
+        )
+        expired = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            expired.append((key,))
+            total -= size
+
+        self._conn.executemany(
+            "DELETE FROM respostas WHERE chave = ?", expired
+        )
+
+    def clear(self):
+        """Remove todas as entradas do cache."""
+        with self._lock:
+            self._conn.execute("DELETE FROM respostas")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM respostas"
+            ).fetchone()
+        return count
+
+    def close(self):
+        """Fecha a conexão com o banco do cache."""
+        self._conn.close()
@@ -0,0 +1,276 @@
+import asyncio
+import collections
+import hashlib
+import json
+import random
+import threading
+import time
+from pathlib import Path
+
+from google.cloud import vision
+
+
+class FakeVisionClient:
+    """
+    Cliente local que imita o ImageAnnotatorClient sem acessar a rede.
+
+    Responde batch_annotate_images com um texto e uma caixa de rosto fixos
+    e pode injetar latência artificial por chamada, o que permite testar e
+    medir o pipeline sem credenciais do Google.
+    """
+
+    def __init__(self, text: str = "", face_box=(0, 0, 100, 100),
+                 latency: float = 0.0):
+        """
+        Args:
+            text (str): Texto devolvido para TEXT_DETECTION.
+            face_box (tuple | None): (x_min, y_min, x_max, y_max) devolvido
+                para FACE_DETECTION (None = nenhum rosto).
+            latency (float): Atraso em segundos aplicado a cada chamada.
+        """
+        self.text = text
+        self.face_box = face_box
+        self.latency = latency
+        self.calls = 0
+        self.images = 0
+
+    def _annotate(self, request) -> vision.AnnotateImageResponse:
+        """Monta a resposta falsa para uma única requisição."""
+        response = vision.AnnotateImageResponse()
+        types = {feature.type_ for feature in request.features}
+
+        if vision.Feature.Type.TEXT_DETECTION in types and self.text:
+            response.text_annotations.append(
+                vision.EntityAnnotation(description=self.text)
+            )
+
+        if vision.Feature.Type.FACE_DETECTION in types and self.face_box:
+            x_min, y_min, x_max, y_max = self.face_box
+            response.face_annotations.append(
+                vision.FaceAnnotation(
+                    bounding_poly=vision.BoundingPoly(vertices=[
+                        vision.Vertex(x=x_min, y=y_min),
+                        vision.Vertex(x=x_max, y=y_min),
+                        vision.Vertex(x=x_max, y=y_max),
+                        vision.Vertex(x=x_min, y=y_max),
+                    ]),
+                    detection_confidence=0.99,
+                )
+            )
+
+        return response
+
+    def _batch(self, requests) -> vision.BatchAnnotateImagesResponse:
+        self.calls += 1
+        self.images += len(requests)
+        return vision.BatchAnnotateImagesResponse(
+            responses=[self._annotate(r) for r in requests]
+        )
+
+    def batch_annotate_images(self, request=None, *, requests=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._batch(requests if requests is not None else request.requests)
+
+
+class FakeAsyncVisionClient(FakeVisionClient):
+    """
+    Versão assíncrona do FakeVisionClient (imita ImageAnnotatorAsyncClient).
+
+    Além das contagens de chamadas, registra o pico de requisições
+    simultâneas em max_in_flight.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def batch_annotate_images(self, request=None, *, requests=None,
+                                    **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return self._batch(
+                requests if requests is not None else request.requests
+            )
+        finally:
+            self.in_flight -= 1
+
+
+class FlakyVisionClient(FakeVisionClient):
+    """
+    Fake que imita a cota e as falhas transitórias do Vision.
+
+    Chamadas acima da cota (imagens por segundo numa janela de 1 s) ou da
+    concorrência máxima do "servidor" levantam 429 (TooManyRequests), e
+    cada imagem pode voltar com erro UNAVAILABLE com probabilidade
+    `error_rate`. Serve para testar o ScheduledVisionClient sem rede.
+    """
+
+    def __init__(self, *args, quota: float = 30.0, max_concurrency: int = 8,
+                 error_rate: float = 0.0, seed: int = 0, **kwargs):
+        """
+        Args:
+            quota (float): Imagens por segundo aceitas.
+            max_concurrency (int): Chamadas simultâneas aceitas.
+            error_rate (float): Probabilidade de erro UNAVAILABLE por imagem.
+            seed (int): Semente do gerador de erros.
+            *args, **kwargs: Repassados ao FakeVisionClient.
+        """
+        super().__init__(*args, **kwargs)
+        self.quota = quota
+        self.max_concurrency = max_concurrency
+        self.error_rate = error_rate
+        self.throttled = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._window = collections.deque()
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+    def _admit(self, images: int) -> bool:
+        """Aplica a cota e a concorrência; False = chamada recusada."""
+        with self._lock:
+            now = time.monotonic()
+            while self._window and self._window[0][0] <= now - 1.0:
+                self._window.popleft()
+            used = sum(n for _, n in self._window)
+            if (used + images > self.quota
+                    or self.in_flight >= self.max_concurrency):
+                self.throttled += 1
+                return False
+            self._window.append((now, images))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return True
+
+    def _annotate(self, request) -> vision.AnnotateImageResponse:
+        with self._lock:
+            failed = self._rng.random() < self.error_rate
+            self.errors += failed
+        if failed:
+            response = vision.AnnotateImageResponse()
+            response.error.code = 14  # UNAVAILABLE
+            response.error.message = "Serviço indisponível (simulado)."
+            return response
+        return super()._annotate(request)
+
+    def batch_annotate_images(self, request=None, *, requests=None, **kwargs):
+        from google.api_core import exceptions
+
+        requests = requests if requests is not None else request.requests
+        if not self._admit(len(requests)):
+            raise exceptions.TooManyRequests("Cota excedida (simulado).")
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            with self._lock:
+                self.calls += 1
+                self.images += len(requests)
+            return vision.BatchAnnotateImagesResponse(
+                responses=[self._annotate(r) for r in requests]
+            )
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class ReplayVisionClient(FakeVisionClient):
+    """
+    Cliente local que devolve respostas de fixtures (gravadas ou
+    sintéticas) no formato do Google Vision.
+
+    As respostas ficam em `<pasta>/<sha256 dos bytes enviados>.json` (os
+    bytes da requisição, já reduzidos por batch_annotate; ver
+    RecordingVisionClient), então benchmarks e testes rodam sem rede.
+    Só fixtures gravadas com RecordingVisionClient são respostas reais;
+    as de bench/fixtures são sintéticas (texto de
+    outputs/results_LUIZ.json, rostos do Haar com confiança fixa 0.9), e
+    medidas feitas com elas não refletem o comportamento do Vision.
+    Imagens sem fixture levantam KeyError, ou recebem a resposta
+    sintética do FakeVisionClient se strict=False.
+    """
+
+    def __init__(self, fixtures_dir, latency: float = 0.0,
+                 strict: bool = True):
+        """
+        Args:
+            fixtures_dir: Pasta com as fixtures.
+            latency (float): Atraso em segundos aplicado a cada chamada.
+            strict (bool): Se False, imagens sem gravação recebem a
+                resposta sintética em vez de erro.
+        """
+        super().__init__(latency=latency)
+        self.fixtures_dir = Path(fixtures_dir)
+        self.strict = strict
+        self._responses = {}
+        for fixture in sorted(self.fixtures_dir.glob("*.json")):
+            with open(fixture, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._responses[fixture.stem] = vision.AnnotateImageResponse.serialize(
+                vision.AnnotateImageResponse.from_json(
+                    json.dumps(data["resposta"]), ignore_unknown_fields=True
+                )
+            )
+
+    def __len__(self):
+        return len(self._responses)
+
+    def _annotate(self, request) -> vision.AnnotateImageResponse:
+        digest = hashlib.sha256(request.image.content).hexdigest()
+        if digest in self._responses:
+            return vision.AnnotateImageResponse.deserialize(
+                self._responses[digest]
+            )
+        if self.strict:
+            raise KeyError(f"sem resposta gravada para a imagem {digest}")
+        return super()._annotate(request)
+
+
+class RecordingVisionClient:
+    """
+    Envolve um cliente real e grava cada resposta para ReplayVisionClient.
+
+    Exemplo:
+        client = RecordingVisionClient(vision.ImageAnnotatorClient(),
+                                       "bench/fixtures")
+    """
+
+    def __init__(self, client, fixtures_dir):
+        self.client = client
+        self.fixtures_dir = Path(fixtures_dir)
+        self.fixtures_dir.mkdir(parents=True, exist_ok=True)
+        self._metadata = {}
+
+    def describe(self, content: bytes, **metadata):
+        """
+        Dados extras gravados junto com a resposta de uma imagem.
+
+        Args:
+            content (bytes): Bytes que serão enviados na requisição.
+            **metadata: Campos do JSON (ex.: arquivo, escala).
+        """
+        self._metadata[hashlib.sha256(content).hexdigest()] = metadata
+
+    def batch_annotate_images(self, request=None, *, requests=None, **kwargs):
+        requests = requests if requests is not None else request.requests
+        response = self.client.batch_annotate_images(
+            requests=requests, **kwargs
+        )
+        for image_request, image_response in zip(requests, response.responses):
+            if image_response.error.message:
+                continue
+            digest = hashlib.sha256(image_request.image.content).hexdigest()
+            with open(self.fixtures_dir / f"{digest}.json", "w",
+                      encoding="utf-8") as f:
+                json.dump({
+                    **self._metadata.get(digest, {}),
+                    "resposta": json.loads(
+                        vision.AnnotateImageResponse.to_json(image_response)
+                    ),
+                }, f, ensure_ascii=False, indent=2)
+        return response
@@ -0,0 +1,229 @@
+"""
+Agendamento das chamadas ao Google Vision dentro da cota do projeto.
+
+ScheduledVisionClient envolve o cliente do Vision (ou um fake) mantendo a
+mesma interface de batch_annotate_images, e acrescenta:
+
+- limite de taxa por token bucket (imagens por segundo da cota);
+- novas tentativas com backoff exponencial e jitter para erros
+  transitórios, tanto da chamada (429, 503, prazo) quanto de imagens
+  individuais do lote;
+- concorrência adaptativa (AIMD): o número de chamadas simultâneas sobe
+  de um em um enquanto tudo dá certo e cai pela metade a cada throttling.
+
+Assim vários threads (ex.: o CLI com --workers) compartilham o mesmo
+cliente sem provocar rajadas de 429.
+"""
+import random
+import threading
+import time
+
+import telemetry
+from utils import RESOURCE_EXHAUSTED, RETRYABLE_CODES, VisionAPIError
+
+VISION_RETRIES = "validacao_vision_retentativas_total"
+VISION_THROTTLES = "validacao_vision_throttling_total"
+
+# cota padrão do Vision: 1800 imagens por minuto por projeto
+DEFAULT_RATE = 1800 / 60.0
+
+
+class TokenBucket:
+    """Limite de taxa: `rate` tokens por segundo, acumulando até `burst`."""
+
+    def __init__(self, rate: float, burst: float = None, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """Bloqueia até haver `tokens` disponíveis e os consome."""
+        # lotes maiores que o burst esperam o bucket encher por completo
+        tokens = min(float(tokens), self.burst)
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    Limite de chamadas simultâneas ajustado por AIMD.
+
+    Cada sucesso soma 1/limite (ou seja, +1 por "janela" de chamadas bem
+    sucedidas); cada throttling multiplica o limite por `decrease`.
+    """
+
+    def __init__(self, initial: float = 4, minimum: float = 1,
+                 maximum: float = 32, decrease: float = 0.5):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.decrease = decrease
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+    def on_throttle(self):
+        with self._condition:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+
+
+def _is_throttle(error) -> bool:
+    from google.api_core import exceptions
+
+    return isinstance(
+        error, (exceptions.TooManyRequests, exceptions.ResourceExhausted)
+    )
+
+
+def _is_retryable(error) -> bool:
+    from google.api_core import exceptions
+
+    return isinstance(error, (
+        exceptions.TooManyRequests,
+        exceptions.ResourceExhausted,
+        exceptions.ServiceUnavailable,
+        exceptions.DeadlineExceeded,
+        exceptions.InternalServerError,
+        exceptions.Aborted,
+    ))
+
+
+class ScheduledVisionClient:
+    """
+    Cliente do Vision com limite de taxa, novas tentativas e AIMD.
+
+    Exemplo:
+        client = ScheduledVisionClient(vision.ImageAnnotatorClient(),
+                                       rate=30)
+        batch_annotate(client, imagens)
+    """
+
+    def __init__(self, client, rate: float = DEFAULT_RATE, burst: float = None,
+                 max_retries: int = 5, base_delay: float = 0.5,
+                 max_delay: float = 30.0, limiter: AdaptiveLimiter = None,
+                 sleep=time.sleep, rng: random.Random = None):
+        """
+        Args:
+            client: ImageAnnotatorClient (ou um fake compatível).
+            rate (float): Imagens por segundo permitidas pela cota.
+            burst (float): Imagens que podem sair de uma vez (padrão: rate).
+            max_retries (int): Novas tentativas por chamada.
+            base_delay (float): Espera base do backoff, em segundos.
+            max_delay (float): Espera máxima entre tentativas.
+            limiter (AdaptiveLimiter): Controle de concorrência
+                (padrão: um novo AdaptiveLimiter).
+            sleep: Função de espera (substituível em testes).
+            rng (random.Random): Gerador do jitter.
+        """
+        self.client = client
+        self.bucket = TokenBucket(rate, burst, sleep=sleep)
+        self.limiter = limiter or AdaptiveLimiter()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+
+    def _backoff(self, attempt: int):
+        """Backoff exponencial com jitter completo."""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        self._sleep(self._rng.uniform(0, ceiling))
+
+    def _call(self, requests, **kwargs):
+        """Uma chamada respeitando taxa e concorrência."""
+        self.bucket.acquire(len(requests))
+        self.limiter.acquire()
+        try:
+            return self.client.batch_annotate_images(
+                requests=requests, **kwargs
+            )
+        finally:
+            self.limiter.release()
+
+    def batch_annotate_images(self, request=None, *, requests=None, **kwargs):
+        """
+        Anota o lote, repetindo só as imagens com erro transitório.
+
+        Erros transitórios da chamada inteira são repetidos até
+        max_retries; esgotadas as tentativas levantam VisionAPIError.
+        Imagens que continuam com erro voltam com o erro na resposta.
+        """
+        from google.cloud import vision
+
+        requests = list(requests if requests is not None else request.requests)
+        responses = [None] * len(requests)
+        pending = list(range(len(requests)))
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                batch = self._call([requests[i] for i in pending], **kwargs)
+            except Exception as e:
+                if not _is_retryable(e):
+                    raise
+                throttled = _is_throttle(e)
+                if throttled:
+                    self.limiter.on_throttle()
+                    telemetry.inc(VISION_THROTTLES)
+                if attempt == self.max_retries:
+                    # cota esgotada continua RESOURCE_EXHAUSTED (429 não
+                    # traz código gRPC); 14 só para os demais transitórios
+                    status = getattr(e, "grpc_status_code", None)
+                    if throttled:
+                        code = RESOURCE_EXHAUSTED
+                    else:
+                        code = status.value[0] if status else 14
+                    raise VisionAPIError(str(e), code) from e
+                telemetry.inc(VISION_RETRIES, motivo=type(e).__name__)
+                self._backoff(attempt)
+                continue
+
+            retry, throttled = [], False
+            for i, response in zip(pending, batch.responses):
+                responses[i] = response
+                if response.error.code in RETRYABLE_CODES:
+                    retry.append(i)
+                    throttled |= response.error.code == RESOURCE_EXHAUSTED
+
+            if throttled:
+                self.limiter.on_throttle()
+                telemetry.inc(VISION_THROTTLES)
+            else:
+                self.limiter.on_success()
+
+            pending = retry
+            if not pending or attempt == self.max_retries:
+                break
+            telemetry.inc(VISION_RETRIES, len(pending), motivo="imagem")
+            self._backoff(attempt)
+
+        return vision.BatchAnnotateImagesResponse(responses=responses)